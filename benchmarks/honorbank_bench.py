@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.honorbank import HonorBank, JsonStorage, SqliteStorage, import_json
+
+
+"""
+Benchmarks HonorBank operations against synthetic honor.json files.
+
+Usage (from the repository root):
+    python benchmarks/honorbank_bench.py
+    python benchmarks/honorbank_bench.py --sizes 1000 10000 --threads 1 8 --backends json sqlite --output results.json
+
+Each run generates a fresh honor.json per size, then times every operation
+single-threaded and with each requested thread count. Results are written as JSON
+so separate runs can be compared.
+"""
+
+
+OPERATIONS = ["create_account", "get_funds", "pay", "charge", "mixed"]
+
+
+def generate_accounts(path, count, seed=0):
+    """
+    Writes a synthetic honor.json file
+    :param path: path of the file to write
+    :param count: number of accounts
+    :return: list of the generated account names
+    """
+
+    rng = random.Random(seed)
+    accounts = {"user{:07d}".format(x): rng.randint(0, 100000) for x in range(count)}
+
+    with open(path, "w") as f:
+        json.dump(accounts, f)
+    return list(accounts.keys())
+
+
+def open_bank(backend, directory):
+    if backend == "json":
+        return HonorBank(JsonStorage(os.path.join(directory, "honor.json")))
+
+    db_path = os.path.join(directory, "honor.db")
+    if not os.path.exists(db_path):
+        import_json(os.path.join(directory, "honor.json"), db_path)
+    return HonorBank(SqliteStorage(db_path))
+
+
+def make_worker(bank, operation, names, ops, worker_id, latencies):
+    """
+    Builds a thread target that performs ops calls of operation and appends each latency in ns to latencies
+    """
+
+    rng = random.Random(worker_id)
+    clock = time.perf_counter_ns
+
+    def create_account(x):
+        bank.create_account("bench{}_{}".format(worker_id, x))
+
+    def get_funds(x):
+        bank.get_funds(rng.choice(names))
+
+    def pay(x):
+        bank.pay(rng.choice(names), 10)
+
+    def charge(x):
+        bank.charge(rng.choice(names), 10)
+
+    def mixed(x):
+        # Roughly what the plugins do: mostly balance checks, some payments and a few transfers
+        roll = rng.random()
+        if roll < 0.6:
+            bank.get_funds(rng.choice(names))
+        elif roll < 0.8:
+            bank.pay(rng.choice(names), 10)
+        elif roll < 0.95:
+            bank.charge(rng.choice(names), 10)
+        else:
+            bank.transfer(rng.choice(names), rng.choice(names), 10)
+
+    call = {"create_account": create_account, "get_funds": get_funds, "pay": pay,
+            "charge": charge, "mixed": mixed}[operation]
+
+    def work():
+        local = []
+        for x in range(ops):
+            start = clock()
+            call(x)
+            local.append(clock() - start)
+        latencies.extend(local)
+
+    return work
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_case(backend, directory, names, operation, threads, ops):
+    """
+    Times a single operation with the given number of threads on a freshly opened bank
+    :return: dict of results
+    """
+
+    bank = open_bank(backend, directory)
+    latencies = []
+    workers = [threading.Thread(target=make_worker(bank, operation, names, ops, worker_id, latencies))
+               for worker_id in range(threads)]
+
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    bank.close()
+
+    latencies.sort()
+    total = len(latencies)
+    return {
+        "backend": backend,
+        "accounts": len(names),
+        "operation": operation,
+        "threads": threads,
+        "ops": total,
+        "seconds": round(elapsed, 6),
+        "ops_per_sec": round(total / elapsed, 1) if elapsed > 0 else None,
+        "p50_us": round(percentile(latencies, 0.50) / 1000, 2),
+        "p99_us": round(percentile(latencies, 0.99) / 1000, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks HonorBank operations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--backends", nargs="+", choices=["json", "sqlite"], default=["json", "sqlite"])
+    parser.add_argument("--operations", nargs="+", choices=OPERATIONS, default=OPERATIONS)
+    parser.add_argument("--ops", type=int, default=5000, help="operations per thread")
+    parser.add_argument("--output", default="honorbank_bench.json")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for backend in args.backends:
+            for operation in args.operations:
+                for threads in args.threads:
+                    # Every case starts from the same untouched file
+                    directory = tempfile.mkdtemp(prefix="honorbench")
+                    try:
+                        names = generate_accounts(os.path.join(directory, "honor.json"), size)
+                        result = run_case(backend, directory, names, operation, threads, args.ops)
+                    finally:
+                        shutil.rmtree(directory, ignore_errors=True)
+
+                    results.append(result)
+                    print("{backend:6} {accounts:>7} {operation:15} threads={threads:<3} "
+                          "{ops_per_sec:>10} ops/s  p50={p50_us}us  p99={p99_us}us".format(**result))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ops_per_thread": args.ops,
+        "results": results,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Wrote results to " + args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import copy
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.catchemall import Pokemon
+
+
+"""
+Checks that Pokemon.force_level, which samples many level ups in one step, gives stats from the
+same distribution as rolling every level up in turn, and times the two.
+
+Usage (from the repository root, with the bot's plugin module importable):
+    python benchmarks/level_distribution_check.py
+    python benchmarks/level_distribution_check.py --samples 5000 --levels 15 50 99 --output results.json
+
+For each case, a pokemon is levelled many times both ways from the same starting stats.
+The check compares the mean and standard deviation of each stat and of CP, and runs a two
+sample Kolmogorov-Smirnov test on them. It exits with status 1 if any test rejects at --alpha.
+"""
+
+
+STATS = ["attack", "defence", "max_hp", "speed", "cp"]
+# (species, base attack, defence, hp, special attack, special defence, speed, growth mod)
+CASES = [
+    ("Magikarp", 10, 55, 20, 15, 20, 80, 0),
+    ("Pikachu", 55, 40, 35, 50, 50, 90, 1),
+    ("Snorlax", 110, 65, 160, 65, 110, 30, 2),
+    ("Mewtwo", 110, 90, 106, 154, 90, 130, 3),
+]
+
+
+def roll_levels(poke, levels):
+    """
+    Levels poke up the way Pokemon.update_stats did before it had a fast path, one level at a time
+    """
+
+    for x in range(levels):
+        poke.attack += int(random.randint(1,4) + (poke.attack * poke.cp_multi)) + poke.attack_growth_mod
+        poke.defence += int(random.randint(1,4) + (poke.defence * poke.cp_multi)) + poke.defence_growth_mod
+        poke.max_hp += int(random.randint(2,5) + (poke.max_hp * poke.cp_multi)) + poke.hp_growth_mod
+        poke.speed += int(random.randint(1,3) + (poke.speed * poke.cp_multi)) + poke.speed_growth_mod
+        poke.level += 1
+        poke.calculate_cp()
+
+
+def ks_statistic(first, second):
+    """
+    :return: the largest gap between the empirical distribution functions of two samples
+    """
+
+    first = sorted(first)
+    second = sorted(second)
+    i = j = 0
+    gap = 0.0
+    while i < len(first) and j < len(second):
+        value = min(first[i], second[j])
+        while i < len(first) and first[i] == value:
+            i += 1
+        while j < len(second) and second[j] == value:
+            j += 1
+        gap = max(gap, abs(i / len(first) - j / len(second)))
+    return gap
+
+
+def ks_critical(count, alpha):
+    """
+    :return: the statistic above which two samples of count values are unlikely, at alpha, to share a distribution
+    """
+
+    return math.sqrt(-math.log(alpha / 2) / 2) * math.sqrt(2 / count)
+
+
+def run_case(case, levels, samples, alpha):
+    name, base_atk, base_def, base_hp, base_spc_atk, base_spc_def, base_spe, growth = case
+    base = Pokemon(name, base_atk, base_def, base_hp, base_spc_atk, base_spc_def, base_spe)
+    base.attack_growth_mod = base.defence_growth_mod = base.hp_growth_mod = base.speed_growth_mod = growth
+
+    looped = []
+    start = time.perf_counter()
+    for x in range(samples):
+        poke = copy.copy(base)
+        roll_levels(poke, levels)
+        looped.append(poke)
+    loop_seconds = time.perf_counter() - start
+
+    sampled = []
+    start = time.perf_counter()
+    for x in range(samples):
+        poke = copy.copy(base)
+        poke.force_level(levels)
+        sampled.append(poke)
+    fast_seconds = time.perf_counter() - start
+
+    critical = ks_critical(samples, alpha)
+    stats = {}
+    for stat in STATS:
+        loop_values = [getattr(poke, stat) for poke in looped]
+        fast_values = [getattr(poke, stat) for poke in sampled]
+        statistic = ks_statistic(loop_values, fast_values)
+        stats[stat] = {
+            "loop_mean": round(statistics.mean(loop_values), 2),
+            "fast_mean": round(statistics.mean(fast_values), 2),
+            "loop_sd": round(statistics.stdev(loop_values), 2),
+            "fast_sd": round(statistics.stdev(fast_values), 2),
+            "ks": round(statistic, 4),
+            "passed": statistic <= critical,
+        }
+
+    return {
+        "pokemon": name,
+        "growth_mod": growth,
+        "levels": levels,
+        "samples": samples,
+        "ks_critical": round(critical, 4),
+        "loop_us": round(loop_seconds / samples * 10 ** 6, 1),
+        "fast_us": round(fast_seconds / samples * 10 ** 6, 1),
+        "passed": all(result["passed"] for result in stats.values()),
+        "stats": stats,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks sampled level ups against rolling every level")
+    parser.add_argument("--levels", type=int, nargs="+", default=[20, 27, 50, 99, 200])
+    parser.add_argument("--samples", type=int, default=3000)
+    parser.add_argument("--alpha", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="level_distribution_check.json")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = []
+    for levels in args.levels:
+        for case in CASES:
+            result = run_case(case, levels, args.samples, args.alpha)
+            results.append(result)
+            worst = max(result["stats"], key=lambda stat: result["stats"][stat]["ks"])
+            print("{pokemon:9} +{growth_mod} {levels:>4} levels  loop={loop_us}us  fast={fast_us}us  "
+                  "worst ks={ks} ({stat}, limit {ks_critical})  {verdict}".format(
+                      stat=worst, ks=result["stats"][worst]["ks"],
+                      verdict="ok" if result["passed"] else "MISMATCH", **result))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Wrote results to " + args.output)
+
+    if not all(result["passed"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
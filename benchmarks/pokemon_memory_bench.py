@@ -0,0 +1,123 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.records import RecordList
+from plugins.catchemall import POKEMON_SCHEMA, Pokemon
+
+
+"""
+Measures the memory held by banks of pokemon in the slotted Pokemon layout and in the
+per-instance __dict__ layout Pokemon used before.
+
+Usage (from the repository root, with the bot's plugin module importable):
+    python benchmarks/pokemon_memory_bench.py
+    python benchmarks/pokemon_memory_bench.py --sizes 10000 100000 --output results.json
+
+Banks are loaded from records, the way PokeBank loads them, then copied into the old layout.
+Memory is the growth in traced allocations while the bank is alive.
+"""
+
+
+LAYOUTS = ["dict", "slots"]
+
+
+class DictPokemon:
+    """
+    Pokemon as it was before __slots__: the same attributes, kept in an instance dict
+    """
+
+    def __init__(self, poke):
+        # Filled the way unpickling fills an object, which gives it a dict of its own
+        self.__dict__.update((name, getattr(poke, name)) for name in Pokemon.__slots__)
+
+
+def generate_records(count, users, rng):
+    """
+    :return: list of encoded pokemon lists, one per user, holding count pokemon between them
+    """
+
+    codec = RecordList(POKEMON_SCHEMA)
+    banks = [[] for x in range(users)]
+    for x in range(count):
+        poke = Pokemon("Mon{}".format(rng.randint(1, 800)), *[rng.randint(5, 150) for y in range(6)])
+        poke.force_level(rng.randint(0, 30))
+        banks[x % users].append(poke)
+    return [codec.encode(bank) for bank in banks]
+
+
+def measure(layout, records):
+    codec = RecordList(POKEMON_SCHEMA)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    bank = [codec.decode(record) for record in records]
+    if layout == "dict":
+        bank = [[DictPokemon(poke) for poke in mons] for mons in bank]
+
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = sum(len(mons) for mons in bank)
+    return {
+        "layout": layout,
+        "pokemon": count,
+        "users": len(bank),
+        "bytes": current,
+        "bytes_per_pokemon": round(current / count, 1),
+        "load_seconds": round(elapsed, 4),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the memory used by banks of pokemon")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 300000])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=LAYOUTS)
+    parser.add_argument("--output", default="pokemon_memory_bench.json")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        records = generate_records(size, args.users, random.Random(size))
+        for layout in args.layouts:
+            result = measure(layout, records)
+            results.append(result)
+            print("{layout:6} {pokemon:>7} pokemon  {bytes:>11} bytes  {bytes_per_pokemon:>7} bytes/pokemon  "
+                  "load={load_seconds}s".format(**result))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Wrote results to " + args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.records import RecordList
+from plugins.catchemall import POKEMON_SCHEMA, Pokemon
+
+
+"""
+Checks that pokemon survive being written to and read back from records, including pokemon
+whose stats have grown past what fits in 64 bits, and that records written by the previous
+version of POKEMON_SCHEMA still load.
+
+Usage (from the repository root, with the bot's plugin module importable):
+    python benchmarks/records_roundtrip_check.py
+    python benchmarks/records_roundtrip_check.py --count 5000 --seed 1
+
+Exits with status 1 if any pokemon comes back different.
+"""
+
+
+def generate_pokemon(count, rng):
+    mons = []
+    for x in range(count):
+        poke = Pokemon("Mon{}".format(rng.randint(1, 800)), *[rng.randint(5, 150) for y in range(6)])
+        poke.force_level(rng.randint(0, 100))
+        mons.append(poke)
+
+    # Far past a signed 64 bit integer, as an admin grant of thousands of levels gives
+    huge = Pokemon("Mewtwo", 110, 90, 106, 154, 90, 130)
+    huge.force_level(4500)
+    mons.append(huge)
+    giant = Pokemon("Snorlax", 110, 65, 160, 65, 110, 30)
+    for name in ("attack", "defence", "max_hp", "speed", "current_hp", "level", "xp", "cp"):
+        setattr(giant, name, rng.randint(2 ** 64, 2 ** 200))
+    mons.append(giant)
+    return mons
+
+
+def state(poke):
+    return {name: getattr(poke, name) for name in Pokemon.__slots__ if hasattr(poke, name)}
+
+
+def compare(label, originals, loaded):
+    failures = 0
+    if len(originals) != len(loaded):
+        print("{}: wrote {} pokemon but read {}".format(label, len(originals), len(loaded)))
+        return 1
+    for original, copy in zip(originals, loaded):
+        if state(original) != state(copy):
+            failures += 1
+            print("{}: {} came back as {}".format(label, state(original), state(copy)))
+    print("{}: {} pokemon, {} mismatched".format(label, len(originals), failures))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round trips pokemon through records")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    mons = generate_pokemon(args.count, random.Random(args.seed))
+    codec = RecordList(POKEMON_SCHEMA)
+    failures = compare("record list", mons, codec.decode(codec.encode(mons)))
+    failures += compare("single records", mons, [POKEMON_SCHEMA.decode(POKEMON_SCHEMA.encode(poke)) for poke in mons])
+
+    # Version 1 holds 64 bit integers, so only pokemon that fit can be written in it
+    small = [poke for poke in mons if max(poke.attack, poke.defence, poke.max_hp, poke.speed, poke.cp) < 2 ** 63]
+    failures += compare("version 1 records", small, codec.decode(codec.encode(small, version=1)))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import pickle
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from libs.kvstore import KVStore
+from libs.records import RecordList
+from plugins.catchemall import POKEMON_SCHEMA, Pokemon
+from plugins.hostiletakeover import COMPANY_SCHEMA, Company, Policy
+from plugins.pocketpal import PAL_SCHEMA, Food, Game, Pal
+
+
+"""
+Compares the size and load time of plugin state stored as pickles and as records (libs/records.py).
+
+Usage (from the repository root, with the bot's plugin module importable):
+    python benchmarks/serialization_bench.py
+    python benchmarks/serialization_bench.py --sizes 100 1000 --datasets pokebank --output results.json
+
+Each dataset is stored three ways:
+    pickle_file  the single pickle file the plugins used to write
+    kv_pickle    one pickled value per key in the KVStore
+    kv_records   one record per key in the KVStore
+For each, the benchmark reports the bytes stored, the time to load everything,
+and the time to load a single key, which is all a lazy reader pays for.
+"""
+
+
+DATASETS = ["pokebank", "pocketpal", "companies"]
+FORMATS = ["pickle_file", "kv_pickle", "kv_records"]
+
+
+def generate_pokebank(count, rng):
+    """
+    :return: dict of count users to a list of between 1 and 60 pokemon
+    """
+
+    bank = {}
+    for x in range(count):
+        mons = []
+        for y in range(rng.randint(1, 60)):
+            poke = Pokemon("Mon{}".format(rng.randint(1, 800)), *[rng.randint(5, 150) for z in range(6)])
+            poke.force_level(rng.randint(0, 30))
+            mons.append(poke)
+        bank["user{:07d}".format(x)] = mons
+    return bank
+
+
+def generate_pals(count, rng):
+    pals = {}
+    for x in range(count):
+        # Pal.__init__ picks a species from the plugin's asset directory
+        pal = Pal.__new__(Pal)
+        pal.name = "pal{}".format(x)
+        pal.age = rng.randint(0, 500)
+        pal.health = rng.randint(0, 100)
+        pal.mood = rng.randint(0, 4)
+        pal.hunger = rng.randint(0, 100)
+        pal.clean = rng.randint(0, 100)
+        pal.growth = rng.randint(0, 3)
+        pal.alive = True
+        pal.species = rng.choice(["cat", "dog", "slime"])
+        pal.craving = rng.choice(list(Food))
+        pal.desire = rng.choice(list(Game))
+        pal.received_attention = False
+        pal.dir = "data/pocketpal"
+        pal.status_image = pal.dir + "/assets/{}/tame.png".format(pal.species)
+        pals["user{:07d}".format(x)] = pal
+    return pals
+
+
+def generate_companies(count, rng):
+    companies = {}
+    for x in range(count):
+        company = Company("company{}".format(x), "user{:07d}".format(x))
+        company.value = rng.randint(0, 10 ** 6)
+        company.profits = company.value / 5
+        company.tier = rng.randint(0, 9)
+        for y in range(rng.randint(0, 5)):
+            company.shares["user{:07d}".format(rng.randint(0, count))] = rng.randint(1, 20)
+        for y in range(rng.randint(0, 3)):
+            company.policies.append(Policy("policy{}".format(y), "You spend more on ads.", 0.4, -0.3,
+                                           ["positive reaction", "hyped customers", ""]))
+        companies[company.name] = company
+    return companies
+
+
+GENERATORS = {"pokebank": generate_pokebank, "pocketpal": generate_pals, "companies": generate_companies}
+CODECS = {"pokebank": RecordList(POKEMON_SCHEMA), "pocketpal": PAL_SCHEMA, "companies": COMPANY_SCHEMA}
+
+
+def run_case(dataset, data, fmt, directory):
+    """
+    Stores data in one format, then times loading all of it and loading one key
+    :return: dict of results
+    """
+
+    key = next(iter(data))
+    clock = time.perf_counter
+
+    if fmt == "pickle_file":
+        path = os.path.join(directory, dataset + ".file")
+        with open(path, "wb") as f:
+            pickle.dump(data, f)
+        size = os.path.getsize(path)
+
+        start = clock()
+        with open(path, "rb") as f:
+            pickle.load(f)
+        load_all = clock() - start
+
+        # A single pickle can only be read whole
+        load_one = load_all
+    else:
+        store = KVStore(os.path.join(directory, dataset + ".db"))
+        namespace = store.namespace(dataset, CODECS[dataset] if fmt == "kv_records" else None)
+        namespace.put_many(data.items())
+        size = store.connection().execute("SELECT SUM(LENGTH(value)) FROM records").fetchone()[0]
+
+        start = clock()
+        namespace.items()
+        load_all = clock() - start
+
+        start = clock()
+        namespace.get(key)
+        load_one = clock() - start
+        store.close()
+
+    return {
+        "dataset": dataset,
+        "keys": len(data),
+        "format": fmt,
+        "bytes": size,
+        "load_all_ms": round(load_all * 1000, 3),
+        "load_one_us": round(load_one * 10 ** 6, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares pickle and record storage of plugin state")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--datasets", nargs="+", choices=DATASETS, default=DATASETS)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--output", default="serialization_bench.json")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for dataset in args.datasets:
+            data = GENERATORS[dataset](size, random.Random(size))
+            for fmt in args.formats:
+                directory = tempfile.mkdtemp(prefix="serialbench")
+                try:
+                    result = run_case(dataset, data, fmt, directory)
+                finally:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+                results.append(result)
+                print("{dataset:10} {keys:>6} {format:12} {bytes:>11} bytes  "
+                      "all={load_all_ms}ms  one={load_one_us}us".format(**result))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Wrote results to " + args.output)
+
+
+if __name__ == "__main__":
+    main()
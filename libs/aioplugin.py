@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import traceback
+
+from libs.outbox import shared_outbox
+from plugin import Plugin
+
+
+"""
+Plugins may implement 'async def on_command(self, command)' instead of a synchronous on_command.
+An async handler awaits its I/O on the shared event loop, so any number of slow requests can be
+in flight at once without tying up the thread that dispatched the command.
+
+AsyncPluginBridge lets the synchronous bot load such a plugin: the command is handed to the loop
+and the reply is sent through the outbox once it is ready. Hosts that dispatch on an event loop
+use dispatch(), which awaits async plugins directly and runs synchronous ones in an executor.
+"""
+
+
+# The event loop shared by every async plugin within this process
+_shared_loop = None
+_shared_lock = threading.Lock()
+
+
+def shared_loop():
+    """
+    Returns the process-wide event loop, starting it on a daemon thread on first use.
+    :return: the running asyncio event loop
+    """
+
+    global _shared_loop
+
+    with _shared_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            thread = threading.Thread(target = _shared_loop.run_forever)
+            thread.daemon = True
+            thread.start()
+        return _shared_loop
+
+
+def submit(coroutine):
+    """
+    Schedules a coroutine on the shared event loop from any thread
+    :return: a concurrent.futures.Future for its result
+    """
+
+    return asyncio.run_coroutine_threadsafe(coroutine, shared_loop())
+
+
+def is_async(plugin):
+    return asyncio.iscoroutinefunction(getattr(plugin, "on_command", None))
+
+
+class SyncPluginAdapter:
+    """
+    Presents a synchronous plugin through the async protocol by running its handler in the loop's executor
+    """
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    def __getattr__(self, name):
+        return getattr(self.plugin, name)
+
+    async def on_command(self, command):
+        return await asyncio.get_running_loop().run_in_executor(None, self.plugin.on_command, command)
+
+
+class AsyncPluginBridge(Plugin):
+    """
+    Presents an async plugin to the synchronous bot.
+    on_command returns immediately; the handler runs on the shared loop and its reply is queued in the outbox.
+    Every other hook the bot calls is forwarded to the wrapped plugin as it is. They have to be defined here,
+    since the Plugin base class provides defaults that __getattr__ would never get the chance to override.
+    """
+
+    def __init__(self, plugin, bot):
+        self.plugin = plugin
+        self.outbox = shared_outbox(bot)
+
+    def __getattr__(self, name):
+        return getattr(self.plugin, name)
+
+    def on_command(self, command):
+        submit(self.deliver(command))
+
+    async def deliver(self, command):
+        try:
+            response = await self.plugin.on_command(command)
+        except Exception:
+            print("{}: Unable to handle /{}!".format(self.plugin.get_name(), command.command))
+            traceback.print_exc()
+            return
+
+        if response is None:
+            return
+        if response.get("type") == "message":
+            self.outbox.send(command.chat.id, response["message"])
+        else:
+            print("{}: Cannot deliver a '{}' response from an async handler!".format(self.plugin.get_name(),
+                                                                                     response.get("type")))
+
+    def get_commands(self):
+        return self.plugin.get_commands()
+
+    def get_name(self):
+        return self.plugin.get_name()
+
+    def get_help(self):
+        return self.plugin.get_help()
+
+    def on_message(self, message):
+        return self.plugin.on_message(message)
+
+    def has_message_access(self):
+        return self.plugin.has_message_access()
+
+    def enable(self):
+        return self.plugin.enable()
+
+    def disable(self):
+        return self.plugin.disable()
+
+
+def as_async(plugin):
+    """
+    :return: an object whose on_command is a coroutine function, for hosts that dispatch on an event loop
+    """
+
+    if isinstance(plugin, AsyncPluginBridge):
+        return plugin.plugin
+    if is_async(plugin):
+        return plugin
+    return SyncPluginAdapter(plugin)
+
+
+async def dispatch(plugin, command):
+    """
+    Runs any plugin's command handler without blocking the event loop
+    :return: the plugin's response
+    """
+
+    return await as_async(plugin).on_command(command)
@@ -0,0 +1,109 @@
+import atexit
+import os
+import tempfile
+import threading
+
+from libs.scheduler import shared_scheduler
+
+
+def atomic_write(path, data):
+    """
+    Replaces the file at path with data so that a crash leaves either the old or the new contents, never a mix.
+    The data goes to a temporary file in the same directory, is flushed to disk, then renamed over path.
+    :param path: file to write
+    :param data: str or bytes to write
+    """
+
+    temp_path = write_temp(path, data)
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        discard(temp_path)
+        raise
+    sync_directory(path)
+
+
+def write_temp(path, data):
+    """
+    Writes data to a new temporary file beside path and flushes it to disk.
+    Callers that need to control when the file takes path's place rename it themselves,
+    then call sync_directory.
+    :return: path of the temporary file
+    """
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=os.path.basename(path) + ".", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        discard(temp_path)
+        raise
+    return temp_path
+
+
+def discard(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+
+def sync_directory(path):
+    """
+    Makes a rename into path's directory durable; not every platform can open a directory
+    """
+
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class Debouncer:
+    """
+    Collapses save requests made within delay seconds of the first into a single call.
+    Requests carry a key (such as a user name); function is called with the set of keys
+    requested since it last ran. Anything still pending is saved when the process exits.
+    """
+
+    def __init__(self, function, delay=1.0):
+        self.function = function
+        self.delay = delay
+        self.keys = set()
+        self.job = None
+        self.lock = threading.Lock()
+        # Serializes calls of function so an older write can never land after a newer one
+        self.run_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def request(self, key=None):
+        with self.lock:
+            self.keys.add(key)
+            if self.job is None:
+                self.job = shared_scheduler().once(self.delay, self.flush)
+
+    def flush(self):
+        """
+        Runs function for every pending key now
+        """
+
+        with self.run_lock:
+            with self.lock:
+                if self.job is not None:
+                    self.job.cancel()
+                    self.job = None
+                keys = self.keys
+                self.keys = set()
+
+            if keys:
+                self.function(keys)
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+"""
+Vectorized Catch em' All battles.
+
+simulate_odds plays many independent battles between the same two parties at once, with one
+NumPy operation per turn across every battle still running. It follows the turn rules of
+catchemall.Battle.simulate_battle (speed decides who attacks first in each matchup, then
+attacks alternate; dodges, counters, crits and damage rolls are drawn the same way) but keeps
+no log and grants no xp, so stats stay as they were when the battle began. Both parties start
+at full health, as they do when a battle is accepted.
+
+Stats are held in int64 arrays. Parties whose stats or hits could outgrow them make
+simulate_odds raise OverflowError, so callers can fall back to playing catchemall.Battle.
+"""
+
+
+# Largest stat or single hit the int64 arrays are trusted with, leaving room for the 3x damage roll and 2x crit
+STAT_LIMIT = 2 ** 56
+
+
+def check_limits(*parties):
+    """
+    Raises OverflowError if any stat, or the largest hit any pokemon could deal, is beyond STAT_LIMIT
+    :param parties: lists of Pokemon that will battle each other
+    """
+
+    pokes = [poke for party in parties for poke in party]
+    largest = max(max(poke.attack, poke.speed, poke.level, poke.max_hp) for poke in pokes)
+    if largest > STAT_LIMIT:
+        raise OverflowError("stat of {} is too large to simulate".format(largest))
+
+    # Bounds Battle.calculate_damage by pairing the highest level and attack with the lowest attack
+    level = max(poke.level for poke in pokes)
+    ratio = max(poke.attack for poke in pokes) / min(poke.attack for poke in pokes)
+    if ((2 * level / 5 + 2) * 100 * ratio / 50 + 2) * 6 > STAT_LIMIT:
+        raise OverflowError("damage is too large to simulate")
+
+
+def party_arrays(party):
+    """
+    :param party: list of Pokemon
+    :return: dict of int64 arrays holding each pokemon's battle stats, in party order
+    """
+
+    return {
+        "attack": np.array([poke.attack for poke in party], dtype=np.int64),
+        "speed": np.array([poke.speed for poke in party], dtype=np.int64),
+        "level": np.array([poke.level for poke in party], dtype=np.int64),
+        "max_hp": np.array([poke.max_hp for poke in party], dtype=np.int64),
+    }
+
+
+def base_damage(level, attack, receiver_attack):
+    """
+    Battle.calculate_damage before its random 2x or 3x scalar
+    """
+
+    return np.floor((((2 * level) / 5 + 2) * 100 * (attack / receiver_attack)) / 50).astype(np.int64) + 2
+
+
+def simulate_odds(challenger_party, opponent_party, runs=5000, rng=None):
+    """
+    :param challenger_party: list of Pokemon belonging to the trainer who attacks first on ties in speed
+    :param opponent_party: list of Pokemon
+    :param runs: number of battles to simulate
+    :param rng: numpy Generator, for repeatable results
+    :return: dict of the fraction of battles won by each side or drawn, and the mean number of turns
+    :raises OverflowError: if the parties' stats are too large for int64 arrays
+    """
+
+    check_limits(challenger_party, opponent_party)
+    rng = rng or np.random.default_rng()
+    c = party_arrays(challenger_party)
+    o = party_arrays(opponent_party)
+    c_size = len(challenger_party)
+    o_size = len(opponent_party)
+
+    # Hitpoints of every pokemon in every battle
+    c_hp = np.tile(c["max_hp"], (runs, 1))
+    o_hp = np.tile(o["max_hp"], (runs, 1))
+    # Index of the pokemon each side has out in every battle
+    c_index = np.zeros(runs, dtype=np.int64)
+    o_index = np.zeros(runs, dtype=np.int64)
+    turns = np.zeros(runs, dtype=np.int64)
+    # True where the challenger's pokemon attacks this turn
+    c_attacks = np.full(runs, c["speed"][0] >= o["speed"][0])
+
+    # Battles that are still running
+    live = np.arange(runs)
+    while live.size:
+        ci = c_index[live]
+        oi = o_index[live]
+        attacking = c_attacks[live]
+        count = live.size
+
+        c_atk = c["attack"][ci]
+        o_atk = o["attack"][oi]
+        attacker_atk = np.where(attacking, c_atk, o_atk)
+        defender_atk = np.where(attacking, o_atk, c_atk)
+        attacker_lvl = np.where(attacking, c["level"][ci], o["level"][oi])
+        defender_lvl = np.where(attacking, o["level"][oi], c["level"][ci])
+        defender_spe = np.where(attacking, o["speed"][oi], c["speed"][ci])
+
+        # Battle.check_dodge and Battle.check_counter
+        dodged = rng.integers(0, defender_spe // 3 + 1) >= rng.integers(0, attacker_atk + 1)
+        countered = dodged & (rng.integers(0, defender_atk // 3 + 1) >= rng.integers(0, attacker_atk + 1))
+
+        hit = base_damage(attacker_lvl, attacker_atk, defender_atk) * rng.integers(2, 4, count)
+        # Battle.check_crit
+        hit = np.where(rng.integers(0, 100, count) <= 2, hit * 2, hit)
+        counter = base_damage(defender_lvl, defender_atk, attacker_atk) * rng.integers(2, 4, count) // 2
+
+        attacker_loss = np.where(countered, counter, 0)
+        defender_loss = np.where(dodged, 0, hit)
+        c_hp[live, ci] -= np.where(attacking, attacker_loss, defender_loss)
+        o_hp[live, oi] -= np.where(attacking, defender_loss, attacker_loss)
+        turns[live] += 1
+        c_attacks[live] = ~attacking
+
+        # Fainted pokemon are replaced by the next in their party; if both faint, both are
+        c_down = c_hp[live, ci] <= 0
+        o_down = o_hp[live, oi] <= 0
+        c_index[live] += c_down
+        o_index[live] += o_down
+
+        running = (c_index[live] < c_size) & (o_index[live] < o_size)
+        matchup = live[(c_down | o_down) & running]
+        c_attacks[matchup] = c["speed"][c_index[matchup]] >= o["speed"][o_index[matchup]]
+        live = live[running]
+
+    c_out = c_index == c_size
+    o_out = o_index == o_size
+    return {
+        "runs": runs,
+        "challenger": float(np.mean(o_out & ~c_out)),
+        "opponent": float(np.mean(c_out & ~o_out)),
+        "draw": float(np.mean(c_out & o_out)),
+        "turns": float(np.mean(turns)),
+    }
@@ -1,97 +1,879 @@
-import json
-import os
-
-from plugin import Plugin
-
-
-def load(data_dir, bot):
-    return HonorBank(data_dir, bot)
-
-
-"""
-Created by Matthew Klawitter 12/11/2017
-Last Updated: 5/5/2017
-Version: v1.1.2.2
-"""
-
-
-class HonorBank:
-    def __init__(self):
-        self.dir = "honor.json"
-        self.honor_accounts = {}
-        self.load_accounts()
-
-    def create_account(self, name):
-        self.load_accounts()
-
-        if not self.account_exists(name):
-            self.honor_accounts[name] = 0
-            self.save_accounts()
-            return True
-        return False
-
-    def account_exists(self, name):
-        self.load_accounts()
-
-        if name in self.honor_accounts:
-            return True
-        return False
-
-    def remove_account(self, name):
-        self.load_accounts()
-
-        del self.honor_accounts[name]
-        self.save_accounts()
-
-    def save_accounts(self):
-        try:
-            with open(self.dir, "w+") as f:
-                json.dump(self.honor_accounts, f, sort_keys=True, indent=4)
-                f.seek(0)
-                f.close()
-        except FileNotFoundError:
-            print("HonorBank: Unable to find {}, creating a new file.").format(self.dir)
-
-            # Ensure that the account file is created.
-            file = open(self.dir, "r+")
-            file.seek(0)
-            file.close()
-
-            self.save_accounts()
-
-    def load_accounts(self):
-        try:
-            with open(self.dir, "r+") as f:
-                self.honor_accounts = json.load(f)
-                f.seek(0)
-                f.close()
-            return True
-        except FileNotFoundError:
-            print("HonorBank: Accounts failed to load!")
-            return False
-        except ValueError:
-            print("HonorBank: Cannot load an empty file!")
-            return False
-
-    def get_funds(self, name):
-        self.load_accounts()
-
-        return self.honor_accounts[name]
-
-    def pay(self, name, amount):
-        self.load_accounts()
-
-        if amount > 0:
-            self.honor_accounts[name] += amount
-            self.save_accounts()
-            return True
-        return False
-
-    def charge(self, name, amount):
-        self.load_accounts()
-
-        if self.honor_accounts[name] >= amount:
-            self.honor_accounts[name] -= amount
-            self.save_accounts()
-            return True
-        return False
+import atexit
+import json
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+
+from libs.atomicfile import atomic_write, discard, sync_directory, write_temp
+from libs.honorhistory import SqliteTransactionLog, TransactionLog
+from libs.locks import LockStripes, ReadWriteLock
+from libs.ranking import RankedSkipList
+from libs.scheduler import shared_scheduler
+
+"""
+Created by Matthew Klawitter 12/11/2017
+Last Updated: 5/5/2017
+Version: v1.4.0.0
+"""
+
+
+# The HonorBank shared by every plugin within this process
+_shared_bank = None
+_shared_lock = threading.Lock()
+
+
+def shared_bank():
+    """
+    Returns the process-wide HonorBank, creating it on first use.
+    Plugins should use this rather than constructing their own bank so that
+    every plugin reads and writes the same accounts.
+    Uses the SQLite database 'honor.db' if one exists, keeping the transaction history in it as well,
+    otherwise 'honor.json' with its history in 'honor.history'.
+    :return HonorBank: the shared bank
+    """
+
+    global _shared_bank
+
+    with _shared_lock:
+        if _shared_bank is None:
+            if os.path.exists("honor.db"):
+                # Several processes may share the database, which the file log cannot support
+                _shared_bank = HonorBank(SqliteStorage("honor.db"), SqliteTransactionLog("honor.db"))
+            else:
+                _shared_bank = HonorBank(JsonStorage("honor.json"), TransactionLog("honor.history"))
+        return _shared_bank
+
+
+class HonorBank:
+    """
+    The interface plugins use to read and move honor.
+    Balances are kept by a storage engine (JsonStorage or SqliteStorage);
+    both are safe to call from any number of threads.
+    Every successful change of a balance is recorded in the TransactionLog, if one is given,
+    along with the reason and the plugin it came from.
+
+    Once accrual is enabled, accounts earn a fixed amount of honor per period. Nothing runs on a
+    timer: what an account is owed is settled from its last accrual time whenever its balance is
+    read or changed through the bank. Leaderboards only reflect honor settled so far.
+    """
+
+    def __init__(self, storage=None, history=None):
+        self.storage = storage if storage is not None else JsonStorage("honor.json")
+        self.history = history
+        # (amount, period, cap) paid to every account, or None while accrual is disabled
+        self.accrual = None
+
+    def set_accrual(self, amount, period=3600, cap=None):
+        """
+        Starts paying every account amount honor per period seconds, settled lazily
+        :param amount: honor earned per full period
+        :param period: length of a period in seconds
+        :param cap: the most a single settlement pays, or None for no limit; periods beyond it are forfeited
+        """
+
+        self.accrual = (amount, period, cap)
+
+    def settle(self, *names):
+        """
+        Pays the named accounts whatever accrual they are owed since they were last settled
+        """
+
+        if self.accrual is None:
+            return
+
+        amount, period, cap = self.accrual
+        now = time.time()
+
+        for name in names:
+            paid = self.storage.accrue(name, amount, period, cap, now)
+            if paid and self.history is not None:
+                try:
+                    self.history.record(name, paid, "payday", "Payday")
+                except (OSError, sqlite3.Error):
+                    print("HonorBank: Unable to record transaction history!")
+
+    def create_account(self, name):
+        return self.storage.create(name)
+
+    def account_exists(self, name):
+        return self.storage.exists(name)
+
+    def remove_account(self, name):
+        self.storage.remove(name)
+
+    def account_names(self):
+        return self.storage.names()
+
+    def get_funds(self, name):
+        self.settle(name)
+        return self.storage.balance(name)
+
+    def pay(self, name, amount, reason="", source=""):
+        if amount > 0:
+            return self.apply_deltas({name: amount}, reason, source)
+        return False
+
+    def charge(self, name, amount, reason="", source=""):
+        return self.apply_deltas({name: -amount}, reason, source)
+
+    def transfer(self, from_name, to_name, amount, fee=0, reason="", source=""):
+        """
+        Atomically moves honor from one account to another.
+        The sender is charged the full amount and the receiver is paid the amount minus the fee.
+        :param from_name: account the honor is taken from
+        :param to_name: account the honor is given to
+        :param amount: honor taken from the sender, must be positive
+        :param fee: portion of the amount that is not passed on to the receiver
+        :return: True if the transfer happened, False if an account is missing, the sender lacks the funds
+                 or the amount/fee are invalid
+        """
+
+        if amount <= 0 or not 0 <= fee <= amount:
+            return False
+
+        deltas = {from_name: -amount}
+        deltas[to_name] = deltas.get(to_name, 0) + amount - fee
+        return self.apply_deltas(deltas, reason, source)
+
+    def pay_many(self, payments, reason="", source=""):
+        """
+        Pays several accounts at once. Either every payment is made or none are.
+        :param payments: dict of account name to a non-negative amount; zero amounts are skipped
+        :return: True if the payments were made, False if an account does not exist or an amount is negative
+        """
+
+        if any(amount < 0 for amount in payments.values()):
+            return False
+        return self.apply_deltas({name: amount for name, amount in payments.items() if amount > 0}, reason, source)
+
+    def charge_many(self, charges, reason="", source=""):
+        """
+        Charges several accounts at once. Either every account is charged or none are.
+        :param charges: dict of account name to a non-negative amount
+        :return: True if every account was charged, False if any account lacks the funds or does not exist
+        """
+
+        if any(amount < 0 for amount in charges.values()):
+            return False
+        return self.apply_deltas({name: -amount for name, amount in charges.items() if amount > 0}, reason, source)
+
+    def apply_deltas(self, deltas, reason, source):
+        """
+        Settles accrual of the involved accounts, then applies the deltas through the storage engine
+        and records them in the history
+        :return: True if the deltas were applied
+        """
+
+        self.settle(*deltas)
+        if not self.storage.apply(deltas):
+            return False
+
+        if self.history is not None:
+            try:
+                for name, delta in deltas.items():
+                    if delta != 0:
+                        self.history.record(name, delta, reason, source)
+            except (OSError, sqlite3.Error):
+                print("HonorBank: Unable to record transaction history!")
+        return True
+
+    def recent_transactions(self, name, count):
+        """
+        :param name: the account to look up
+        :param count: the maximum number of transactions to return
+        :return: list of the account's latest Transactions, newest first
+        """
+
+        if self.history is None:
+            return []
+        return self.history.recent(name, count)
+
+    def save_accounts(self):
+        self.storage.flush()
+
+    def load_accounts(self):
+        return self.storage.load()
+
+    def leaderboard(self, count):
+        """
+        :param count: the number of accounts to return
+        :return: list of (name, balance) tuples for the richest accounts, richest first
+        """
+
+        return self.storage.top(count)
+
+    def rank(self, name):
+        """
+        :return: the 1-based position of the account on the leaderboard, or None if it does not exist
+        """
+
+        self.settle(name)
+        return self.storage.rank(name)
+
+    def stats(self):
+        """
+        :return: dict of instrumentation counters kept by the storage engine
+        """
+
+        return self.storage.stats()
+
+    def close(self):
+        self.storage.close()
+        if self.history is not None:
+            self.history.close()
+
+
+# Journal record layout: op, account name, delta, balance after the op, timestamp
+JOURNAL_RECORD = struct.Struct("<B64sddd")
+JOURNAL_SET = 0
+JOURNAL_REMOVE = 1
+# Sets balance and last accrual time; the record's timestamp field holds the accrual time
+JOURNAL_ACCRUE = 2
+
+
+class JsonStorage:
+    """
+    Holds every honor account in memory, persisted to a JSON snapshot.
+
+    With journal enabled every mutation appends one fixed-size record to
+    '<path>.journal'; the scheduled flush folds the journal into a new snapshot
+    once it grows past compact_threshold bytes. Records carry the resulting
+    balance, so replaying them over any later snapshot this storage wrote is harmless.
+    Without the journal, mutations only mark the storage dirty and the scheduled
+    flush writes a coalesced snapshot every flush_interval seconds.
+
+    Edits made to the snapshot by anything else are picked up by comparing the
+    file's mtime, size and inode at most every check_interval seconds; the
+    file is only re-parsed when that signature changes. An edited snapshot
+    replaces the accounts outright and the journal is discarded, so changes
+    journaled within check_interval before the edit was noticed are lost.
+
+    Mutations lock only the accounts they touch (striped by name) so unrelated
+    accounts proceed in parallel; whole-snapshot work takes a write lock.
+
+    A skip list ordered by (-balance, name) is kept up to date on every
+    mutation so leaderboard and rank queries never sort the accounts.
+
+    The time each account last accrued payday honor is kept in '<path>.accrued'
+    beside the snapshot, so honor.json itself stays a plain name to balance map.
+    """
+
+    def __init__(self, path, flush_interval=5, journal=True, compact_threshold=256 * 1024, check_interval=1.0):
+        self.dir = path
+        self.flush_interval = flush_interval
+        self.check_interval = check_interval
+        # Monotonic time after which the snapshot signature is checked again
+        self.next_check = 0
+        # (mtime, size, inode) of the snapshot as last read or written by this storage
+        self.signature = None
+        # Instrumentation: snapshot parses performed, and checks that skipped a parse as the file was unchanged
+        self.parse_count = 0
+        self.parse_skipped = 0
+        self.journal_path = path + ".journal"
+        self.compact_threshold = compact_threshold
+        self.journal_fd = None
+        self.honor_accounts = {}
+        self.accrued_path = path + ".accrued"
+        # Account name to the time it last accrued payday honor
+        self.accrued = {}
+        # Mutations of a single account hold the read side plus that account's stripe;
+        # operations on the whole snapshot (flush, reload) hold the write side
+        self.rwlock = ReadWriteLock()
+        self.stripes = LockStripes()
+        # Accounts ordered richest first; guarded by ranking_lock as stripes don't cover it
+        self.ranking = RankedSkipList()
+        self.ranking_lock = threading.Lock()
+        # Serializes writers of the snapshot file
+        self.flush_lock = threading.Lock()
+        # True while in-memory accounts contain changes not yet written to disk
+        self.dirty = False
+        self.load()
+
+        if journal:
+            self.replay_journal()
+            self.journal_fd = self.open_journal()
+
+        self.flush_job = shared_scheduler().every(self.flush_interval, self.flush_due)
+        atexit.register(self.close)
+
+    def create(self, name):
+        self.refresh()
+
+        with self.rwlock.read(), self.stripes.hold(name):
+            if name not in self.honor_accounts:
+                self.honor_accounts[name] = 0
+                self.accrued[name] = time.time()
+                self.record_accrual(name, 0)
+                with self.ranking_lock:
+                    self.ranking.insert((0, name))
+                return True
+            return False
+
+    def exists(self, name):
+        self.refresh()
+        return name in self.honor_accounts
+
+    def remove(self, name):
+        self.refresh()
+
+        with self.rwlock.read(), self.stripes.hold(name):
+            balance = self.honor_accounts.pop(name)
+            self.accrued.pop(name, None)
+            self.record(JOURNAL_REMOVE, name, 0)
+            with self.ranking_lock:
+                self.ranking.remove((-balance, name))
+
+    def names(self):
+        self.refresh()
+        return list(self.honor_accounts.keys())
+
+    def balance(self, name):
+        self.refresh()
+        return self.honor_accounts[name]
+
+    def apply(self, deltas):
+        """
+        Adds each delta to its account while holding every involved account's lock,
+        journaling all of them in a single write.
+        Nothing is applied unless every account exists and no balance would drop below zero.
+        :param deltas: dict of account name to the amount to add (negative to remove honor)
+        :return: True if the deltas were applied
+        """
+
+        self.refresh()
+
+        with self.rwlock.read(), self.stripes.hold(*deltas):
+            for name, delta in deltas.items():
+                if name not in self.honor_accounts:
+                    return False
+                if delta < 0 and self.honor_accounts[name] < -delta:
+                    return False
+
+            with self.ranking_lock:
+                for name, delta in deltas.items():
+                    balance = self.honor_accounts[name]
+                    self.honor_accounts[name] = balance + delta
+                    self.ranking.remove((-balance, name))
+                    self.ranking.insert((-balance - delta, name))
+            self.record_many([(JOURNAL_SET, name, delta) for name, delta in deltas.items()])
+            return True
+
+    def accrue(self, name, amount, period, cap, now):
+        """
+        Pays the account amount for every full period elapsed since it last accrued.
+        An account that has never accrued starts accruing from now.
+        :return: the honor paid, 0 if nothing was owed or the account does not exist
+        """
+
+        self.refresh()
+
+        with self.rwlock.read(), self.stripes.hold(name):
+            if name not in self.honor_accounts:
+                return 0
+
+            last = self.accrued.get(name)
+            if last is None:
+                self.accrued[name] = now
+                self.record_accrual(name, 0)
+                return 0
+
+            periods = int((now - last) // period)
+            if periods <= 0:
+                return 0
+
+            paid = periods * amount if cap is None else min(periods * amount, cap)
+            balance = self.honor_accounts[name]
+            self.honor_accounts[name] = balance + paid
+            self.accrued[name] = last + periods * period
+            with self.ranking_lock:
+                self.ranking.remove((-balance, name))
+                self.ranking.insert((-balance - paid, name))
+            self.record_accrual(name, paid)
+            return paid
+
+    def top(self, count):
+        self.refresh()
+
+        with self.ranking_lock:
+            return [(name, -balance) for balance, name in self.ranking.first(count)]
+
+    def rank(self, name):
+        self.refresh()
+
+        with self.ranking_lock:
+            if name not in self.honor_accounts:
+                return None
+            position = self.ranking.rank((-self.honor_accounts[name], name))
+        return None if position is None else position + 1
+
+    def rebuild_ranking(self):
+        """
+        Rebuilds the leaderboard from scratch. Must be called while holding the write lock.
+        """
+
+        with self.ranking_lock:
+            self.ranking = RankedSkipList(sorted((-balance, name) for name, balance in self.honor_accounts.items()))
+
+    def record(self, op, name, delta):
+        """
+        Journals a mutation of the named account, or marks the storage dirty when no journal is in use.
+        Must be called while holding the account's stripe so its records land in the order they were applied.
+        """
+
+        self.record_many([(op, name, delta)])
+
+    def record_many(self, mutations):
+        """
+        Journals several (op, name, delta) mutations with a single append.
+        Must be called while holding the stripes of every account involved.
+        """
+
+        records = []
+
+        for op, name, delta in mutations:
+            key = name.encode("utf-8") if isinstance(name, str) else b""
+
+            if self.journal_fd is None or not 0 < len(key) <= 64:
+                # Names that do not fit a record are covered by the next snapshot instead
+                self.dirty = True
+                continue
+
+            balance = self.honor_accounts.get(name, 0)
+            records.append(JOURNAL_RECORD.pack(op, key, delta, balance, time.time()))
+
+        if records:
+            os.write(self.journal_fd, b"".join(records))
+
+    def record_accrual(self, name, delta):
+        """
+        Journals the account's balance together with its last accrual time.
+        Must be called while holding the account's stripe.
+        """
+
+        key = name.encode("utf-8") if isinstance(name, str) else b""
+
+        if self.journal_fd is None or not 0 < len(key) <= 64:
+            self.dirty = True
+            return
+
+        os.write(self.journal_fd, JOURNAL_RECORD.pack(JOURNAL_ACCRUE, key, delta, self.honor_accounts[name],
+                                                      self.accrued[name]))
+
+    def open_journal(self):
+        return os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def replay_journal(self):
+        """
+        Applies journal records left over from before the last snapshot.
+        A compaction interrupted by a crash leaves '<journal>.old' behind, which is replayed first.
+        """
+
+        replayed = 0
+
+        for path in (self.journal_path + ".old", self.journal_path):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+
+            # Drops a partial record left by a crash mid-append
+            usable = len(data) - len(data) % JOURNAL_RECORD.size
+            if usable != len(data):
+                with open(path, "r+b") as f:
+                    f.truncate(usable)
+
+            for op, key, delta, balance, timestamp in JOURNAL_RECORD.iter_unpack(data[:usable]):
+                name = key.rstrip(b"\0").decode("utf-8")
+
+                if op == JOURNAL_REMOVE:
+                    self.honor_accounts.pop(name, None)
+                    self.accrued.pop(name, None)
+                else:
+                    self.honor_accounts[name] = int(balance) if balance.is_integer() else balance
+                    if op == JOURNAL_ACCRUE:
+                        self.accrued[name] = timestamp
+                replayed += 1
+
+        if replayed > 0:
+            print("HonorBank: Replayed {} journal records.".format(replayed))
+            self.rebuild_ranking()
+
+    def discard_journal(self):
+        """
+        Empties the journal, including any left over from an interrupted compaction.
+        Must be called while holding the write lock.
+        """
+
+        os.ftruncate(self.journal_fd, 0)
+        try:
+            os.remove(self.journal_path + ".old")
+        except FileNotFoundError:
+            pass
+
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except OSError:
+            return 0
+
+    def rotate_journal(self):
+        """
+        Moves the current journal aside so that appends made while a snapshot is being written
+        land in a fresh journal. Must be called while holding the write lock.
+        """
+
+        os.close(self.journal_fd)
+        old_path = self.journal_path + ".old"
+
+        if os.path.exists(old_path):
+            # A previous compaction never completed; keep its records ahead of the current ones
+            with open(self.journal_path, "rb") as src, open(old_path, "ab") as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, old_path)
+
+        self.journal_fd = self.open_journal()
+
+    def flush(self, force=False):
+        """
+        Writes a snapshot of all accounts to disk if anything has changed since the last write.
+        In journal mode this compacts the journal into the snapshot.
+        Normally run by the scheduled flush; callers never need to invoke it after a mutation.
+        :param force: write the snapshot even if nothing has changed
+        """
+
+        with self.flush_lock:
+            with self.rwlock.write():
+                journaled = self.journal_fd is not None and self.journal_size() > 0
+                if not (self.dirty or journaled or force):
+                    return
+                snapshot = dict(self.honor_accounts)
+                accrued = dict(self.accrued)
+                self.dirty = False
+                if journaled:
+                    self.rotate_journal()
+
+            try:
+                atomic_write(self.accrued_path, json.dumps(accrued))
+
+                temp_path = write_temp(self.dir, json.dumps(snapshot, sort_keys=True, indent=4))
+                with self.rwlock.write():
+                    # Recorded together so a concurrent refresh doesn't take our own write for an outside edit
+                    try:
+                        os.replace(temp_path, self.dir)
+                    except OSError:
+                        discard(temp_path)
+                        raise
+                    self.signature = self.file_signature()
+                sync_directory(self.dir)
+            except OSError:
+                print("HonorBank: Unable to write {}!".format(self.dir))
+                self.dirty = True
+                return
+
+            if journaled:
+                os.remove(self.journal_path + ".old")
+
+    def load(self):
+        try:
+            with open(self.dir, "r+") as f:
+                signature = self.signature_of(os.fstat(f.fileno()))
+                accounts = json.load(f)
+                f.close()
+
+            try:
+                with open(self.accrued_path, "r") as f:
+                    accrued = json.load(f)
+            except (FileNotFoundError, ValueError):
+                accrued = {}
+
+            with self.rwlock.write():
+                self.honor_accounts = accounts
+                self.accrued = accrued
+                self.signature = signature
+                self.dirty = False
+                self.parse_count += 1
+                self.rebuild_ranking()
+            return True
+        except FileNotFoundError:
+            print("HonorBank: Accounts failed to load!")
+            return False
+        except ValueError:
+            print("HonorBank: Cannot load an empty file!")
+            return False
+
+    @staticmethod
+    def signature_of(stat):
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def file_signature(self):
+        try:
+            return self.signature_of(os.stat(self.dir))
+        except OSError:
+            return None
+
+    def refresh(self):
+        """
+        Re-reads the snapshot if it changed on disk since this storage last read or wrote it.
+        The edited snapshot supersedes every journaled mutation, so the journal is emptied rather than replayed.
+        """
+
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+
+        signature = self.file_signature()
+        if signature == self.signature:
+            self.parse_skipped += 1
+            return
+
+        # Waits out a flush in progress, which would otherwise compact the discarded journal over the edit
+        with self.flush_lock, self.rwlock.write():
+            signature = self.file_signature()
+            if signature == self.signature:
+                # A flush from this storage replaced the file while we were checking
+                return
+
+            if self.dirty:
+                # The next flush overwrites the outside edit; reloading now would lose unsaved changes
+                print("HonorBank: {} changed on disk while changes are unsaved, keeping accounts in memory.".format(self.dir))
+                self.signature = signature
+                return
+
+            if not self.load():
+                # Keep the accounts in memory; the next flush writes the snapshot back
+                self.signature = signature
+            elif self.journal_fd is not None:
+                self.discard_journal()
+
+    def stats(self):
+        return {"parses": self.parse_count, "parses_skipped": self.parse_skipped}
+
+    def flush_due(self):
+        """
+        Run by the scheduler every flush_interval seconds; writes a snapshot once there are unsaved
+        changes or the journal is due for compaction
+        """
+
+        if self.dirty or self.journal_size() >= self.compact_threshold:
+            self.flush()
+
+    def close(self):
+        """
+        Cancels the scheduled flush and writes any pending changes
+        """
+
+        self.flush_job.cancel()
+        self.flush()
+
+
+class SqliteStorage:
+    """
+    Keeps one row per account in a SQLite database running in WAL mode.
+    Every operation is a statement against the database, so several processes
+    can safely share the same file. Each thread uses its own connection.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.dir = path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.load()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None:
+            # isolation_level=None leaves transactions to explicit BEGIN statements
+            conn = sqlite3.connect(self.dir, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def load(self):
+        conn = self.connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS accounts ("
+                     "name TEXT PRIMARY KEY NOT NULL, "
+                     "balance INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("CREATE INDEX IF NOT EXISTS accounts_by_balance ON accounts (balance DESC, name)")
+
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]
+        if "accrued_at" not in columns:
+            # Databases imported before lazy payday have no accrual times; accounts start accruing when first settled
+            conn.execute("ALTER TABLE accounts ADD COLUMN accrued_at REAL")
+        return True
+
+    def create(self, name):
+        cursor = self.connection().execute("INSERT OR IGNORE INTO accounts (name, balance, accrued_at) VALUES (?, 0, ?)",
+                                           (name, time.time()))
+        return cursor.rowcount == 1
+
+    def exists(self, name):
+        row = self.connection().execute("SELECT 1 FROM accounts WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def remove(self, name):
+        cursor = self.connection().execute("DELETE FROM accounts WHERE name = ?", (name,))
+        if cursor.rowcount == 0:
+            raise KeyError(name)
+
+    def names(self):
+        return [row[0] for row in self.connection().execute("SELECT name FROM accounts")]
+
+    def balance(self, name):
+        row = self.connection().execute("SELECT balance FROM accounts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def apply(self, deltas):
+        """
+        Applies every delta within one transaction. Debits only succeed while the balance covers them,
+        so a single failed row rolls back the whole batch.
+        :param deltas: dict of account name to the amount to add (negative to remove honor)
+        :return: True if the deltas were applied
+        """
+
+        conn = self.connection()
+
+        if len(deltas) == 1:
+            # Point updates need no explicit transaction
+            name, delta = next(iter(deltas.items()))
+            return self.update(conn, name, delta)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name, delta in deltas.items():
+                if not self.update(conn, name, delta):
+                    conn.execute("ROLLBACK")
+                    return False
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def accrue(self, name, amount, period, cap, now):
+        """
+        Pays the account amount for every full period elapsed since it last accrued.
+        The common case of nothing being owed is a single read; payouts happen in a write transaction.
+        :return: the honor paid, 0 if nothing was owed or the account does not exist
+        """
+
+        conn = self.connection()
+
+        row = conn.execute("SELECT accrued_at FROM accounts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return 0
+        if row[0] is None:
+            conn.execute("UPDATE accounts SET accrued_at = ? WHERE name = ? AND accrued_at IS NULL", (now, name))
+            return 0
+        if now - row[0] < period:
+            return 0
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have settled the account since the read above
+            row = conn.execute("SELECT accrued_at FROM accounts WHERE name = ?", (name,)).fetchone()
+            periods = int((now - row[0]) // period) if row is not None else 0
+            if periods <= 0:
+                conn.execute("COMMIT")
+                return 0
+
+            paid = periods * amount if cap is None else min(periods * amount, cap)
+            conn.execute("UPDATE accounts SET balance = balance + ?, accrued_at = ? WHERE name = ?",
+                         (paid, row[0] + periods * period, name))
+            conn.execute("COMMIT")
+            return paid
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def top(self, count):
+        return self.connection().execute("SELECT name, balance FROM accounts ORDER BY balance DESC, name LIMIT ?",
+                                         (count,)).fetchall()
+
+    def rank(self, name):
+        """
+        Counts the accounts ahead of this one along the balance index. SQLite keeps no counts in its
+        b-trees, so this takes time linear in the rank, about 10ms for the last of 200,000 accounts.
+        Every process sees the same database, so no faster in-memory structure could be kept up to date.
+        """
+
+        row = self.connection().execute("SELECT balance FROM accounts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        # Two range scans of the covering index; joined with OR, SQLite also de-duplicates the rows it visits
+        ahead = self.connection().execute("SELECT (SELECT COUNT(*) FROM accounts WHERE balance > ?) + "
+                                          "(SELECT COUNT(*) FROM accounts WHERE balance = ? AND name < ?)",
+                                          (row[0], row[0], name)).fetchone()
+        return ahead[0] + 1
+
+    @staticmethod
+    def update(conn, name, delta):
+        if delta < 0:
+            cursor = conn.execute("UPDATE accounts SET balance = balance + ? WHERE name = ? AND balance >= ?",
+                                  (delta, name, -delta))
+        else:
+            cursor = conn.execute("UPDATE accounts SET balance = balance + ? WHERE name = ?", (delta, name))
+        return cursor.rowcount == 1
+
+    def flush(self):
+        # Every statement is already committed
+        pass
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+def import_json(json_path, db_path, history_path="honor.history"):
+    """
+    One-shot import of an honor.json file into a SQLite database, replacing balances of existing rows.
+    Journal records next to the JSON file are replayed first so no recent mutation is lost.
+    Transactions in the history file, if there is one, are appended to the database's history.
+    :param json_path: path to the JSON accounts file
+    :param db_path: path to the SQLite database, created if it doesn't exist
+    :param history_path: path to the transaction log kept beside the JSON file
+    :return: the number of accounts imported
+    """
+
+    source = JsonStorage(json_path, journal=os.path.exists(json_path + ".journal"))
+    source.close()
+    accounts = source.honor_accounts
+
+    target = SqliteStorage(db_path)
+    conn = target.connection()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany("INSERT OR REPLACE INTO accounts (name, balance) VALUES (?, ?)", accounts.items())
+    conn.executemany("UPDATE accounts SET accrued_at = ? WHERE name = ?",
+                     [(accrued, name) for name, accrued in source.accrued.items() if name in accounts])
+    conn.execute("COMMIT")
+    target.close()
+
+    if os.path.exists(history_path):
+        source_history = TransactionLog(history_path)
+        target_history = SqliteTransactionLog(db_path)
+        target_history.record_many(source_history.transactions())
+        source_history.close()
+        target_history.close()
+    return len(accounts)
+
+
+if __name__ == "__main__":
+    # Usage: python -m libs.honorbank [honor.json] [honor.db]
+    json_path = sys.argv[1] if len(sys.argv) > 1 else "honor.json"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "honor.db"
+    print("HonorBank: Imported {} accounts from {} into {}".format(import_json(json_path, db_path), json_path, db_path))
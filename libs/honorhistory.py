@@ -0,0 +1,236 @@
+import atexit
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+
+from libs.atomicfile import atomic_write
+from libs.scheduler import shared_scheduler
+
+
+# Record layout: account, timestamp, delta, reason, source plugin, offset of the account's previous record (-1 if none)
+HISTORY_RECORD = struct.Struct("<64sdd24s16sq")
+
+
+class Transaction:
+    def __init__(self, account, timestamp, delta, reason, source):
+        self.account = account
+        self.timestamp = timestamp
+        self.delta = delta
+        self.reason = reason
+        self.source = source
+
+
+class TransactionLog:
+    """
+    An append-only log of every honor transaction made through the bank.
+
+    Records are fixed-width and each one points back at the previous record of
+    the same account, so an account's most recent transactions are read by
+    following that chain from the offset of its latest record. The offsets of
+    the latest records are kept in '<path>.idx', which notes how much of the
+    log it covers; anything appended after that is indexed again at startup.
+    The log must only be written by one process at a time; banks shared
+    between processes keep their history in a SqliteTransactionLog instead.
+    """
+
+    def __init__(self, path="honor.history", index_interval=60):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.index_interval = index_interval
+        # Account name to the offset of its latest record
+        self.latest = {}
+        # Bytes of the log covered by self.latest
+        self.size = 0
+        self.lock = threading.Lock()
+        self.index_dirty = False
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self.load_index()
+
+        self.index_job = shared_scheduler().every(self.index_interval, self.save_index)
+        atexit.register(self.close)
+
+    @staticmethod
+    def encode(text, width):
+        """
+        Encodes text as UTF-8 cut down to at most width bytes without splitting a character
+        """
+
+        return text.encode("utf-8")[:width].decode("utf-8", "ignore").encode("utf-8")
+
+    def record(self, account, delta, reason="", source=""):
+        """
+        Appends a transaction to the log.
+        Accounts whose names don't fit a record are not logged.
+        """
+
+        key = account.encode("utf-8") if isinstance(account, str) else b""
+        if not 0 < len(key) <= 64:
+            return
+
+        with self.lock:
+            offset = self.size
+            data = HISTORY_RECORD.pack(key, time.time(), delta, self.encode(reason, 24),
+                                       self.encode(source, 16), self.latest.get(account, -1))
+            os.write(self.fd, data)
+            self.latest[account] = offset
+            self.size += len(data)
+            self.index_dirty = True
+
+    def recent(self, account, count):
+        """
+        :param account: name of the account
+        :param count: the maximum number of transactions to return
+        :return: list of the account's latest Transactions, newest first
+        """
+
+        transactions = []
+        offset = self.latest.get(account, -1)
+
+        while offset >= 0 and len(transactions) < count:
+            record = os.pread(self.fd, HISTORY_RECORD.size, offset)
+            transaction, offset = self.unpack(record)
+            transactions.append(transaction)
+        return transactions
+
+    def transactions(self):
+        """
+        :return: generator of every logged Transaction, oldest first
+        """
+
+        offset = 0
+        while offset < self.size:
+            chunk = os.pread(self.fd, min(self.size - offset, HISTORY_RECORD.size * 4096), offset)
+            for x in range(0, len(chunk), HISTORY_RECORD.size):
+                yield self.unpack(chunk[x:x + HISTORY_RECORD.size])[0]
+            offset += len(chunk)
+
+    @staticmethod
+    def unpack(record):
+        key, timestamp, delta, reason, source, previous = HISTORY_RECORD.unpack(record)
+        delta = int(delta) if delta.is_integer() else delta
+        transaction = Transaction(key.rstrip(b"\0").decode("utf-8"), timestamp, delta,
+                                  reason.rstrip(b"\0").decode("utf-8"), source.rstrip(b"\0").decode("utf-8"))
+        return transaction, previous
+
+    def load_index(self):
+        """
+        Loads the saved index, then indexes any records appended after it was saved
+        """
+
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self.latest = index["latest"]
+            self.size = index["size"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.latest = {}
+            self.size = 0
+
+        end = os.fstat(self.fd).st_size
+        if self.size > end:
+            # The index is newer than the log it describes; rebuild it from scratch
+            self.latest = {}
+            self.size = 0
+
+        # Drops a partial record left by a crash mid-append
+        usable = end - (end - self.size) % HISTORY_RECORD.size
+        if usable != end:
+            os.ftruncate(self.fd, usable)
+
+        while self.size < usable:
+            chunk = os.pread(self.fd, min(usable - self.size, HISTORY_RECORD.size * 4096), self.size)
+            for record in HISTORY_RECORD.iter_unpack(chunk):
+                self.latest[record[0].rstrip(b"\0").decode("utf-8")] = self.size
+                self.size += HISTORY_RECORD.size
+            self.index_dirty = True
+
+    def save_index(self):
+        with self.lock:
+            if not self.index_dirty:
+                return
+            index = {"size": self.size, "latest": dict(self.latest)}
+            self.index_dirty = False
+
+        atomic_write(self.index_path, json.dumps(index))
+
+    def close(self):
+        self.index_job.cancel()
+        self.save_index()
+
+
+class SqliteTransactionLog:
+    """
+    Keeps every honor transaction in a 'history' table beside the accounts of a SqliteStorage database.
+    Each record is a single insert, so any number of processes can log to and read from the same file.
+    Each thread uses its own connection.
+    """
+
+    def __init__(self, path="honor.db", timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+
+        conn = self.connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS history ("
+                     "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                     "account TEXT NOT NULL, "
+                     "timestamp REAL NOT NULL, "
+                     "delta NOT NULL, "
+                     "reason TEXT NOT NULL DEFAULT '', "
+                     "source TEXT NOT NULL DEFAULT '')")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_by_account ON history (account, id)")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None:
+            # isolation_level=None commits every statement as it runs
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def record(self, account, delta, reason="", source=""):
+        """
+        Appends a transaction to the log
+        """
+
+        self.connection().execute("INSERT INTO history (account, timestamp, delta, reason, source) VALUES (?, ?, ?, ?, ?)",
+                                  (account, time.time(), delta, reason, source))
+
+    def record_many(self, transactions):
+        """
+        Inserts already made Transactions, keeping their timestamps, in a single transaction
+        """
+
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO history (account, timestamp, delta, reason, source) VALUES (?, ?, ?, ?, ?)",
+                             [(t.account, t.timestamp, t.delta, t.reason, t.source) for t in transactions])
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def recent(self, account, count):
+        """
+        :param account: name of the account
+        :param count: the maximum number of transactions to return
+        :return: list of the account's latest Transactions, newest first
+        """
+
+        rows = self.connection().execute("SELECT account, timestamp, delta, reason, source FROM history "
+                                         "WHERE account = ? ORDER BY id DESC LIMIT ?", (account, count))
+        return [Transaction(*row) for row in rows]
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
@@ -0,0 +1,201 @@
+import os
+import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+# The KVStore shared by every plugin within this process
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def shared_store():
+    """
+    Returns the process-wide KVStore kept in 'plugins.db', creating it on first use
+    :return KVStore: the shared store
+    """
+
+    global _shared_store
+
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = KVStore("plugins.db")
+        return _shared_store
+
+
+class KVStore:
+    """
+    Persistent key-value storage for plugin state, kept in a SQLite database.
+    Each plugin works in its own Namespace and writes one record per key, so the cost
+    of a write depends on the size of that record rather than all of the plugin's data.
+    Values are pickled unless the namespace is given a codec. Each thread uses its own connection.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.dir = path
+        self.timeout = timeout
+        self.local = threading.local()
+
+        conn = self.connection()
+        # The rowid keeps records in insertion order for namespaces where order matters
+        conn.execute("CREATE TABLE IF NOT EXISTS records ("
+                     "namespace TEXT NOT NULL, "
+                     "key TEXT NOT NULL, "
+                     "value BLOB NOT NULL, "
+                     "UNIQUE (namespace, key))")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None:
+            # isolation_level=None leaves transactions to explicit BEGIN statements
+            conn = sqlite3.connect(self.dir, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.depth = 0
+        return conn
+
+    def namespace(self, name, codec=None):
+        """
+        :param name: the namespace, usually the plugin's name
+        :param codec: object with encode(value) and decode(data) used in place of pickle, such as a records.Schema
+        :return Namespace: the namespace
+        """
+
+        return Namespace(self, name, codec)
+
+    @contextmanager
+    def batch(self):
+        """
+        Commits every write made by this thread inside the block as a single transaction.
+        Batches may be nested; only the outermost one commits.
+        """
+
+        conn = self.connection()
+        if self.local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self.local.depth += 1
+
+        try:
+            yield
+        except BaseException:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            conn.execute("COMMIT")
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+class Namespace:
+    """
+    A plugin's view of the KVStore. Keys are strings.
+    A namespace with a codec still reads values pickled before it had one; they are converted when next written.
+    """
+
+    def __init__(self, store, name, codec=None):
+        self.store = store
+        self.name = name
+        self.codec = codec
+
+    def dumps(self, value):
+        if self.codec is None:
+            return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return self.codec.encode(value)
+
+    def loads(self, data):
+        # Every pickle since protocol 2 starts with the PROTO opcode
+        if self.codec is None or data[:1] == b"\x80":
+            return pickle.loads(data)
+        return self.codec.decode(data)
+
+    def get(self, key, default=None):
+        row = self.store.connection().execute("SELECT value FROM records WHERE namespace = ? AND key = ?",
+                                              (self.name, key)).fetchone()
+        if row is None:
+            return default
+        return self.loads(row[0])
+
+    def put(self, key, value):
+        self.store.connection().execute("INSERT INTO records (namespace, key, value) VALUES (?, ?, ?) "
+                                        "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value",
+                                        (self.name, key, self.dumps(value)))
+
+    def put_many(self, items):
+        """
+        Writes every (key, value) pair in a single transaction
+        """
+
+        with self.batch():
+            for key, value in items:
+                self.put(key, value)
+
+    def delete(self, key):
+        self.store.connection().execute("DELETE FROM records WHERE namespace = ? AND key = ?", (self.name, key))
+
+    def clear(self):
+        self.store.connection().execute("DELETE FROM records WHERE namespace = ?", (self.name,))
+
+    def keys(self):
+        return [row[0] for row in self.store.connection().execute(
+            "SELECT key FROM records WHERE namespace = ? ORDER BY rowid", (self.name,))]
+
+    def items(self):
+        """
+        :return: list of every (key, value) pair in the order the keys were first written
+        """
+
+        return list(self.iter_items())
+
+    def iter_items(self):
+        """
+        Like items, but each value is read and decoded only as the caller reaches it
+        """
+
+        cursor = self.store.connection().execute("SELECT key, value FROM records WHERE namespace = ? ORDER BY rowid",
+                                                 (self.name,))
+        for key, value in cursor:
+            yield key, self.loads(value)
+
+    def __contains__(self, key):
+        row = self.store.connection().execute("SELECT 1 FROM records WHERE namespace = ? AND key = ?",
+                                              (self.name, key)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self.store.connection().execute("SELECT COUNT(*) FROM records WHERE namespace = ?",
+                                               (self.name,)).fetchone()[0]
+
+    def batch(self):
+        return self.store.batch()
+
+    def migrate_pickle(self, path, records):
+        """
+        One-time import of state a plugin used to pickle into a single file.
+        Does nothing unless the namespace is empty and the file holds a pickle.
+        The file is renamed to '<path>.migrated' once its records are stored.
+        :param path: the legacy pickle file
+        :param records: function turning the unpickled object into an iterable of (key, value) pairs
+        :return: True if the file was imported
+        """
+
+        if len(self) > 0 or not os.path.exists(path) or os.path.getsize(path) == 0:
+            return False
+
+        with open(path, "rb") as f:
+            legacy = pickle.load(f)
+
+        self.put_many(records(legacy))
+        os.replace(path, path + ".migrated")
+        print("KVStore: Imported {} into '{}'.".format(path, self.name))
+        return True
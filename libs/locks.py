@@ -0,0 +1,102 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Lets any number of readers in at once, or a single writer.
+    Waiting writers block new readers so a steady stream of reads can't starve them.
+    The writer may re-acquire the lock, for reading or writing, from the same thread.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writer = None
+        self.writer_depth = 0
+
+    def acquire_read(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.writer_depth += 1
+                return
+
+            while self.writer is not None or self.writers_waiting > 0:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.writer_depth -= 1
+                return
+
+            self.readers -= 1
+            if self.readers == 0:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+
+        with self.condition:
+            if self.writer == me:
+                self.writer_depth += 1
+                return
+
+            self.writers_waiting += 1
+            while self.writer is not None or self.readers > 0:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writer = me
+            self.writer_depth = 1
+
+    def release_write(self):
+        with self.condition:
+            self.writer_depth -= 1
+            if self.writer_depth == 0:
+                self.writer = None
+                self.condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class LockStripes:
+    """
+    A fixed pool of locks shared out between keys by hash.
+    Unrelated keys usually map to different locks and so don't contend.
+    """
+
+    def __init__(self, count=64):
+        self.locks = [threading.Lock() for x in range(count)]
+
+    @contextmanager
+    def hold(self, *keys):
+        """
+        Holds the locks of every given key. Locks are always taken in index order,
+        so two threads holding overlapping sets of keys can't deadlock.
+        """
+
+        indexes = sorted({hash(key) % len(self.locks) for key in keys})
+
+        for index in indexes:
+            self.locks[index].acquire()
+        try:
+            yield
+        finally:
+            for index in reversed(indexes):
+                self.locks[index].release()
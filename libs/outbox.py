@@ -0,0 +1,223 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections import deque
+
+
+# The Outbox shared by every plugin within this process
+_shared_outbox = None
+_shared_lock = threading.Lock()
+
+
+def shared_outbox(bot):
+    """
+    Returns the process-wide Outbox, creating it on first use.
+    Plugins should send broadcasts through this rather than calling bot.send_message
+    so that every plugin shares the same rate limits.
+    :param bot: the bot used to send messages
+    :return Outbox: the shared outbox
+    """
+
+    global _shared_outbox
+
+    with _shared_lock:
+        if _shared_outbox is None:
+            _shared_outbox = Outbox(bot)
+        return _shared_outbox
+
+
+class TokenBucket:
+    """
+    Allows rate operations per second on average, with bursts of up to capacity
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        :return: seconds until a token is available, 0 if one is available now
+        """
+
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+
+
+class Outbox:
+    """
+    Queues outbound messages and sends them from a pool of worker threads, so plugins never wait on Telegram.
+
+    Sends are limited by token buckets: one for the whole bot, one per chat and a slower one
+    shared by group chats (negative chat ids), matching Telegram's limits. Messages queued
+    for the same chat are sent in order, and consecutive ones are merged into a single message
+    while they fit within Telegram's message length limit.
+    """
+
+    # Telegram rejects messages longer than this
+    MAX_LENGTH = 4096
+
+    def __init__(self, bot, workers=2, global_rate=30, chat_rate=1, chat_burst=3, group_rate=20 / 60,
+                 group_burst=20, max_pending=100):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_pending = max_pending
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        # Chat id to its TokenBucket, and to its group TokenBucket for group chats
+        self.chat_buckets = {}
+        self.group_buckets = {}
+        # Chat id to a deque of messages waiting to be sent
+        self.pending = {}
+        # (time the chat may send next, tie breaker, chat id) for every chat with pending messages not being sent
+        self.ready = []
+        # Chats currently waiting in self.ready or being sent by a worker
+        self.scheduled = set()
+        self.condition = threading.Condition(threading.Lock())
+        self.counter = itertools.count()
+
+        # Instrumentation
+        self.depth = 0
+        self.max_depth = 0
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.failed = 0
+
+        for x in range(workers):
+            thread = threading.Thread(target = self.send_loop)
+            thread.daemon = True
+            thread.start()
+
+    def send(self, chat, message):
+        """
+        Queues a message to be sent to a chat.
+        When a chat already has max_pending messages waiting, its oldest message is dropped.
+        """
+
+        with self.condition:
+            queue = self.pending.setdefault(chat, deque())
+            if len(queue) >= self.max_pending:
+                queue.popleft()
+                self.dropped += 1
+                self.depth -= 1
+
+            queue.append(message)
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+            if chat not in self.scheduled:
+                self.scheduled.add(chat)
+                heapq.heappush(self.ready, (time.monotonic(), next(self.counter), chat))
+                self.condition.notify()
+
+    def broadcast(self, chats, message):
+        """
+        Queues a message to be sent to every chat in chats
+        """
+
+        for chat in list(chats):
+            self.send(chat, message)
+
+    def buckets(self, chat):
+        """
+        :return: list of every TokenBucket a message to chat must take a token from
+        """
+
+        if chat not in self.chat_buckets:
+            self.chat_buckets[chat] = TokenBucket(self.chat_rate, self.chat_burst)
+            if isinstance(chat, int) and chat < 0:
+                self.group_buckets[chat] = TokenBucket(self.group_rate, self.group_burst)
+
+        buckets = [self.global_bucket, self.chat_buckets[chat]]
+        if chat in self.group_buckets:
+            buckets.append(self.group_buckets[chat])
+        return buckets
+
+    def next_message(self):
+        """
+        Waits until a chat may send, then takes its tokens and its merged pending messages.
+        Must be called while holding the condition.
+        :return: (chat, message)
+        """
+
+        while True:
+            if not self.ready:
+                self.condition.wait()
+                continue
+
+            ready_at, tie, chat = self.ready[0]
+            now = time.monotonic()
+            if ready_at > now:
+                self.condition.wait(ready_at - now)
+                continue
+
+            buckets = self.buckets(chat)
+            wait = max(bucket.delay(now) for bucket in buckets)
+            if wait > 0:
+                heapq.heapreplace(self.ready, (now + wait, tie, chat))
+                continue
+
+            heapq.heappop(self.ready)
+            for bucket in buckets:
+                bucket.take(now)
+
+            queue = self.pending[chat]
+            message = queue.popleft()
+            while queue and len(message) + 1 + len(queue[0]) <= self.MAX_LENGTH:
+                message += "\n" + queue.popleft()
+                self.merged += 1
+                self.depth -= 1
+            self.depth -= 1
+            return chat, message
+
+    def send_loop(self):
+        while True:
+            with self.condition:
+                chat, message = self.next_message()
+
+            try:
+                self.bot.send_message(chat, message)
+                sent = True
+            except Exception:
+                print("Outbox: Unable to send a message to {}!".format(chat))
+                traceback.print_exc()
+                sent = False
+
+            with self.condition:
+                if sent:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+
+                if self.pending[chat]:
+                    heapq.heappush(self.ready, (time.monotonic(), next(self.counter), chat))
+                    self.condition.notify()
+                else:
+                    del self.pending[chat]
+                    self.scheduled.discard(chat)
+
+    def stats(self):
+        """
+        :return: dict of queue depth and delivery counters
+        """
+
+        with self.condition:
+            return {"depth": self.depth, "max_depth": self.max_depth, "chats_waiting": len(self.ready),
+                    "sent": self.sent, "merged": self.merged, "dropped": self.dropped, "failed": self.failed}
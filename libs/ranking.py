@@ -0,0 +1,138 @@
+import math
+import random
+
+
+class _Infinity:
+    """
+    Sentinel key that sorts after every other key
+    """
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+    def __ge__(self, other):
+        return True
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, next, width):
+        self.key = key
+        self.next = next
+        self.width = width
+
+
+class RankedSkipList:
+    """
+    A sorted collection of unique keys supporting insert, remove and rank lookups in O(log n).
+    Each link stores how many elements it skips over, which is what makes positional queries logarithmic.
+    """
+
+    MAX_LEVELS = 24
+
+    def __init__(self, keys=()):
+        self.size = 0
+        self.tail = _Node(_Infinity(), [], [])
+        self.head = _Node(None, [self.tail] * self.MAX_LEVELS, [1] * self.MAX_LEVELS)
+
+        for key in keys:
+            self.insert(key)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        node = self.head.next[0]
+        while node is not self.tail:
+            yield node.key
+            node = node.next[0]
+
+    def insert(self, key):
+        chain = [None] * self.MAX_LEVELS
+        steps_at_level = [0] * self.MAX_LEVELS
+        node = self.head
+
+        # Finds the last node before key on every level, counting the elements skipped
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = min(self.MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2.0)))
+        new_node = _Node(key, [None] * height, [None] * height)
+        steps = 0
+
+        for level in range(height):
+            previous = chain[level]
+            new_node.next[level] = previous.next[level]
+            previous.next[level] = new_node
+            new_node.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+
+        for level in range(height, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * self.MAX_LEVELS
+        node = self.head
+
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is self.tail or target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            previous = chain[level]
+            previous.width[level] += target.width[level] - 1
+            previous.next[level] = target.next[level]
+
+        for level in range(len(target.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+        self.size -= 1
+
+    def rank(self, key):
+        """
+        :return: the 0-based position of key, or None if it isn't present
+        """
+
+        position = 0
+        node = self.head
+
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+
+        found = node.next[0]
+        if found is self.tail or found.key != key:
+            return None
+        return position
+
+    def first(self, count):
+        """
+        :return: a list of the count smallest keys
+        """
+
+        keys = []
+        node = self.head.next[0]
+
+        while node is not self.tail and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
@@ -0,0 +1,501 @@
+import keyword
+import struct
+import sys
+import zlib
+
+
+"""
+A compact, versioned binary format for plugin objects, used in place of pickle.
+
+A Schema lists an object's fields and how each is encoded. A record is a marker byte, the schema
+version it was written with, the number of fields, then the values of those fields in order.
+No class or attribute names are stored, so records are small and renaming a class or module
+does not break them.
+
+When a class changes, add a version to its schema with the new field list and an upgrade hook
+that turns a dict of the previous version's values into the new one. Records are upgraded as
+they are read. A downgrade hook does the reverse, so a schema can still write records that an
+older release of the plugin can read. Fields missing from a record take their default, and
+trailing fields written by a newer release are ignored, so appending a field is always safe.
+"""
+
+
+# First byte of every record; pickles start with 0x80, so the two can be told apart
+MAGIC = 0x52
+
+
+def write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def default_value(default):
+    """
+    Defaults may be given as a function, such as list, so that objects never share a mutable default
+    """
+
+    return default() if callable(default) else default
+
+
+class Int:
+    """
+    Signed integers as zigzag varints, so small values of either sign take one byte
+    """
+
+    def write(self, out, value):
+        write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+
+    def read(self, data, pos):
+        value = data[pos]
+        if value >= 0x80:
+            value, pos = read_varint(data, pos)
+            return (value >> 1) ^ -(value & 1), pos
+        return (value >> 1) ^ -(value & 1), pos + 1
+
+
+class Fixed:
+    """
+    A fixed width value packed with the struct format character code.
+    Runs of fixed width fields in a schema are packed and unpacked together in one struct call,
+    so they are the fastest fields to load, at the cost of a few bytes over INT.
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.packer = struct.Struct("<" + code)
+
+    def write(self, out, value):
+        out += self.packer.pack(value)
+
+    def read(self, data, pos):
+        return self.packer.unpack_from(data, pos)[0], pos + self.packer.size
+
+
+class Number:
+    """
+    A value that may be either an int or a float, such as a balance that is sometimes divided
+    """
+
+    def write(self, out, value):
+        if isinstance(value, float):
+            out.append(1)
+            FLOAT.write(out, value)
+        else:
+            out.append(0)
+            INT.write(out, value)
+
+    def read(self, data, pos):
+        if data[pos]:
+            return FLOAT.read(data, pos + 1)
+        return INT.read(data, pos + 1)
+
+
+class Str:
+    def __init__(self, intern=False):
+        # Interned strings share one object per distinct value, for fields such as species names
+        self.intern = intern
+
+    def write(self, out, value):
+        encoded = value.encode("utf-8")
+        write_varint(out, len(encoded))
+        out += encoded
+
+    def read(self, data, pos):
+        length = data[pos]
+        if length < 0x80:
+            pos += 1
+        else:
+            length, pos = read_varint(data, pos)
+        value = str(data[pos:pos + length], "utf-8")
+        return sys.intern(value) if self.intern else value, pos + length
+
+
+INT = Int()
+INT32 = Fixed("i")
+INT64 = Fixed("q")
+FLOAT = Fixed("d")
+BOOL = Fixed("?")
+NUMBER = Number()
+STR = Str()
+INTERNED = Str(intern=True)
+
+
+class ListOf:
+    def __init__(self, item):
+        self.item = item
+
+    def write(self, out, value):
+        write_varint(out, len(value))
+        for item in value:
+            self.item.write(out, item)
+
+    def read(self, data, pos):
+        length, pos = read_varint(data, pos)
+        read = self.item.read
+        items = []
+        for x in range(length):
+            item, pos = read(data, pos)
+            items.append(item)
+        return items, pos
+
+
+class MapOf:
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def write(self, out, value):
+        write_varint(out, len(value))
+        for k, v in value.items():
+            self.key.write(out, k)
+            self.value.write(out, v)
+
+    def read(self, data, pos):
+        length, pos = read_varint(data, pos)
+        read_key = self.key.read
+        read_value = self.value.read
+        items = {}
+        for x in range(length):
+            k, pos = read_key(data, pos)
+            items[k], pos = read_value(data, pos)
+        return items, pos
+
+
+class EnumOf:
+    """
+    Members of an Enum with integer values, stored by value
+    """
+
+    def __init__(self, enum):
+        self.enum = enum
+
+    def write(self, out, value):
+        INT.write(out, value.value)
+
+    def read(self, data, pos):
+        value, pos = INT.read(data, pos)
+        return self.enum(value), pos
+
+
+class Nested:
+    """
+    An object stored as a record of its own schema. The record is length prefixed so that
+    fields a newer release appended to it can be skipped.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def write(self, out, value):
+        record = self.schema.encode(value)
+        write_varint(out, len(record))
+        out += record
+
+    def read(self, data, pos):
+        length, pos = read_varint(data, pos)
+        return self.schema.decode(data[pos:pos + length]), pos + length
+
+
+class Version:
+    def __init__(self, fields, upgrade=None, downgrade=None):
+        # List of (attribute name, type, default)
+        self.fields = fields
+        # Turns a dict of the previous version's values into this version's
+        self.upgrade = upgrade
+        # Turns a dict of this version's values into the previous version's
+        self.downgrade = downgrade
+        # The fields in order as (names, struct.Struct) for each run of Fixed fields and (name, type) for the rest
+        self.segments = []
+
+        run = []
+        for name, kind, default in fields + [(None, None, None)]:
+            if isinstance(kind, Fixed):
+                run.append((name, kind.code))
+                continue
+            if run:
+                self.segments.append(([name for name, code in run],
+                                      struct.Struct("<" + "".join(code for name, code in run))))
+                run = []
+            if kind is not None:
+                self.segments.append((name, kind))
+
+    def write(self, out, values):
+        for name, kind in self.segments:
+            if isinstance(kind, struct.Struct):
+                out += kind.pack(*[values[field] for field in name])
+            else:
+                kind.write(out, values[name])
+
+    def read(self, data, pos, values):
+        for name, kind in self.segments:
+            if isinstance(kind, struct.Struct):
+                values.update(zip(name, kind.unpack_from(data, pos)))
+                pos += kind.size
+            else:
+                values[name], pos = kind.read(data, pos)
+        return pos
+
+
+class Schema:
+    """
+    Encodes and decodes instances of cls.
+    Decoded objects are created without calling cls.__init__ and have every field of the current version set.
+    """
+
+    def __init__(self, cls, fields):
+        """
+        :param cls: the class being stored
+        :param fields: list of (attribute name, type, default) for version 1
+        """
+
+        self.cls = cls
+        self.versions = [Version(fields)]
+        # Function reading a record in the current layout, generated by compile_reader on first use
+        self.reader = None
+
+    @property
+    def version(self):
+        return len(self.versions)
+
+    def add_version(self, fields, upgrade=None, downgrade=None):
+        """
+        Makes fields the current layout of cls
+        :param fields: list of (attribute name, type, default)
+        :param upgrade: function taking a dict of the previous version's values and returning this version's
+        :param downgrade: function taking a dict of this version's values and returning the previous version's
+        :return: the new version number
+        """
+
+        self.versions.append(Version(fields, upgrade, downgrade))
+        self.reader = None
+        return self.version
+
+    def encode(self, obj, version=None):
+        """
+        :param obj: instance of cls
+        :param version: version to write, for releases that do not know the current one
+        :return: the record as bytes
+        """
+
+        version = version or self.version
+        out = bytearray([MAGIC])
+        write_varint(out, version)
+        write_varint(out, len(self.versions[version - 1].fields))
+        self.write_fields(out, obj, version)
+        return bytes(out)
+
+    def decode(self, data):
+        """
+        :param data: a record written by any version of this schema
+        :return: a new instance of cls
+        """
+
+        if data[0] != MAGIC:
+            raise ValueError("Not a {} record".format(self.cls.__name__))
+        version, pos = read_varint(data, 1)
+        count, pos = read_varint(data, pos)
+        if version == self.version and count == len(self.versions[-1].fields):
+            return self.current_reader()(data, pos)
+        return self.create(self.read_fields(data, pos, version, count))
+
+    def write_fields(self, out, obj, version):
+        values = {}
+        for name, kind, default in self.versions[-1].fields:
+            values[name] = getattr(obj, name) if hasattr(obj, name) else default_value(default)
+
+        for number in range(self.version, version, -1):
+            downgrade = self.versions[number - 1].downgrade
+            if downgrade is None:
+                raise ValueError("{} records cannot be written as version {}".format(self.cls.__name__, version))
+            values = downgrade(values)
+
+        self.versions[version - 1].write(out, values)
+
+    def read_fields(self, data, pos, version, count):
+        """
+        Reads the count fields of a record written as version and upgrades them to the current version.
+        Fields past those this schema knows are ignored, so data should end with the record.
+        :return: dict of field values
+        """
+
+        # A newer release only appends fields, so its records are read with the newest known layout
+        known = min(version, self.version)
+        layout = self.versions[known - 1]
+
+        values = {}
+        if count >= len(layout.fields):
+            layout.read(data, pos, values)
+        else:
+            for index, (name, kind, default) in enumerate(layout.fields):
+                if index < count:
+                    values[name], pos = kind.read(data, pos)
+                else:
+                    values[name] = default_value(default)
+
+        for number in range(known + 1, self.version + 1):
+            upgrade = self.versions[number - 1].upgrade
+            if upgrade is not None:
+                values = upgrade(values)
+        return values
+
+    def current_reader(self):
+        """
+        :return: function taking (data, pos) of a record's first field in the current layout and returning a new object
+        """
+
+        if self.reader is None:
+            self.reader = self.compile_reader()
+        return self.reader
+
+    def compile_reader(self):
+        """
+        Generates the reader for the current layout, in the way collections.namedtuple builds its class.
+        Varints, enums and strings that fit a one byte length are read inline, each run of Fixed fields is one
+        struct call and the object is filled in directly, with no dict of values between the two.
+        """
+
+        layout = self.versions[-1]
+        probe = self.cls.__new__(self.cls)
+        namespace = {"new": self.cls.__new__, "cls": self.cls, "read_varint": read_varint, "intern": sys.intern,
+                     "INT": INT}
+        lines = ["def read(data, pos):"]
+        # Attribute names in the order their values are assigned to v0, v1...
+        names = []
+
+        for number, (name, kind) in enumerate(layout.segments):
+            if isinstance(kind, struct.Struct):
+                targets = ["v{}".format(len(names) + x) for x in range(len(name))]
+                names.extend(name)
+                namespace["s{}".format(number)] = kind.unpack_from
+                lines.append("    {}, = s{}(data, pos)".format(", ".join(targets), number))
+                lines.append("    pos += {}".format(kind.size))
+                continue
+
+            target = "v{}".format(len(names))
+            names.append(name)
+            namespace["k{}".format(number)] = kind.read
+
+            if isinstance(kind, (Int, EnumOf)):
+                lines += ["    byte = data[pos]",
+                          "    if byte < 0x80:",
+                          "        {} = (byte >> 1) ^ -(byte & 1)".format(target),
+                          "        pos += 1",
+                          "    else:",
+                          "        {}, pos = INT.read(data, pos)".format(target)]
+                if isinstance(kind, EnumOf):
+                    namespace["e{}".format(number)] = kind.enum
+                    lines.append("    {0} = e{1}({0})".format(target, number))
+            elif isinstance(kind, Str):
+                lines += ["    length = data[pos]",
+                          "    if length < 0x80:",
+                          "        pos += 1",
+                          "    else:",
+                          "        length, pos = read_varint(data, pos)",
+                          "    {} = str(data[pos:pos + length], 'utf-8')".format(target),
+                          "    pos += length"]
+                if kind.intern:
+                    lines.append("    {0} = intern({0})".format(target))
+            else:
+                lines.append("    {}, pos = k{}(data, pos)".format(target, number))
+
+        lines.append("    obj = new(cls)")
+        if hasattr(probe, "__dict__"):
+            lines.append("    obj.__dict__.update({{{}}})".format(
+                ", ".join("{!r}: v{}".format(name, index) for index, name in enumerate(names))))
+        else:
+            for index, name in enumerate(names):
+                lines.append("    setattr(obj, {!r}, v{})".format(name, index) if keyword.iskeyword(name)
+                             or not name.isidentifier() else "    obj.{} = v{}".format(name, index))
+        lines.append("    return obj")
+
+        exec("\n".join(lines), namespace)
+        return namespace["read"]
+
+    def create(self, values):
+        """
+        :return: a new instance of cls with the given attributes, made without calling cls.__init__
+        """
+
+        obj = self.cls.__new__(self.cls)
+        if hasattr(obj, "__dict__"):
+            obj.__dict__.update(values)
+        else:
+            for name, value in values.items():
+                setattr(obj, name, value)
+        return obj
+
+
+class RecordList:
+    """
+    Codec for a list of objects sharing a schema, such as every pokemon a user owns.
+    The version and field count are written once for the whole list, and the records
+    are compressed together since they repeat much of each other's data.
+    Each record is length prefixed, so iterate() can decode them one at a time.
+    """
+
+    def __init__(self, schema, level=1):
+        self.schema = schema
+        # zlib compression level
+        self.level = level
+
+    def encode(self, items, version=None):
+        version = version or self.schema.version
+        body = bytearray()
+        write_varint(body, len(items))
+        record = bytearray()
+        for item in items:
+            del record[:]
+            self.schema.write_fields(record, item, version)
+            write_varint(body, len(record))
+            body += record
+
+        out = bytearray([MAGIC])
+        write_varint(out, version)
+        write_varint(out, len(self.schema.versions[version - 1].fields))
+        out += zlib.compress(body, self.level)
+        return bytes(out)
+
+    def decode(self, data):
+        return list(self.iterate(data))
+
+    def iterate(self, data):
+        """
+        Decodes each object only as the caller reaches it
+        """
+
+        if data[0] != MAGIC:
+            raise ValueError("Not a list of {} records".format(self.schema.cls.__name__))
+        version, pos = read_varint(data, 1)
+        count, pos = read_varint(data, pos)
+        body = memoryview(zlib.decompress(data[pos:]))
+
+        length, pos = read_varint(body, 0)
+        schema = self.schema
+        layout = schema.versions[-1]
+        if version == schema.version and count == len(layout.fields):
+            # Records in the current layout need no upgrade, so skip straight to their fields
+            reader = schema.current_reader()
+            for x in range(length):
+                size, pos = read_varint(body, pos)
+                yield reader(body, pos)
+                pos += size
+            return
+
+        for x in range(length):
+            size, pos = read_varint(body, pos)
+            yield schema.create(schema.read_fields(body[pos:pos + size], 0, version, count))
+            pos += size
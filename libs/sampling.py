@@ -0,0 +1,55 @@
+import random
+
+
+class AliasTable:
+    """
+    Samples indexes 0..n-1 in proportion to a list of weights in constant time (Vose's alias method).
+    Building the table takes O(n); each sample then costs two random numbers and a lookup.
+    """
+
+    def __init__(self, weights):
+        """
+        :param weights: list of non-negative weights, at least one of which is positive
+        """
+
+        count = len(weights)
+        total = float(sum(weights))
+        if count == 0 or total <= 0:
+            raise ValueError("An alias table needs at least one positive weight")
+
+        # Probability of keeping each column's own index rather than taking its alias
+        self.probability = [1.0] * count
+        self.alias = list(range(count))
+
+        scaled = [weight * count / total for weight in weights]
+        small = [index for index, value in enumerate(scaled) if value < 1]
+        large = [index for index, value in enumerate(scaled) if value >= 1]
+
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = (scaled[more] + scaled[less]) - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Whatever is left over is a rounding error away from exactly 1
+        for index in small + large:
+            self.probability[index] = 1.0
+
+    def __len__(self):
+        return len(self.alias)
+
+    def sample(self, rng=random):
+        """
+        :param rng: source of random numbers, such as a random.Random
+        :return: an index chosen in proportion to its weight
+        """
+
+        column = int(rng.random() * len(self.alias))
+        if rng.random() < self.probability[column]:
+            return column
+        return self.alias[column]
@@ -0,0 +1,253 @@
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+
+# The Scheduler shared by every plugin within this process
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler():
+    """
+    Returns the process-wide Scheduler, creating it on first use.
+    Plugins should use this rather than starting their own threads for timed work.
+    :return Scheduler: the shared scheduler
+    """
+
+    global _shared_scheduler
+
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = Scheduler()
+        return _shared_scheduler
+
+
+class Job:
+    """
+    A function run once by the scheduler. Subclasses decide when, if ever, it runs again.
+    """
+
+    def __init__(self, scheduler, function):
+        self.scheduler = scheduler
+        self.function = function
+        # Time the job is next due, or None while it is running or finished
+        self.deadline = None
+        self.cancelled = False
+
+    def run(self):
+        self.function()
+
+    def next_deadline(self, now):
+        """
+        :return: the time the job should run next, or None if it is done
+        """
+
+        return None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def reschedule(self, delay):
+        """
+        Moves the job to run delay seconds from now instead of when it was due
+        """
+
+        self.cancelled = False
+        self.scheduler.push(self, time.time() + delay)
+
+
+class FixedRateJob(Job):
+    """
+    Runs every interval seconds, measured between scheduled start times.
+    Runs missed while the job was busy are skipped rather than run back to back.
+    """
+
+    def __init__(self, scheduler, function, interval):
+        super().__init__(scheduler, function)
+        self.interval = interval
+        self.due = None
+
+    def next_deadline(self, now):
+        self.due += self.interval
+        if self.due <= now:
+            self.due += ((now - self.due) // self.interval + 1) * self.interval
+        return self.due
+
+
+class JitteredJob(Job):
+    """
+    Runs again a random number of seconds between low and high after each run finishes
+    """
+
+    def __init__(self, scheduler, function, low, high):
+        super().__init__(scheduler, function)
+        self.low = low
+        self.high = high
+
+    def next_deadline(self, now):
+        return now + random.uniform(self.low, self.high)
+
+
+class CronJob(Job):
+    """
+    Runs at the given minute of every hour, or of only the given hours (local time)
+    """
+
+    def __init__(self, scheduler, function, minute=0, hours=None):
+        super().__init__(scheduler, function)
+        self.minute = minute
+        self.hours = set(hours) if hours is not None else None
+
+    def next_deadline(self, now):
+        after = datetime.fromtimestamp(now)
+        candidate = after.replace(minute=self.minute, second=0, microsecond=0)
+        if candidate <= after:
+            candidate += timedelta(hours=1)
+        while self.hours is not None and candidate.hour not in self.hours:
+            candidate += timedelta(hours=1)
+        return candidate.timestamp()
+
+
+class StepsJob(Job):
+    """
+    Drives a generator that yields the number of seconds to wait before it is resumed.
+    Lets a long running sequence pause between steps without holding a worker thread.
+    """
+
+    def __init__(self, scheduler, steps):
+        super().__init__(scheduler, None)
+        self.steps = steps
+        self.delay = None
+
+    def run(self):
+        # Left as None if the generator raises, which ends the job
+        self.delay = None
+        try:
+            self.delay = next(self.steps)
+        except StopIteration:
+            self.delay = None
+
+    def next_deadline(self, now):
+        if self.delay is None:
+            return None
+        return now + self.delay
+
+
+class Scheduler:
+    """
+    Runs timed jobs from a min-heap of deadlines.
+    One dispatcher thread sleeps until the earliest deadline and hands due jobs to a small pool of workers.
+    A recurring job is only put back on the heap once its run has finished, so it never overlaps itself.
+    """
+
+    def __init__(self, workers=4):
+        self.heap = []
+        self.condition = threading.Condition(threading.Lock())
+        # Breaks ties between jobs due at the same time so the heap never compares jobs
+        self.counter = itertools.count()
+        self.ready = queue.Queue()
+
+        thread = threading.Thread(target = self.dispatch_loop)
+        thread.daemon = True
+        thread.start()
+
+        for x in range(workers):
+            thread = threading.Thread(target = self.worker_loop)
+            thread.daemon = True
+            thread.start()
+
+    def once(self, delay, function):
+        """
+        Runs function once, delay seconds from now
+        :return Job: the scheduled job
+        """
+
+        return self.push(Job(self, function), time.time() + delay)
+
+    def every(self, interval, function, delay=None):
+        """
+        Runs function every interval seconds, first after delay seconds (defaults to interval)
+        :return Job: the scheduled job
+        """
+
+        job = FixedRateJob(self, function, interval)
+        job.due = time.time() + (interval if delay is None else delay)
+        return self.push(job, job.due)
+
+    def jittered(self, low, high, function, delay=None):
+        """
+        Runs function repeatedly, waiting a random number of seconds between low and high after each run.
+        The first run happens after delay seconds, or a random wait if delay is None.
+        :return Job: the scheduled job
+        """
+
+        job = JitteredJob(self, function, low, high)
+        return self.push(job, time.time() + (random.uniform(low, high) if delay is None else delay))
+
+    def cron(self, function, minute=0, hours=None):
+        """
+        Runs function at the given minute of every hour, or of only the listed hours
+        :return Job: the scheduled job
+        """
+
+        job = CronJob(self, function, minute, hours)
+        return self.push(job, job.next_deadline(time.time()))
+
+    def steps(self, generator, delay=0):
+        """
+        Steps through generator, waiting however many seconds it yields between steps
+        :return Job: the scheduled job
+        """
+
+        return self.push(StepsJob(self, generator), time.time() + delay)
+
+    def push(self, job, deadline):
+        with self.condition:
+            job.deadline = deadline
+            heapq.heappush(self.heap, (deadline, next(self.counter), job))
+            self.condition.notify()
+        return job
+
+    def dispatch_loop(self):
+        with self.condition:
+            while True:
+                # Drops cancelled jobs and entries left behind by a reschedule
+                while self.heap and (self.heap[0][2].cancelled or self.heap[0][2].deadline != self.heap[0][0]):
+                    heapq.heappop(self.heap)
+
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                wait = self.heap[0][0] - time.time()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+                job = heapq.heappop(self.heap)[2]
+                job.deadline = None
+                self.ready.put(job)
+
+    def worker_loop(self):
+        while True:
+            job = self.ready.get()
+
+            try:
+                job.run()
+            except Exception:
+                print("Scheduler: A job raised an exception!")
+                traceback.print_exc()
+
+            with self.condition:
+                # A job that rescheduled or cancelled itself while running is left as it is
+                if job.cancelled or job.deadline is not None:
+                    continue
+            deadline = job.next_deadline(time.time())
+            if deadline is not None:
+                self.push(job, deadline)
@@ -1,8 +1,8 @@
 import os
-import pickle
 import random
 
-from libs.honorbank import HonorBank
+from libs.honorbank import shared_bank
+from libs.kvstore import shared_store
 from plugin import Plugin
 
 
@@ -26,7 +26,7 @@ class CafeGacha(Plugin):
         # A reference to the bot itself for more advanced operations
         self.bot = bot
         #
-        self.accounts = HonorBank()
+        self.accounts = shared_bank()
         #
         self.gacha_manager = GachaManager(self.dir)
 
@@ -42,7 +42,7 @@ class CafeGacha(Plugin):
 
         if self.accounts.get_funds(user) >= honor_spent:
             modifier = int(honor_spent / 1000)
-            self.accounts.charge(user, honor_spent)
+            self.accounts.charge(user, honor_spent, reason="gacha roll", source="CafeGacha")
 
             if modifier > 3:
                 modifier = 3
@@ -110,6 +110,8 @@ class GachaManager():
     def __init__(self, dir):
         self.dir = dir
         self.player_db = {}
+        # Persistent storage holding one record per player
+        self.store = shared_store().namespace("cafegacha")
         self.load()
         self.bronze_list = self.build_gacha("Bronze")
         self.silver_list = self.build_gacha("Silver")
@@ -143,9 +145,9 @@ class GachaManager():
 
         if gacha.name in self.player_db[username].keys():
             self.player_db[username][gacha.name] += 1
-            self.save()
-        self.player_db[username][gacha.name] = 1
-        self.save()
+        else:
+            self.player_db[username][gacha.name] = 1
+        self.save(username)
 
     def get_gacha(self, name):
         for item in self.bronze_list:
@@ -177,38 +179,22 @@ class GachaManager():
                     if item == name:
                         if self.player_db[user_from][item] >= 1:
                             self.player_db[user_from][item] -= 1
-                            self.player_db[user_to][item] += 1
-                            self.save()
+                            self.player_db[user_to][item] = self.player_db[user_to].get(item, 0) + 1
+                            with self.store.batch():
+                                self.save(user_from)
+                                self.save(user_to)
                             return True
         return False
 
-    # Saves players data from self.player_db
-    def save(self):
-        with open(self.dir + "/players.file", "wb") as f:
-            pickle.dump(self.player_db, f)
-            f.seek(0)
-            f.close()
+    # Saves a single player's data from self.player_db
+    def save(self, username):
+        self.store.put(username, self.player_db[username])
 
-    # Loads players data into self.player_db
+    # Loads players data into self.player_db, importing the old players.file on first run
     def load(self):
-        try:
-            if os.path.getsize(self.dir + "/players.file") > 0:
-                with open(self.dir + "/players.file", "rb") as f:
-                    self.player_db = pickle.load(f)
-                    f.seek(0)
-                    f.close()
-            print("CafeGacha: Users file successfully loaded!")
-        except FileNotFoundError:
-            if not os.path.exists(self.dir):
-                os.makedirs(self.dir)
-
-            # Ensures that the pokebank file is created.
-            with open(self.dir + "/players.file", "w+") as f:
-                f.write("")
-                f.seek(0)
-                f.close()
-            print("CafeGacha: No gacha file exists, creating a new one.")
-            self.player_db = {}
+        self.store.migrate_pickle(self.dir + "/players.file", lambda player_db: player_db.items())
+        self.player_db = dict(self.store.items())
+        print("CafeGacha: {} players successfully loaded!".format(len(self.player_db)))
 
 class Gacha():
     def __init__(self, name, uri):
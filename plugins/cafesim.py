@@ -3,13 +3,13 @@ import queue
 import os
 import random
 import socket
-import threading
 from struct import pack, unpack
 from enum import Enum
 
-from libs.honorbank import HonorBank
+from libs.honorbank import shared_bank
+from libs.outbox import shared_outbox
+from libs.scheduler import shared_scheduler
 from plugin import Plugin
-from time import sleep
 
 
 # Called when the bot loads the plugin
@@ -32,6 +32,8 @@ class CafeSim(Plugin):
         self.dir = data_dir
         # A reference to the bot itself for more advanced operations
         self.bot = bot
+        # Rate limited queue that sends alerts without blocking this plugin
+        self.outbox = shared_outbox(bot)
         # A set containing all channels in which to send alerts to
         self.channels = set()
         # An object containing actions users can perform
@@ -43,12 +45,10 @@ class CafeSim(Plugin):
         # Flag determining if the current action was successfully performed
         self.action_performed = False
         # Object utilized to save and store a user's score in honor
-        self.bank = HonorBank()
+        self.bank = shared_bank()
 
-        # Launches a deamon thread that handles alerts and random encounters
-        thread = threading.Thread(target = self.game_loop)
-        thread.daemon = True
-        thread.start()
+        # Steps through game_loop on the shared scheduler; it yields how long to wait before continuing
+        self.game_job = shared_scheduler().steps(self.game_loop(), delay=20)
 
     # Command to assign a user to a role
     def com_role(self, command):
@@ -85,14 +85,13 @@ class CafeSim(Plugin):
 
     # Loops and restarts the game based on the var start_time
     def game_loop(self):
-        sleep(20)
-        while threading.main_thread().is_alive():
+        while True:
             if len(self.channels) > 0:
-                self.game()
+                yield from self.game()
             start_time = random.randint(300,1200) # The amount of time until the next game begins
-            sleep(start_time)
+            yield start_time
 
-    # Handles the game stack and associated logic
+    # Handles the game stack and associated logic, yielding the seconds to wait between steps
     def game(self):
         action_queue = queue.Queue(10)
         roles = set()
@@ -113,9 +112,9 @@ class CafeSim(Plugin):
 
         # Messages chat channels the game's requirements
         self.message_channels(response)
-        sleep(20)
+        yield 20
         self.message_channels("CafeSim: Here we go!")
-        sleep(5)
+        yield 5
 
         # Runs until all actions have left the action_queue Queue 
         while not action_queue.empty():
@@ -127,7 +126,7 @@ class CafeSim(Plugin):
             self.action_performed = False
             self.current_task = Task(action.action_name, requirement, role)
             self.message_channels(action.trigger_message + "\n(A {} must perform:\n/csperform {} {})".format(role.name, action.action_name, requirement))
-            sleep(12)
+            yield 12
 
             # Determines if the action was performed. If not, then the score is penalized. 
             if self.action_performed:
@@ -139,7 +138,7 @@ class CafeSim(Plugin):
             # Resets current task and bool flag for the next action
             self.current_task = None
             self.action_performed = False
-            sleep(8)
+            yield 8
 
         # End of the game logic, rewards score and messages based on performance
         reward = int(reward_amount * performance_score)
@@ -147,16 +146,13 @@ class CafeSim(Plugin):
         self.message_channels("CafeSim:\n Performance score: {}\n Paying out {} honor to those that helped!".format(str(round(performance_score, 2)), str(reward)))
 
         for user in self.roles.keys():
-            if self.bank.account_exists(user):
-                self.bank.pay(user, reward)
-            else:
+            if not self.bank.account_exists(user):
                 self.bank.create_account(user)
-                self.bank.pay(user, reward)
+        self.bank.pay_many({user: reward for user in self.roles.keys()}, reason="cafe shift", source="CafeSim")
 
-    # Helper method that messages all channels within self.channels
+    # Helper method that queues a message to all channels within self.channels
     def message_channels(self, message):
-        for channel in self.channels:
-            self.bot.send_message(channel, message)
+        self.outbox.broadcast(self.channels, message)
 
     # Run whenever someone on telegram types one of these commands
     def on_command(self, command):
@@ -1,8 +1,11 @@
 import json
 import os
 import random
+import threading
+import time
 
-from libs.honorbank import HonorBank
+from libs.atomicfile import Debouncer, atomic_write
+from libs.honorbank import shared_bank
 from plugin import Plugin
 
 
@@ -31,7 +34,7 @@ class CafeTCG(Plugin):
             self.pack_manager = PackManager(self.cardlist)
             self.card_storage = CardManager(self.dir, self.cardlist)
             self.card_storage.update_accounts()
-            self.account_manager = HonorBank()
+            self.account_manager = shared_bank()
             # self.quest_manager = QuestManager(self.pack_manager)
         else:
             print("Error: CafeTCG: Could not load card data!")
@@ -79,7 +82,7 @@ class CafeTCG(Plugin):
         else:
             return "CafeTCG: Invalid pack name! Please enter /packs to see a list of available packs."
 
-        if self.account_manager.charge(command.user.username, charge_amount):
+        if self.account_manager.charge(command.user.username, charge_amount, reason="booster " + pack_name, source="CafeTCG"):
             card_pack = self.pack_manager.open_pack(pack_name)
             cards_drawn = "You spent 300 honor and drew... \n"
 
@@ -87,7 +90,6 @@ class CafeTCG(Plugin):
                 cards_drawn += "Name: " + card.name + "\n"
                 cards_drawn += "Rarity: " + card.rarity + "\n\n"
                 self.card_storage.add_card(command.user.username, card.name)
-            self.account_manager.save_accounts()
 
             return cards_drawn
         return command.user.username + ", your account doesn't possess enough funds!"
@@ -101,8 +103,7 @@ class CafeTCG(Plugin):
         if self.card_storage.remove_card(command.user.username, command.args):
             value = self.get_card(command.args).value
 
-            self.account_manager.pay(command.user.username, value)
-            self.account_manager.save_accounts()
+            self.account_manager.pay(command.user.username, value, reason="card sale", source="CafeTCG")
             return "Successfully sold a " + command.args + " for " + str(value) + " honor!"
         return "Failed to sell your " + command.args + ". It might not exist!"
 
@@ -138,6 +139,58 @@ class CafeTCG(Plugin):
     def check_balance(self, command):
         return self.account_manager.get_funds(command.user.username)
 
+    # Lists the accounts holding the most honor, and where the user ranks
+    def richest(self, command):
+        count = 10
+
+        if command.args:
+            try:
+                count = int(command.args)
+            except ValueError:
+                return "CafeTCG: Invalid command format! Please enter /richest [amount]"
+
+        if not 0 < count <= 50:
+            return "CafeTCG: Please enter an amount between 1 and 50!"
+
+        response = "CafeTCG: The richest players are:\n"
+        for position, (name, balance) in enumerate(self.account_manager.leaderboard(count), 1):
+            response += "{}. {} | {}\n".format(position, name, balance)
+
+        rank = self.account_manager.rank(command.user.username)
+        if rank is not None:
+            response += "\n{}, you are ranked #{}!".format(command.user.username, rank)
+        return response
+
+    # Lists the latest honor transactions of a user's account
+    def transaction_history(self, command):
+        name = command.user.username
+        count = 10
+
+        for part in command.args.split():
+            if part.startswith("@"):
+                name = part.strip("@")
+            else:
+                try:
+                    count = int(part)
+                except ValueError:
+                    return "CafeTCG: Invalid command format! Please enter /history [@user] [amount]"
+
+        if not 0 < count <= 20:
+            return "CafeTCG: Please enter an amount between 1 and 20!"
+        if not self.account_manager.account_exists(name):
+            return "CafeTCG: {} is not a registered player! Please register using /tcgregister".format(name)
+
+        transactions = self.account_manager.recent_transactions(name, count)
+        if not transactions:
+            return "CafeTCG: {} has no recorded transactions!".format(name)
+
+        response = "CafeTCG: {}'s latest transactions are:\n".format(name)
+        for transaction in transactions:
+            response += "{} | {:+} | {} ({})\n".format(time.strftime("%Y-%m-%d %H:%M", time.localtime(transaction.timestamp)),
+                                                   transaction.delta, transaction.reason or "unknown",
+                                                   transaction.source or "unknown")
+        return response
+
     # Sends honor to another user, subtracting that amount from the sender
     def make_payment(self, command):
         try:
@@ -159,14 +212,9 @@ class CafeTCG(Plugin):
         if not self.card_storage.account_exists(to_user) or not self.account_manager.account_exists(to_user):
             return "CafeTCG: {} is not a registered player! Please register using /tcgregister".format(to_user)
 
-        try:
-            if self.account_manager.charge(from_user, amount):
-                if self.account_manager.pay(to_user, amount):
-                    self.account_manager.save_accounts()
-                    return "CafeTCG: {} has paid {} honor to {}!".format(from_user, amount, to_user)
-                return "CafeTCG: Invalid amount of honor. Please enter something positive."
-        except TypeError:
-            return "CafeTCG: Invalid command format! Please enter /pay @user amount"
+        if self.account_manager.transfer(from_user, to_user, amount, reason="payment", source="CafeTCG"):
+            return "CafeTCG: {} has paid {} honor to {}!".format(from_user, amount, to_user)
+        return "CafeTCG: {}, your account doesn't possess {} honor!".format(from_user, amount)
 
     # Registers a user to use CafeTCG commands
     def register(self, command):
@@ -183,21 +231,17 @@ class CafeTCG(Plugin):
     # Get completion status of an accounts collection
     def completion_status(self, command):
         if self.card_storage.account_exists(command.user.username):
-            with open(self.dir + "/" + command.user.username + ".json", "r+") as f:
-                data = json.load(f)
-                total = len(data)
-                values = data.values()
-                count = 0
-
-                for item in values:
-                    if item >= 1:
-                        count += 1
+            data = self.card_storage.get_data(command.user.username)
+            total = len(data)
+            values = data.values()
+            count = 0
 
-                f.seek(0)
-                f.close()
+            for item in values:
+                if item >= 1:
+                    count += 1
 
-                return "CafeTCG: {}'s collection is {}% complete!".format(command.user.username.strip(".json"),
-                                                                 str(round((count / total) * 100, 3)))
+            return "CafeTCG: {}'s collection is {}% complete!".format(command.user.username.strip(".json"),
+                                                             str(round((count / total) * 100, 3)))
         return "CafeTCG: {} is not a registered player! Please register using /tcgregister"\
             .format(command.user.username)
 
@@ -224,23 +268,19 @@ class CafeTCG(Plugin):
 
     def missing_cards(self, command):
         if self.card_storage.account_exists(command.user.username):
-            with open(self.dir + "/" + command.user.username + ".json", "r+") as f:
-                data = json.load(f)
-                cards_needed = []
+            data = self.card_storage.get_data(command.user.username)
+            cards_needed = []
 
-                for card in data.keys():
-                    if data[card] == 0:
-                        cards_needed.append(card)
+            for card in data.keys():
+                if data[card] == 0:
+                    cards_needed.append(card)
 
-                f.seek(0)
-                f.close()
+            response = "You still need the following cards to complete your collection: \n"
 
-                response = "You still need the following cards to complete your collection: \n"
+            for card in cards_needed:
+                response += card + "\n"
 
-                for card in cards_needed:
-                    response += card + "\n"
-
-                return response
+            return response
 
         return "CafeTCG: {} is not a registered player! Please register using /tcgregister" \
             .format(command.user.username)
@@ -254,8 +294,7 @@ class CafeTCG(Plugin):
 
                 if self.account_manager.account_exists(name):
                     if amount > 0:
-                        self.account_manager.pay(name, amount)
-                        self.account_manager.save_accounts()
+                        self.account_manager.pay(name, amount, reason="award", source="CafeTCG")
                         return "CafeTCG: Payed {} {} honor!".format(name, amount)
                     return "CafeTCG: Please enter a positive amount!"
                 return "CafeTCG: {} is not a registered player! Please register using /tcgregister"
@@ -276,7 +315,6 @@ class CafeTCG(Plugin):
                 if self.account_manager.account_exists(name):
                     if not self.get_card(card_name) is None:
                         self.card_storage.add_card(name, card_name)
-                        self.account_manager.save_accounts()
                         return "CafeTCG: Gave {} a {}!".format(name, card_name)
                     return "CafeTCG: {} is not a valid card! Please enter another!".format(card_name)
                 return "CafeTCG: {} is not a registered player! Please register using /tcgregister".format(name)
@@ -302,7 +340,8 @@ class CafeTCG(Plugin):
                         value = self.get_card(key.name).value
                         total_cards += 1
                         total_value += value
-                        self.account_manager.pay(command.user.username, value)
+
+            self.account_manager.pay(command.user.username, total_value, reason="duplicate sale", source="CafeTCG")
 
             return "CafeTCG: You have sold {} card(s) for {} honor!".format(total_cards, total_value)
 
@@ -343,6 +382,10 @@ class CafeTCG(Plugin):
                 return {"type": "message", "message": self.trade_card(command)}
             elif command.command == "balance":
                 return {"type": "message", "message": self.check_balance(command)}
+            elif command.command == "richest":
+                return {"type": "message", "message": self.richest(command)}
+            elif command.command == "history":
+                return {"type": "message", "message": self.transaction_history(command)}
             elif command.command == "pay":
                 return {"type": "message", "message": self.make_payment(command)}
             elif command.command == "completion":
@@ -372,7 +415,7 @@ class CafeTCG(Plugin):
 
     def get_commands(self):
         return {"booster", "read", "sell", "collection", "trade",
-                "balance", "pay", "tcgregister", "completion", "packs",
+                "balance", "richest", "history", "pay", "tcgregister", "completion", "packs",
                 "changelog", "contents", "missing", "awardhonor", "awardcard",
                 "selldups", "makequest", "availablequests", "readquest", "completequest"}
 
@@ -386,6 +429,8 @@ class CafeTCG(Plugin):
                 "/collection \n" \
                 "/trade [@user] [cardname] \n" \
                 "/balance \n"\
+                "/richest [amount] \n" \
+                "/history [@user] [amount] \n" \
                 "/pay [@user] [amount] \n" \
                 "/tcgregister \n" \
                 "/completion \n" \
@@ -546,16 +591,39 @@ class CardManager:
     def __init__(self, directory, card_list):
         self.dir = directory
         self.card_list = card_list
+        # Collections read from disk, keyed by user name; changes are written back by self.saver
+        self.collections = {}
+        self.lock = threading.RLock()
+        # Bursts of card changes (booster packs, /selldups) are written once per user
+        self.saver = Debouncer(self.save, delay=1.0)
+
+    def path(self, name):
+        return self.dir + "/" + name + ".json"
+
+    # Returns the user's collection dict of card name to quantity, reading it from disk on first use
+    def get_data(self, name):
+        with self.lock:
+            if name not in self.collections:
+                with open(self.path(name), "r") as f:
+                    self.collections[name] = json.load(f)
+            return self.collections[name]
+
+    # Writes the collections of the given users to disk
+    def save(self, names):
+        for name in names:
+            with self.lock:
+                data = json.dumps(self.collections[name], sort_keys=True, indent=4)
+            atomic_write(self.path(name), data)
 
     def create_account(self, name):
-        with open(self.dir + "/" + name + ".json", "w+") as f:
-            data = {}
+        data = {}
 
-            for item in self.card_list:
-                data[item.name] = 0
+        for item in self.card_list:
+            data[item.name] = 0
 
-            json.dump(data, f, sort_keys=True, indent=4)
-            f.close()
+        with self.lock:
+            self.collections[name] = data
+        self.save([name])
 
     # Updates json data for user accounts when new card sets are added
     # IMPORTANT: IF A SET IS REMOVED ALL CARDS FROM THAT SET IN A USERS JSON DATA WILL BE REMOVED!
@@ -563,91 +631,68 @@ class CardManager:
         try:
             for file in os.listdir(self.dir):
                 if file.endswith(".json") and not file == "honor.json":
-                    with open(os.path.join(self.dir, file), "r+") as f:
+                    with open(os.path.join(self.dir, file), "r") as f:
                         old_data = json.load(f)
-                        new_data = {}
-
-                        for item in self.card_list:
-                            if item.name in old_data:
-                                new_data[item.name] = old_data[item.name]
-                            else:
-                                new_data[item.name] = 0
-
-                        f.seek(0)
-                        json.dump(new_data, f, sort_keys=True, indent=4)
-                        f.truncate()
-                        f.close()
+                    new_data = {}
+
+                    for item in self.card_list:
+                        if item.name in old_data:
+                            new_data[item.name] = old_data[item.name]
+                        else:
+                            new_data[item.name] = 0
+
+                    atomic_write(os.path.join(self.dir, file), json.dumps(new_data, sort_keys=True, indent=4))
         except NotADirectoryError:
             print("CafeTCG: Unable to open account card files!")
 
     def account_exists(self, name):
-        directory = self.dir + "/" + name + ".json"
+        if name in self.collections:
+            return True
+        directory = self.path(name)
         return os.path.isfile(directory) and os.path.getsize(directory) > 0
 
     def add_card(self, name, card_name):
-        with open(self.dir + "/" + name + ".json", "r+") as f:
-            data = json.load(f)
-
-            value = data[card_name]
-            value += 1
-            data[card_name] = value
-
-            f.seek(0)
-            json.dump(data, f, sort_keys=True, indent=4)
-            f.truncate()
-            f.close()
-            return True
+        with self.lock:
+            data = self.get_data(name)
+            data[card_name] += 1
+        self.saver.request(name)
+        return True
 
     def remove_card(self, name, card_name):
-        with open(self.dir + "/" + name + ".json", "r+") as f:
-            data = json.load(f)
+        with self.lock:
+            data = self.get_data(name)
 
             for card in self.card_list:
                 if card.name == card_name:
-                    value = data[card.name]
-                    if value > 0:
-                        value -= 1
-                        data[card.name] = value
-                        f.seek(0)
-                        json.dump(data, f, sort_keys=True, indent=4)
-                        f.truncate()
-                        f.close()
+                    if data[card.name] > 0:
+                        data[card.name] -= 1
+                        self.saver.request(name)
                         return True
-            f.seek(0)
-            f.close()
             return False
 
     def get_collection(self, name):
-        with open(self.dir + "/" + name + ".json", "r+") as f:
-            data = json.load(f)
-
-            collection = "Here is your collection: \n"
+        data = self.get_data(name)
 
-            for card in self.card_list:
-                value = data[card.name]
+        collection = "Here is your collection: \n"
 
-                if value > 0:
-                    collection += card.name + " | " + str(value) + "\n"
+        for card in self.card_list:
+            value = data[card.name]
 
-            f.seek(0)
-            f.close()
-            return collection
+            if value > 0:
+                collection += card.name + " | " + str(value) + "\n"
+        return collection
 
     def get_collection_list(self, name):
-        with open(self.dir + "/" + name + ".json", "r+") as f:
-            data = json.load(f)
+        data = self.get_data(name)
 
-            collection = {}
+        collection = {}
 
-            for card in self.card_list:
-                value = data[card.name]
-
-                if value > 0:
-                    collection[card] = value
+        for card in self.card_list:
+            value = data[card.name]
 
-            f.seek(0)
-            f.close()
-            return collection
+            if value > 0:
+                collection[card] = value
+        return collection
 
 
 """
@@ -828,7 +873,7 @@ class QuestManager:
                     if user_collection[requirement] >= requirement_quantity:
                         for x in range(requirement_quantity):
                             card_storage.remove_card(user, requirement)
-                        account_manager.pay(user, honor_reward)
+                        account_manager.pay(user, honor_reward, reason="quest reward", source="CafeTCG")
                         self.quests.remove(quest)
                         return "CafeTCG: Quest completed! You got {} honor for {} {}!".format(honor_reward, requirement_quantity, requirement)
                     return "CafeTCG: You do not possess enough of that card!"
@@ -838,7 +883,7 @@ class QuestManager:
                     reward_quantity = quest.reward["Quantity"]
                     requirement = quest.cost["Honor"]
 
-                    if account_manager.charge(user, requirement):
+                    if account_manager.charge(user, requirement, reason="quest cost", source="CafeTCG"):
                         for x in range(reward_quantity):
                             card_storage.add_card(user, card_reward)
                         self.quests.remove(quest)
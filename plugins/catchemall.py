@@ -1,14 +1,31 @@
+import copy
 import datetime
+import importlib.machinery
+import itertools
 import json
+import math
+import multiprocessing
 import os
-import pickle
 import random
 import socket
+import sys
 import threading
+import time
+import traceback
+import zlib
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
 from struct import pack, unpack
 
+from libs.atomicfile import Debouncer
+from libs.battlesim import simulate_odds
+from libs.kvstore import shared_store
+from libs.outbox import shared_outbox
+from libs.records import BOOL, FLOAT, INT, INT32, INT64, INTERNED, RecordList, Schema
+from libs.sampling import AliasTable
+from libs.scheduler import shared_scheduler
 from plugin import Plugin
-from time import sleep
 
 
 # Called when the bot loads the plugin
@@ -24,6 +41,13 @@ Version: v1.0.1.1
 """
 
 
+# Longest series /poke_tournament allows, since every pair of parties plays one
+MAX_TOURNAMENT_BEST_OF = 9
+
+# Number of pokemon listed per page by /poke_list and /poke_query, which keeps each page well under Telegram's 4096 characters
+BANK_PAGE_SIZE = 50
+
+
 # Main class of the plugin that handles all commands and interactions
 class CatchEmAll(Plugin):
     def __init__(self, data_dir, bot):
@@ -31,6 +55,8 @@ class CatchEmAll(Plugin):
         self.dir = data_dir
         # A reference to the bot itself for more advanced operations
         self.bot = bot
+        # Rate limited queue that sends alerts without blocking this plugin
+        self.outbox = shared_outbox(bot)
         # A set containing all channels in which to send alerts to
         self.channels = set()
         # A dict object containing all available pokemon encounters
@@ -45,11 +71,11 @@ class CatchEmAll(Plugin):
         self.npc_manager = NPCManager(self.dir, self.poke_manager)
         # A List containing all users who have battled an npc since the last encounter. Empties with every new encounter
         self.npc_cooldown = []
+        # The Tournament currently running, or the last one played
+        self.tournament = None
 
-        # Launches a deamon thread that handles alerts and random encounters
-        thread = threading.Thread(target = self.encounter)
-        thread.daemon = True
-        thread.start()
+        # Spawns random encounters every 300 to 2400 seconds on the shared scheduler
+        self.encounter_job = shared_scheduler().jittered(300, 2400, self.encounter, delay=20)
 
     # Adds a pokemon to a specific users personal pokemon bank (self.poke_bank)
     def com_catch(self, command):
@@ -88,29 +114,74 @@ class CatchEmAll(Plugin):
                 battle = Battle(user, "Wild Pokemon")
                 party = self.battle_manager.get_party(user)
 
-                response = battle.simulate_battle(party, encounter)
+                battle.simulate_battle(party, encounter)
                 self.battle_manager.heal_party(party)
-                self.poke_bank.save()
+                self.poke_bank.update_mons(party)
+                self.battle_manager.save_replay(battle, user)
+                self.poke_bank.save_user(user)
 
-                return response
+                return battle.summary() + REPLAY_HINT
             return "Catch em' All: An encounter does not exist for that pokemon!"
         return "Catch em' All: You have not made a party!"
 
-    # Lists all pokemon within a user's pokemon bank (dict) should they exist
+    # Lists a page of the pokemon within a user's bank, in bank order
     def com_list(self, command):
         user = command.user.username
+        page = 1
+
+        if command.args:
+            if not command.args.strip().isdigit():
+                return "Catch em' All: Invalid syntax - use /poke_list [page]"
+            page = int(command.args)
 
         if self.poke_bank.user_exists(user):
-            bank = self.poke_bank.user_list(user)
-            index = 0
-            message = "Here are the contents of {}'s bank\n".format(user)
-        
-            for pokemon in bank:
-                message += str(index) + ": " + pokemon.name + "| cp: " + str(pokemon.cp) + "\n"
-                index += 1
-            return message
+            return self.bank_page(user, "Here are the contents of {}'s bank".format(user), page)
         return "Catch em' All: You do not possess an account!"
 
+    # Lists a page of a user's pokemon sorted by cp, level or bank id, optionally only those of one species
+    def com_query(self, command):
+        user = command.user.username
+        sort = "cp"
+        order = None
+        page = 1
+        words = []
+
+        for item in (command.args or "").lower().split():
+            if item.isdigit():
+                page = int(item)
+            elif item in BankIndex.SORTS:
+                sort = item
+            elif item in ("asc", "desc"):
+                order = item
+            else:
+                words.append(item)
+
+        species = " ".join(words) or None
+        # Stats read best from the top, bank ids from the start
+        descending = order == "desc" if order else sort != "id"
+
+        if self.poke_bank.user_exists(user):
+            title = "Here are {}'s {} by {}".format(user, species or "pokemon", sort)
+            return self.bank_page(user, title, page, species, sort, descending)
+        return "Catch em' All: You do not possess an account!"
+
+    # Returns one page of a query on a user's bank, formatted for /poke_list and /poke_query
+    def bank_page(self, user, title, page, species=None, sort="id", descending=False):
+        if page < 1:
+            return "Catch em' All: Pages start from 1!"
+
+        total, mons = self.poke_bank.query(user, species, sort, descending, (page - 1) * BANK_PAGE_SIZE)
+        if total == 0:
+            return "Catch em' All: There are no pokemon to list!"
+        pages = (total + BANK_PAGE_SIZE - 1) // BANK_PAGE_SIZE
+        if page > pages:
+            return "Catch em' All: Pages for that list run from 1 to {}!".format(pages)
+
+        message = "{} (page {}/{})\n".format(title, page, pages)
+        for index, pokemon in mons:
+            message += str(index) + ": " + pokemon.name + "| cp: " + str(pokemon.cp) + " | lvl: " + str(pokemon.level) + "\n"
+        return message
+
     # Releases a pokemon from a users bank given a specific location within the bank (users find locations with /poke_list)
     def com_release(self, command):
         commands = command.args.split(" ")
@@ -260,10 +331,96 @@ class CatchEmAll(Plugin):
         if len(commands) == 1:
             challenger = commands[0]
             response = self.battle_manager.accept_battle(user, challenger)
-            self.poke_bank.save()
+            for party in (self.battle_manager.get_party(user), self.battle_manager.get_party(challenger)):
+                if party is not None:
+                    self.poke_bank.update_mons(party)
+            self.poke_bank.save_users(user, challenger)
             return response
         return "Catch em' All: Invalid syntax - use /poke_accept_battle [challenger_name]"
 
+    # Shows the full log of the last battle a user fought, a page at a time
+    def com_replay(self, command):
+        user = command.user.username
+        page = 1
+        commands = command.args.split(" ") if command.args else []
+
+        if len(commands) > 2:
+            return "Catch em' All: Invalid syntax - use /poke_replay [user] [page]"
+        for item in commands:
+            if item.isdigit():
+                page = int(item)
+            elif item != "":
+                user = item
+
+        battle = self.battle_manager.get_replay(user)
+        if battle is None:
+            return "Catch em' All: {} has not battled yet!".format(user)
+
+        pages = battle.log_pages()
+        if not 1 <= page <= len(pages):
+            return "Catch em' All: Pages for that replay run from 1 to {}!".format(len(pages))
+
+        response = "Catch em' All: {} vs {} (page {}/{})\n".format(battle.challenger, battle.opponent, page, len(pages))
+        return response + pages[page - 1]
+
+    # Estimates how a battle between the user's party and an opponent's party would go by simulating it many times
+    def com_odds(self, command):
+        user = command.user.username
+        commands = command.args.split(" ")
+
+        if len(commands) == 1 and commands[0] != "":
+            opponent = commands[0]
+
+            if self.battle_manager.has_party(user) and self.battle_manager.has_party(opponent):
+                # The user is the challenger, as when they post a battle against the opponent
+                try:
+                    odds = simulate_odds(self.battle_manager.get_party(user), self.battle_manager.get_party(opponent))
+                except OverflowError:
+                    # Stats too large for the vectorized simulation are played out one battle at a time instead
+                    try:
+                        odds = play_odds(user, opponent, self.battle_manager.get_party(user),
+                                         self.battle_manager.get_party(opponent))
+                    except OverflowError:
+                        return "Catch em' All: Cannot simulate! These parties' stats are too large to battle!"
+                response = "Catch em' All: Out of {} simulated battles against {}:\n".format(odds["runs"], opponent)
+                response += "{} wins {:.1%}\n".format(user, odds["challenger"])
+                response += "{} wins {:.1%}\n".format(opponent, odds["opponent"])
+                response += "Ties {:.1%}\n".format(odds["draw"])
+                response += "Battles last {:.1f} turns on average".format(odds["turns"])
+                return response
+            return "Catch em' All: Cannot simulate! Either you or your opponent has not created a party!"
+        return "Catch em' All: Invalid syntax - use /poke_odds [opponent_name]"
+
+    # Starts a tournament between every formed party, announcing the results in every enabled channel when it ends
+    def com_tournament(self, command):
+        if self.tournament is not None and self.tournament.is_running():
+            return "Catch em' All: A tournament is already running! Use /poke_tournament_status to check on it"
+
+        best_of = 3
+        if command.args:
+            try:
+                best_of = int(command.args)
+            except ValueError:
+                return "Catch em' All: Invalid syntax - [best_of] must be an integer!"
+            if not 1 <= best_of <= MAX_TOURNAMENT_BEST_OF:
+                return "Catch em' All: Invalid syntax - [best_of] must be between 1 and {}!".format(MAX_TOURNAMENT_BEST_OF)
+
+        if len(self.battle_manager.parties) < 2:
+            return "Catch em' All: At least two trainers need a party to hold a tournament!"
+
+        self.tournament = Tournament(self.battle_manager.parties, best_of)
+        self.tournament.start(lambda tournament: self.outbox.broadcast(self.channels, tournament.summary()))
+        return "Catch em' All: A tournament between {} parties has begun! Every party plays every other, best of {}.".format(
+            len(self.tournament.parties), best_of)
+
+    # Reports the progress of the running tournament, or the results of the last one
+    def com_tournament_status(self, command):
+        if self.tournament is None:
+            return "Catch em' All: No tournament has been held! Use /poke_tournament to start one"
+        if self.tournament.is_running():
+            return self.tournament.progress()
+        return self.tournament.summary()
+
     # If the user has a party, they then battle an npc based on a provided difficulty
     def com_battle_npc(self, command):
         user = command.user.username
@@ -278,36 +435,38 @@ class CatchEmAll(Plugin):
             if self.battle_manager.has_party(user):
                 battle = Battle(user, npc.name)
                 self.npc_cooldown.append(user)
-                response = battle.simulate_battle(self.battle_manager.get_party(user), npc.party)
+                battle.simulate_battle(self.battle_manager.get_party(user), npc.party)
                 self.battle_manager.heal_party(self.battle_manager.get_party(user))
-                return response
+                self.poke_bank.update_mons(self.battle_manager.get_party(user))
+                self.battle_manager.save_replay(battle, user)
+                self.poke_bank.save_user(user)
+                return battle.summary() + REPLAY_HINT
             return "Catch em' All: You have not made a party"
         return "Catch em' All: Invalid syntax - use /poke_battle_npc [0-7]"
 
     # Randomly creates a pokemon encounter and alerts all available chat channels
     def encounter(self):
-        sleep(20)
-        while threading.main_thread().is_alive():
-            spawn_time = random.randint(300,2400)
-            response = "Catch em' All: There are wild pokemon about!:\n"
-
-            if len(self.current_encounter.keys()) < 10:
-                rand_spawn = random.randint(3,6)
-            
-                for x in range(rand_spawn):
-                    poke = self.poke_manager.generate_pokemon()
-                    poke.force_level(random.randint(0,15))
-                    self.current_encounter[poke.name.lower()] = poke
+        response = "Catch em' All: There are wild pokemon about!:\n"
+
+        if len(self.current_encounter.keys()) < 10:
+            rand_spawn = random.randint(3,6)
+            # Encounters are shared by every channel, so each wave spawns in the biome of one of them
+            biome = None
+            if len(self.channels) > 0:
+                biome = self.poke_manager.channel_biome(random.choice(list(self.channels)))
+        
+            for x in range(rand_spawn):
+                poke = self.poke_manager.generate_pokemon(biome)
+                poke.force_level(random.randint(0,15))
+                self.current_encounter[poke.name.lower()] = poke
 
-            for name in self.current_encounter.keys():
-                poke = self.current_encounter[name]
-                response += "{} (cp:{})\n".format(poke.name, str(poke.cp))
+        for name in self.current_encounter.keys():
+            poke = self.current_encounter[name]
+            response += "{} (cp:{})\n".format(poke.name, str(poke.cp))
 
-            self.npc_cooldown.clear()
+        self.npc_cooldown.clear()
 
-            for channel in self.channels:
-                self.bot.send_message(channel, response)
-            sleep(spawn_time)
+        self.outbox.broadcast(self.channels, response)
 
     # Determines if a user missed a catch :B1:
     def check_miss(self):
@@ -334,6 +493,8 @@ class CatchEmAll(Plugin):
             return {"type": "message", "message": self.com_fight(command)}
         elif command.command == "poke_list":
             return {"type": "message", "message": self.com_list(command)}
+        elif command.command == "poke_query":
+            return {"type": "message", "message": self.com_query(command)}
         elif command.command == "poke_release":
             return {"type": "message", "message": self.com_release(command)}
         elif command.command == "poke_stat":
@@ -356,12 +517,21 @@ class CatchEmAll(Plugin):
             return {"type": "message", "message": self.com_battle_npc(command)}
         elif command.command == "poke_grant_level":
             return {"type": "message", "message": self.com_grant_level(command)}
+        elif command.command == "poke_odds":
+            return {"type": "message", "message": self.com_odds(command)}
+        elif command.command == "poke_replay":
+            return {"type": "message", "message": self.com_replay(command)}
+        elif command.command == "poke_tournament":
+            return {"type": "message", "message": self.com_tournament(command)}
+        elif command.command == "poke_tournament_status":
+            return {"type": "message", "message": self.com_tournament_status(command)}
 
     # Commands that are enabled on the server. These are what triggers actions on this plugin
     def get_commands(self):
-        return {"poke_enable", "poke_disable", "catch", "fight", "poke_list", "poke_release", "poke_stat",\
+        return {"poke_enable", "poke_disable", "catch", "fight", "poke_list", "poke_query", "poke_release", "poke_stat",\
                 "poke_trade", "poke_grant", "poke_form_party", "poke_view_party", "poke_post",\
-                "poke_rm_post", "poke_accept_battle", "poke_battle_npc", "poke_grant_level"}
+                "poke_rm_post", "poke_accept_battle", "poke_battle_npc", "poke_grant_level", "poke_odds",\
+                "poke_tournament", "poke_tournament_status", "poke_replay"}
 
     # Returns the name of the plugin
     def get_name(self):
@@ -373,7 +543,8 @@ class CatchEmAll(Plugin):
                 '/poke_disable' to disable alerts in this channel\n,\
                 '/catch [poke_name]' to catch a pokemon \n,\
                 '/fight [poke_name]' to fight the current encounter \n,\
-                '/poke_list' to see pokemon you've caught and their bank location\n,\
+                '/poke_list [page]' to see pokemon you've caught and their bank location\n,\
+                '/poke_query [cp|level|id] [asc|desc] [species] [page]' to sort and search the pokemon you've caught\n,\
                 '/poke_release [bank_id]' to release a pokemon you've caught\n,\
                 '/poke_stat [bank_id] to view stats on a pokemon you've caught\n,\
                 '/poke_trade [receiver] [bank_id] to trade a pokemon you own\n,\
@@ -383,6 +554,10 @@ class CatchEmAll(Plugin):
                 '/poke_post [opponent_name]\n,\
                 '/poke_rm_post\n,\
                 '/poke_accept_battle [challenger_name]\n,\
+                '/poke_odds [opponent_name] to see your chances against an opponent's party\n,\
+                '/poke_replay [user] [page] to see every turn of the last battle a user fought\n,\
+                '/poke_tournament [best_of] to start a tournament between every party\n,\
+                '/poke_tournament_status to see how the tournament is going\n,\
                 '/poke_battle_npc [difficulty between 0-7]"
 
 
@@ -525,6 +700,18 @@ class BattleManager:
         self.dir = dir
         self.parties = {}
         self.battles = {}
+        # Persistent storage holding the last battle each user fought, for replays
+        self.replays = shared_store().namespace("catchemall.replays", ReplayCodec())
+
+    # Stores a simulated battle as the last battle fought by each of the given users
+    def save_replay(self, battle, *users):
+        with self.replays.batch():
+            for user in users:
+                self.replays.put(user, battle)
+
+    # Returns the last Battle the user fought, or None if they have not battled
+    def get_replay(self, user):
+        return self.replays.get(user)
 
     # Stores a pokemon party within the dict self.parties, only one party per user
     # Sets the value in the dictionary to a list of 1 to 6 pokemon
@@ -592,7 +779,8 @@ class BattleManager:
                     self.heal_party(challenger_party)
                     self.heal_party(opponent_party)
                     # Simulate battle
-                    results = battle.simulate_battle(challenger_party, opponent_party)
+                    battle.simulate_battle(challenger_party, opponent_party)
+                    self.save_replay(battle, user, opponent)
 
                     # Heal both parties
                     self.heal_party(challenger_party)
@@ -601,20 +789,78 @@ class BattleManager:
                     # Remove the battle
                     self.battles.pop(opponent)
 
-                    return results
+                    return battle.summary() + REPLAY_HINT
                 return "Catch em' All: You are not the opponent for this battle!"
             return "Catch em' All: Cannot battle! Either you or your opponent has not created a party!"
         return "Catch em' All: A battle with that challenger does not exist!"
 
+# Kinds of event recorded while simulating a battle
+# Each event is a tuple of its kind followed by the values noted beside it
+class BattleEvent(Enum):
+    # ()
+    start = 0
+    # (challenger's pokemon, opponent's pokemon)
+    send_out = 1
+    # (defending pokemon, attacking pokemon)
+    dodge = 2
+    # (defending pokemon, damage, attacking pokemon)
+    counter = 3
+    # (attacking pokemon)
+    crit = 4
+    # (attacking pokemon, damage, defending pokemon)
+    attack = 5
+    # ()
+    double_ko = 6
+    # (trainer, fainted pokemon, winning pokemon, xp)
+    faint = 7
+    # (trainer, pokemon)
+    level_up = 8
+    # (challenger's pokemon left, opponent's pokemon left)
+    remaining = 9
+    # ()
+    tie = 10
+    # (trainer)
+    blackout = 11
+    # (winner)
+    end = 12
+
+
+# Events shown in a battle's summary, which is what gets sent to chat
+SUMMARY_EVENTS = {BattleEvent.start, BattleEvent.double_ko, BattleEvent.faint, BattleEvent.level_up, BattleEvent.tie,
+                  BattleEvent.blackout, BattleEvent.end}
+
+# Ends every battle summary sent to chat
+REPLAY_HINT = "\nUse '/poke_replay' to see the full battle!"
+
+
+# Stores a Battle's trainers and events as compressed JSON for KVStore
+class ReplayCodec:
+    def encode(self, battle):
+        events = [[event[0].value] + list(event[1:]) for event in battle.events]
+        return zlib.compress(json.dumps([battle.challenger, battle.opponent, events]).encode("utf-8"), 6)
+
+    def decode(self, data):
+        challenger, opponent, events = json.loads(zlib.decompress(data).decode("utf-8"))
+        battle = Battle(challenger, opponent, [(BattleEvent(event[0]),) + tuple(event[1:]) for event in events])
+        if battle.events and battle.events[-1][0] == BattleEvent.end:
+            battle.winner = battle.events[-1][1]
+        return battle
+
+
 # Holds information on battles and simulates them
 # challenger is the user who created the battle
 # opponent is the user who is being challenged and must choose to accept it
 class Battle:
-    def __init__(self, challenger, opponent):
+    def __init__(self, challenger, opponent, events=None):
         self.challenger = challenger
         self.opponent = opponent
+        # The challenger, the opponent or "No one" once the battle has been simulated
+        self.winner = None
+        # List of (BattleEvent, values...) tuples describing everything that occurred in the battle
+        self.events = events if events is not None else []
 
     # Simulates a pokemon battle between two parties
+    # Returns the list of events, which can be rendered with full_log or summary
     def simulate_battle(self, challenger_party, opponent_party):
         # Holds the index of the current pokemon used for battle within the chalenger_party list
         challenge_index = 0
@@ -622,8 +868,9 @@ class Battle:
         opponent_index = 0
         # Holds a String of the winner of the match
         winner = None
-        # Holds a log of everything that occurs within the battle
-        battle_log = "The battle between {} and {} commences!\n".format(self.challenger, self.opponent)
+        # Holds a record of everything that occurs within the battle
+        events = self.events
+        events.append((BattleEvent.start,))
 
         # Checks if the index for both pokemon lists is out of bounds
         # The battle continues until one trainer's index exceeds the length of their pokemon list (i.e. challenger_party or opponent_party)
@@ -635,31 +882,31 @@ class Battle:
             # Determines turn order, who attacks first and who is defending
             current_attacker, current_defender = self.compare_speed(challenge_mon, opponent_mon)
             
-            battle_log += "{} sends out {}, while {} sends out {}!\n".format(self.challenger, challenge_mon.name, self.opponent, opponent_mon.name)
+            events.append((BattleEvent.send_out, challenge_mon.name, opponent_mon.name))
 
             # Battle loop that runs until either the current_hp of either the
             # challenger_mon Pokemon or the opponent_mon is less-than or equal to 0
             while challenge_mon.current_hp > 0 and opponent_mon.current_hp > 0:
                 # Checks if the current_defender Pokemon manages to dodge this attack
                 if self.check_dodge(current_attacker.attack, current_defender.speed):
-                    battle_log += "{} managed to dodge {}'s attack!\n".format(current_defender.name, current_attacker.name)
+                    events.append((BattleEvent.dodge, current_defender.name, current_attacker.name))
                     
                     # Checks if after a dodge, the current_defender is able to deal counter damage to the current_attacker
                     if self.check_counter(current_attacker.attack, current_defender.attack):
                         damage = int(self.calculate_damage(current_defender, current_attacker)/2)
                         current_attacker.current_hp -= damage
-                        battle_log += "Woah! {} was prepared and countered the attack dealing {} to {}!\n".format(current_defender.name, str(damage), current_attacker.name)
+                        events.append((BattleEvent.counter, current_defender.name, damage, current_attacker.name))
                 else:
                     # Since the defender failed to dodge, the current_attacker will deal damage to the current_defender
                     damage = self.calculate_damage(current_attacker, current_defender)
 
                     # Checks to see if the current_attacker deals a critical blow dealing x2 damage
                     if self.check_crit():
-                        battle_log += "Uh oh, {} is charging its power!\n".format(current_attacker.name)
+                        events.append((BattleEvent.crit, current_attacker.name))
                         damage *= 2
                     
                     current_defender.current_hp -= damage
-                    battle_log += "{} deals {} to {}!\n".format(current_attacker.name, str(damage), current_defender.name)
+                    events.append((BattleEvent.attack, current_attacker.name, damage, current_defender.name))
 
                 # Swap attacker and defender for next turn
                 temp = current_defender
@@ -669,7 +916,7 @@ class Battle:
             # Checks if both pokemon failed during the battle, incrementing both
             # challenge_index and opponent_index
             if challenge_mon.current_hp <= 0 and opponent_mon.current_hp <= 0:
-                battle_log += "Oh no, both Pokemon fainted! The Pokemon KO'd each other!\n"
+                events.append((BattleEvent.double_ko,))
                 challenge_index += 1
                 opponent_index += 1
             else:
@@ -679,37 +926,89 @@ class Battle:
                     # Opponent pokemon won
                     xp = self.calculate_xp(opponent_mon, challenge_mon)
                     challenge_index += 1
-                    battle_log += "{}'s {} fainted! {} gained {} xp!\n".format(self.challenger, challenge_mon.name, opponent_mon.name, str(xp))
+                    events.append((BattleEvent.faint, self.challenger, challenge_mon.name, opponent_mon.name, xp))
                 
                     if opponent_mon.grant_xp(xp):
-                        battle_log += "Woah! {}'s {} leveled up!\n".format(self.opponent, opponent_mon.name)
+                        events.append((BattleEvent.level_up, self.opponent, opponent_mon.name))
                 else:
                     # Challenger pokemon won
                     xp = self.calculate_xp(challenge_mon, opponent_mon)
                     opponent_index += 1
-                    battle_log += "{}'s {} fainted! {} gained {} xp!\n".format(self.opponent, opponent_mon.name, challenge_mon.name, str(xp))
+                    events.append((BattleEvent.faint, self.opponent, opponent_mon.name, challenge_mon.name, xp))
                     
                     if challenge_mon.grant_xp(xp):
-                        battle_log += "Woah! {}'s {} leveled up!\n".format(self.challenger, challenge_mon.name)
+                        events.append((BattleEvent.level_up, self.challenger, challenge_mon.name))
 
-            battle_log += "{} has {} pokemon left, while {} has {} pokemon left!\n\n".format(self.challenger, int(len(challenger_party) - challenge_index), self.opponent, int(len(opponent_party) - opponent_index))
+            events.append((BattleEvent.remaining, len(challenger_party) - challenge_index, len(opponent_party) - opponent_index))
 
         # The battle has concluded
         # Checks to see if both users have run out of usable pokemon, if so it labels this battle as a draw
         if challenge_index == len(challenger_party) and opponent_index == len(opponent_party):
-            battle_log += "Both trainers are out of usable pokemon! It's a tie!\n"
+            events.append((BattleEvent.tie,))
             winner = "No one"
         else:
             # Checks if the challenger is out of usable pokemon and labels this battle's winner as the opponent
             if challenge_index == len(challenger_party):
                 winner = self.opponent
-                battle_log += "{} is out of usable pokemon! They blacked out!\n".format(self.challenger)
+                events.append((BattleEvent.blackout, self.challenger))
             else:
                 winner = self.challenger
-                battle_log += "{} is out of usable pokemon! They blacked out!\n".format(self.opponent)
-
-        battle_log += "The battle has concluded! {} is the winner!".format(winner)
-        return battle_log
+                events.append((BattleEvent.blackout, self.opponent))
+
+        events.append((BattleEvent.end, winner))
+        self.winner = winner
+        return events
+
+    # Returns a line of text describing a single event
+    def render_event(self, event):
+        kind = event[0]
+
+        if kind == BattleEvent.start:
+            return "The battle between {} and {} commences!\n".format(self.challenger, self.opponent)
+        elif kind == BattleEvent.send_out:
+            return "{} sends out {}, while {} sends out {}!\n".format(self.challenger, event[1], self.opponent, event[2])
+        elif kind == BattleEvent.dodge:
+            return "{} managed to dodge {}'s attack!\n".format(event[1], event[2])
+        elif kind == BattleEvent.counter:
+            return "Woah! {} was prepared and countered the attack dealing {} to {}!\n".format(event[1], event[2], event[3])
+        elif kind == BattleEvent.crit:
+            return "Uh oh, {} is charging its power!\n".format(event[1])
+        elif kind == BattleEvent.attack:
+            return "{} deals {} to {}!\n".format(event[1], event[2], event[3])
+        elif kind == BattleEvent.double_ko:
+            return "Oh no, both Pokemon fainted! The Pokemon KO'd each other!\n"
+        elif kind == BattleEvent.faint:
+            return "{}'s {} fainted! {} gained {} xp!\n".format(event[1], event[2], event[3], event[4])
+        elif kind == BattleEvent.level_up:
+            return "Woah! {}'s {} leveled up!\n".format(event[1], event[2])
+        elif kind == BattleEvent.remaining:
+            return "{} has {} pokemon left, while {} has {} pokemon left!\n\n".format(self.challenger, event[1], self.opponent, event[2])
+        elif kind == BattleEvent.tie:
+            return "Both trainers are out of usable pokemon! It's a tie!\n"
+        elif kind == BattleEvent.blackout:
+            return "{} is out of usable pokemon! They blacked out!\n".format(event[1])
+        elif kind == BattleEvent.end:
+            return "The battle has concluded! {} is the winner!".format(event[1])
+        return ""
+
+    # Returns the full play by play of the battle
+    def full_log(self):
+        return "".join(self.render_event(event) for event in self.events)
+
+    # Returns the full log split between lines into pages short enough to send as single messages
+    def log_pages(self, length=3900):
+        pages = [""]
+
+        for event in self.events:
+            line = self.render_event(event)
+            if pages[-1] and len(pages[-1]) + len(line) > length:
+                pages.append("")
+            pages[-1] += line
+        return pages
+
+    # Returns the knockouts, level ups and result of the battle, leaving out every attack
+    def summary(self):
+        return "".join(self.render_event(event) for event in self.events if event[0] in SUMMARY_EVENTS)
 
     # Calculates damage dealt to a pokemon
     def calculate_damage(self, attacker_poke, reciever_poke):
@@ -756,88 +1055,562 @@ class Battle:
         return random.randint(0,int(defender_atk / 3)) >= random.randint(0,attacker_atk)
     
 
+# Every party in the running tournament, copied into each tournament worker process when it starts
+tournament_parties = None
+
+# How tournament worker processes are started. Forking a bot that is running threads could leave a child holding a
+# lock that no thread in it will ever release, so workers are spawned fresh instead. A spawned worker imports this
+# module by name to find play_matchups, Battle and Pokemon, and re-runs the bot's entry script as __mp_main__, which
+# therefore needs an 'if __name__ == "__main__"' guard around starting the bot.
+TOURNAMENT_START_METHOD = "spawn"
+
+
+# Runs in each tournament worker process as it starts
+def init_tournament_worker(parties):
+    global tournament_parties
+    tournament_parties = parties
+
+
+# Runs in a tournament worker process
+# Plays a best of best_of series for every (user, user) pair in matchups
+# Returns a list of (user, user, first user's wins, second user's wins)
+def play_matchups(matchups, best_of):
+    results = []
+
+    for first, second in matchups:
+        wins = {first: 0, second: 0}
+        needed = best_of // 2 + 1
+
+        for game in range(best_of):
+            # Players take turns being the challenger, who attacks first when speeds are tied
+            challenger, opponent = (first, second) if game % 2 == 0 else (second, first)
+            # Every game is played on fresh copies at full health, so xp gained does not carry over
+            challenger_party = copy.deepcopy(tournament_parties[challenger])
+            opponent_party = copy.deepcopy(tournament_parties[opponent])
+            for poke in challenger_party + opponent_party:
+                poke.current_hp = poke.max_hp
+
+            battle = Battle(challenger, opponent)
+            battle.simulate_battle(challenger_party, opponent_party)
+            if battle.winner in wins:
+                wins[battle.winner] += 1
+            if max(wins.values()) >= needed:
+                break
+
+        results.append((first, second, wins[first], wins[second]))
+    return results
+
+
+# Number of battles played by play_odds, fewer than simulate_odds runs as each one is played out in full
+SLOW_ODDS_RUNS = 500
+
+
+# Plays runs battles between fresh full health copies of both parties, for parties simulate_odds cannot handle
+# Returns the same dict as simulate_odds
+def play_odds(challenger, opponent, challenger_party, opponent_party, runs=SLOW_ODDS_RUNS):
+    outcomes = {challenger: 0, opponent: 0, "No one": 0}
+    turns = 0
+
+    for run in range(runs):
+        challenger_copy = copy.deepcopy(challenger_party)
+        opponent_copy = copy.deepcopy(opponent_party)
+        for poke in challenger_copy + opponent_copy:
+            poke.current_hp = poke.max_hp
+
+        battle = Battle(challenger, opponent)
+        battle.simulate_battle(challenger_copy, opponent_copy)
+        outcomes[battle.winner] += 1
+        # Every turn ends in either a dodge or an attack
+        turns += sum(1 for event in battle.events if event[0] in (BattleEvent.dodge, BattleEvent.attack))
+
+    return {
+        "runs": runs,
+        "challenger": outcomes[challenger] / runs,
+        "opponent": outcomes[opponent] / runs,
+        "draw": outcomes["No one"] / runs,
+        "turns": turns / runs,
+    }
+
+
+# A round robin in which every party plays a best of N series against every other party
+# Matchups are played in a pool of worker processes, each holding its own copy of the parties,
+# so the live parties in the BattleManager are never changed
+class Tournament:
+    def __init__(self, parties, best_of=3, workers=None, chunk_size=16):
+        # Dictionary of users to a copy of their party as it was when the tournament was created
+        self.parties = copy.deepcopy(parties)
+        self.best_of = best_of
+        # Number of worker processes, one per CPU if None
+        self.workers = workers
+        # Number of matchups sent to a worker at a time
+        self.chunk_size = chunk_size
+        # List of every pair of users that play a series
+        self.matchups = list(itertools.combinations(sorted(self.parties.keys()), 2))
+        # Dictionary of (user, user) to a tuple of each user's wins in that series
+        self.results = {}
+        self.started = None
+        self.finished = None
+        # Set if the tournament could not be completed
+        self.error = None
+        # Called with this tournament once it completes
+        self.on_finish = None
+        # Process pool playing the matchups
+        self.pool = None
+        # Number of chunks of matchups yet to complete
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    # Starts playing the tournament and returns at once, calling on_finish with this tournament once it completes
+    # Chunks of matchups are handed to a pool of worker processes and recorded as each one returns, so no thread
+    # waits on the tournament. If worker processes could not import this module, the chunks are played one per
+    # step of a scheduler job instead.
+    def start(self, on_finish=None):
+        self.started = time.time()
+        self.on_finish = on_finish
+        chunks = [self.matchups[x:x + self.chunk_size] for x in range(0, len(self.matchups), self.chunk_size)]
+        self.pending = len(chunks)
+        if not chunks:
+            self.finish()
+            return
+
+        # Looked up on sys.path rather than in sys.modules, as a fresh worker would
+        if importlib.machinery.PathFinder.find_spec(__name__.split(".")[0]) is None:
+            print("Catch em' All: {} cannot be imported by worker processes, so the tournament is played in the scheduler".format(__name__))
+            shared_scheduler().steps(self.play_chunks(chunks))
+            return
+
+        try:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(TOURNAMENT_START_METHOD),
+                                            initializer=init_tournament_worker, initargs=(self.parties,))
+            futures = [self.pool.submit(play_matchups, chunk, self.best_of) for chunk in chunks]
+        except Exception as e:
+            self.fail(e)
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+            self.finish()
+            return
+
+        # Added once every chunk is submitted, so a failed submit never leaves callbacks waiting to finish
+        for future in futures:
+            future.add_done_callback(self.chunk_done)
+
+    # Plays chunks of matchups in this process, yielding between chunks so a scheduler worker is only held for one
+    def play_chunks(self, chunks):
+        try:
+            init_tournament_worker(self.parties)
+            for chunk in chunks:
+                self.record(play_matchups(chunk, self.best_of))
+                yield 0
+        except Exception as e:
+            self.fail(e)
+        self.finish()
+
+    # Called by the pool as each chunk of matchups completes, fails or is cancelled
+    def chunk_done(self, future):
+        try:
+            self.record(future.result())
+        except Exception as e:
+            if self.error is None:
+                self.fail(e)
+                # The remaining chunks are cancelled, which completes their futures
+                self.pool.shutdown(wait=False, cancel_futures=True)
+
+        with self.lock:
+            self.pending -= 1
+            if self.pending > 0:
+                return
+        self.pool.shutdown(wait=False)
+        self.finish()
+
+    def fail(self, error):
+        print("Catch em' All: The tournament failed!")
+        traceback.print_exception(type(error), error, error.__traceback__)
+        self.error = error
+
+    def finish(self):
+        self.finished = time.time()
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    # Stores the results returned by play_matchups
+    def record(self, results):
+        with self.lock:
+            for first, second, first_wins, second_wins in results:
+                self.results[(first, second)] = (first_wins, second_wins)
+
+    def is_running(self):
+        return self.started is not None and self.finished is None
+
+    # Returns the winner of the series between two users, or None if it was tied or has not been played
+    def series_winner(self, first, second):
+        if (first, second) not in self.results:
+            first, second = second, first
+        first_wins, second_wins = self.results.get((first, second), (0, 0))
+
+        if first_wins > second_wins:
+            return first
+        if second_wins > first_wins:
+            return second
+        return None
+
+    # Returns a list of (user, points, series won, series lost, series tied, games won, games lost)
+    # ordered from first to last place. Each series won is worth 3 points and each tie 1 point
+    def standings(self):
+        table = {user: [0, 0, 0, 0, 0] for user in self.parties.keys()}
+
+        with self.lock:
+            results = list(self.results.items())
+
+        for (first, second), (first_wins, second_wins) in results:
+            table[first][3] += first_wins
+            table[first][4] += second_wins
+            table[second][3] += second_wins
+            table[second][4] += first_wins
+
+            if first_wins > second_wins:
+                table[first][0] += 1
+                table[second][1] += 1
+            elif second_wins > first_wins:
+                table[second][0] += 1
+                table[first][1] += 1
+            else:
+                table[first][2] += 1
+                table[second][2] += 1
+
+        standings = [(user, row[0] * 3 + row[2], row[0], row[1], row[2], row[3], row[4]) for user, row in table.items()]
+        standings.sort(key=lambda row: (-row[1], -(row[5] - row[6]), row[0]))
+        return standings
+
+    # Returns a string describing how far the tournament has progressed
+    def progress(self):
+        with self.lock:
+            played = len(self.results)
+        total = len(self.matchups)
+
+        response = "Catch em' All: Tournament of {} parties, best of {}\n".format(len(self.parties), self.best_of)
+        response += "{}/{} series played ({:.0%})".format(played, total, played / total if total else 1)
+
+        if self.is_running() and played > 0:
+            elapsed = time.time() - self.started
+            response += ", about {} seconds left".format(int(elapsed / played * (total - played)))
+        return response
+
+    # Returns a string of the top standings and a bracket of the top four seeds, decided by their series results
+    def summary(self, top=10):
+        if self.error is not None:
+            return "Catch em' All: The tournament could not be completed!"
+
+        standings = self.standings()
+        response = "Catch em' All: Tournament results ({} parties, best of {})\n".format(len(self.parties), self.best_of)
+
+        for place, (user, points, won, lost, tied, games_won, games_lost) in enumerate(standings[:top], 1):
+            response += "{}. {} - {} pts ({}-{}-{})\n".format(place, user, points, won, lost, tied)
+
+        if len(standings) >= 4:
+            seeds = [row[0] for row in standings[:4]]
+            # Ties in a series go to the higher seed
+            first_final = self.series_winner(seeds[0], seeds[3]) or seeds[0]
+            second_final = self.series_winner(seeds[1], seeds[2]) or seeds[1]
+            champion = self.series_winner(first_final, second_final) or min(first_final, second_final, key=seeds.index)
+
+            response += "\nBracket:\n"
+            response += "(1) {} vs (4) {} -> {}\n".format(seeds[0], seeds[3], first_final)
+            response += "(2) {} vs (3) {} -> {}\n".format(seeds[1], seeds[2], second_final)
+            response += "Final: {} vs {} -> {} is the champion!".format(first_final, second_final, champion)
+        elif standings:
+            response += "\n{} is the champion!".format(standings[0][0])
+        return response
+
+
+# Secondary indexes over one user's bank, so that a query reads only the page it returns
+# Every pokemon is given a sequence number as it is stored. The numbers only grow and the bank is only appended to,
+# so bank order is sequence order and a pokemon's bank id is the count of smaller sequence numbers still in the bank.
+class BankIndex:
+    # Orders a query can sort by, "id" being bank order
+    SORTS = ("id", "cp", "level")
+
+    def __init__(self, shard):
+        # Sequence number of each pokemon, in bank order
+        self.seqs = []
+        # Dict of pokemon to its sequence number
+        # Keyed on the objects themselves, which keeps them alive so that no other pokemon can take their identity
+        self.seq_of = {}
+        # Dict of sequence number to (pokemon, species, cp, level) as the pokemon was last indexed
+        self.entries = {}
+        # Dict of species, or None for every species, to a dict of each sort to a sorted list of (value, sequence number)
+        self.views = {}
+        self.next_seq = 0
+
+        for poke in shard:
+            self.add(poke)
+
+    # Indexes a pokemon appended to the bank
+    def add(self, poke):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.seqs.append(seq)
+        self.seq_of[poke] = seq
+        self.insert(seq, poke)
+
+    # Removes the pokemon at a location within the bank
+    def remove(self, location):
+        seq = self.seqs.pop(location)
+        del self.seq_of[self.entries[seq][0]]
+        self.delete(seq)
+
+    # Re-sorts a pokemon whose cp or level may have changed since it was indexed
+    def update(self, poke):
+        seq = self.seq_of.get(poke)
+        if seq is None:
+            return
+        indexed, species, cp, level = self.entries[seq]
+        if (cp, level) != (poke.cp, poke.level):
+            self.delete(seq)
+            self.insert(seq, poke)
+
+    def insert(self, seq, poke):
+        species = poke.name.lower()
+        self.entries[seq] = (poke, species, poke.cp, poke.level)
+        for key in (None, species):
+            view = self.views.setdefault(key, {sort: [] for sort in self.SORTS})
+            insort(view["id"], (seq, seq))
+            insort(view["cp"], (poke.cp, seq))
+            insort(view["level"], (poke.level, seq))
+
+    def delete(self, seq):
+        poke, species, cp, level = self.entries.pop(seq)
+        for key in (None, species):
+            view = self.views[key]
+            for sort, value in (("id", seq), ("cp", cp), ("level", level)):
+                keys = view[sort]
+                del keys[bisect_left(keys, (value, seq))]
+            if key is not None and not view["id"]:
+                del self.views[key]
+
+    # Returns the total number of matching pokemon and a list of (bank id, pokemon) for up to limit of them from offset
+    def query(self, species, sort, descending, offset, limit):
+        view = self.views.get(species)
+        if view is None:
+            return 0, []
+
+        keys = view[sort]
+        total = len(keys)
+        if descending:
+            rows = keys[max(total - offset - limit, 0):max(total - offset, 0)][::-1]
+        else:
+            rows = keys[offset:offset + limit]
+        return total, [(bisect_left(self.seqs, seq), self.entries[seq][0]) for value, seq in rows]
+
+
 # Class that handles all operations involving saving and accessing pokemon for individual users
+# Each user's pokemon are stored as their own record and are only loaded once that user's bank is used
 class PokeBank:
     def __init__(self, dir):
         # String containing the directory of the plugin config
         self.dir = dir
-        # Dictionary containing keys of users and a list of all pokemon they own
+        # Dictionary containing keys of users and a list of all pokemon they own, for every user loaded so far
         self.bank = {}
-        # Attempts to load 'catchemall/pokebank.file' into self.bank should it exist
+        # Guards loading a user into self.bank, which may happen from the bot and the saver's thread at once
+        self.lock = threading.Lock()
+        # Persistent storage holding one record per user's list of pokemon
+        self.store = shared_store().namespace("catchemall.pokebank", RecordList(POKEMON_SCHEMA))
+        # Dictionary of users to the BankIndex of their pokemon, built the first time each user's bank is queried
+        self.indexes = {}
+        # Dictionary of each indexed pokemon to the user who owns it, keyed on the objects themselves like BankIndex.seq_of
+        self.owners = {}
+        # Collapses the saves of a multi-catch or a run of trades into one batch per second
+        self.saver = Debouncer(lambda users: self.save_users(*users), delay=1.0)
+        # Imports the old pokebank.file if there is one
         self.load()
 
+    # Returns a user's list of pokemon, loading it from storage on first use
+    # Returns None if the user does not have a bank
+    def shard(self, user):
+        shard = self.bank.get(user)
+        if shard is not None:
+            return shard
+
+        with self.lock:
+            if user not in self.bank:
+                shard = self.store.get(user)
+                if shard is None:
+                    return None
+                self.bank[user] = shard
+            return self.bank[user]
+
     # Stores a given pokemon into a users bank
     # Creates a bank for the user if one doesn't already exist
     def store_mon(self, user, pokemon):
-        if user in self.bank.keys():
-            self.bank[user].append(pokemon)
-            self.save()
-        else:
-            self.bank[user] = []
-            self.bank[user].append(pokemon)
-            self.save()
+        shard = self.shard(user)
+        if shard is None:
+            with self.lock:
+                shard = self.bank.setdefault(user, [])
+        shard.append(pokemon)
+        index = self.indexes.get(user)
+        if index is not None:
+            index.add(pokemon)
+            self.owners[pokemon] = user
+        self.saver.request(user)
 
     # Removes and returns a pokemon obj from a users bank given its location
     # Returns None if the location is out of bounds
     def remove_mon(self, user, location):
-        if location < len(self.bank[user]):
-            poke = self.bank[user].pop(location)
-            self.save()
+        shard = self.shard(user)
+        if location < len(shard):
+            poke = shard.pop(location)
+            index = self.indexes.get(user)
+            if index is not None:
+                index.remove(location)
+                self.owners.pop(poke, None)
+            self.saver.request(user)
             return poke
         return None
 
+    # Re-sorts pokemon that may have levelled up, such as a party after a battle, in their owners' indexes
+    # Pokemon no longer in any indexed bank are skipped
+    def update_mons(self, pokemon):
+        for poke in pokemon:
+            user = self.owners.get(poke)
+            if user is not None:
+                self.indexes[user].update(poke)
+
+    # Returns the BankIndex of a user's pokemon, building it on first use
+    # Returns None if the user does not have a bank
+    def index(self, user):
+        index = self.indexes.get(user)
+        if index is None:
+            shard = self.shard(user)
+            if shard is None:
+                return None
+            index = BankIndex(shard)
+            self.indexes[user] = index
+            for poke in shard:
+                self.owners[poke] = user
+        return index
+
+    # Returns the number of a user's pokemon that match and a list of (bank id, pokemon) for up to limit of them
+    # takes String species - only pokemon of this species match, or every pokemon if None
+    # takes String sort - one of BankIndex.SORTS
+    # Reads only the requested page once the user's index is built
+    def query(self, user, species=None, sort="id", descending=False, offset=0, limit=BANK_PAGE_SIZE):
+        index = self.index(user)
+        if index is None:
+            return 0, []
+        return index.query(species and species.lower(), sort, descending, offset, limit)
+
     # Returns a pokemon obj from the specified location within the list should it exist
     # Returns None if the location is out of bounds
     def get_mon(self, user, location):
-        if location < len(self.bank[user]):
-            poke = self.bank[user][location]
+        shard = self.shard(user)
+        if location < len(shard):
+            poke = shard[location]
             return poke
         return None
 
     # Returns a list of all pokemon in a valid user's bank
     # Returns None if the user does not have a bank
     def user_list(self, user):
-        return self.bank[user]
+        return self.shard(user)
 
     # Returns true if the user exists in the bank
+    # Checks storage without loading the user's pokemon
     def user_exists(self, user):
         if user in self.bank.keys():
             return True
-        return False
+        return user in self.store
+
+    # Saves a single user's pokemon
+    # Users that were never loaded have nothing new to save
+    def save_user(self, user):
+        if user in self.bank.keys():
+            self.store.put(user, self.bank[user])
+
+    # Saves several users' pokemon in a single batch
+    def save_users(self, *users):
+        with self.store.batch():
+            for user in users:
+                self.save_user(user)
 
-    # Saves the bank to pokebank.file
+    # Saves every loaded user's pokemon in a single batch
     def save(self):
-        with open(self.dir + "/pokebank.file", "wb") as f:
-            pickle.dump(self.bank, f)
-            f.seek(0)
-            f.close()
+        self.store.put_many(list(self.bank.items()))
 
-    # Attempts to load an available pokebank.file
+    # Imports the old pokebank.file on first run; users are loaded as they are used
     def load(self):
-        try:
-            if os.path.getsize(self.dir + "/pokebank.file") > 0:
-                with open(self.dir + "/pokebank.file", "rb") as f:
-                    self.bank = pickle.load(f)
-                    f.seek(0)
-                    f.close()
-            print("Catch em' All: PokeBank file successfully loaded!")
-        except FileNotFoundError:
-            if not os.path.exists(self.dir):
-                os.makedirs(self.dir)
-
-            # Ensures that the pokebank file is created.
-            with open(self.dir + "/pokebank.file", "w+") as f:
-                f.write("")
-                f.seek(0)
-                f.close()
-            print("Catch em' All: No PokeBank file exists, creating a new one.")
+        self.store.migrate_pickle(self.dir + "/pokebank.file", lambda bank: bank.items())
+        print("Catch em' All: PokeBank holds {} users!".format(len(self.store)))
 
 
 # Manages and generates pokemon
+# Wild pokemon are drawn from alias tables built from pokedex.json and the optional spawns.json:
+# {
+#     "tiers": {"common": 10, "rare": 2, "legendary": 0.1},  weight of each rarity tier
+#     "default_tier": "common",                             tier of every species not listed below
+#     "species": {"Mewtwo": "legendary"},                    tier of each listed species
+#     "biomes": {"cave": {"Zubat": 4, "Pikachu": 0}},        multipliers applied to weights within a biome
+#     "channels": {"-1001234567": "cave"}                     biome of each chat
+# }
+# Without spawns.json every species is equally likely. The tables are rebuilt whenever either file changes.
 class PokemonManager:
-    def __init__(self, dir):
+    def __init__(self, dir, check_interval=1.0):
         self.dir = dir
-        self.pokemon = self.build_set()
+        # Seconds between checks of whether pokedex.json or spawns.json changed, like JsonStorage.check_interval
+        self.check_interval = check_interval
+        # Monotonic time after which the files are checked again
+        self.next_check = 0
+        self.pokemon = {}
+        # (species, tables): a list of the arguments to Pokemon() for every species in pokedex order,
+        # and a dictionary of biome names to an AliasTable over that list, where None is the default biome
+        # Kept in one attribute so a rebuild never pairs a table with the wrong species list
+        self.spawns = ([], {})
+        # Dictionary of chat ids (as strings) to the name of their biome
+        self.channel_biomes = {}
+        # (modification time, size) of pokedex.json and spawns.json when the tables were built
+        self.signature = None
+        self.lock = threading.Lock()
+        self.refresh()
+
+    # Returns the (modification time, size) of a file, or None if it does not exist
+    def file_signature(self, name):
+        try:
+            info = os.stat(os.path.join(self.dir, name))
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    # Rebuilds the species list and spawn tables if pokedex.json or spawns.json changed since they were built
+    # The files are only checked once every check_interval seconds, so a burst of encounters stats them once
+    def refresh(self):
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.check_interval
+
+        signature = (self.file_signature("pokedex.json"), self.file_signature("spawns.json"))
+        if signature == self.signature:
+            return
+
+        with self.lock:
+            if signature == self.signature:
+                return
+
+            try:
+                pokemon = self.build_set()
+                species = [(poke["name"], poke["base_atk"], poke["base_def"], poke["base_hp"], poke["base_spc_atk"],
+                            poke["base_spc_def"], poke["base_spe"]) for poke in pokemon.values()]
+                tables, channel_biomes = self.build_tables(species)
+            except (OSError, ValueError, KeyError):
+                if self.signature is None:
+                    raise
+                # Keeps the last good tables, such as while pokedex.json is being edited, until the files change again
+                print("Catch em' All: Unable to reload the pokedex! Keeping the previous one.")
+                self.signature = signature
+                return
+
+            self.pokemon = pokemon
+            self.spawns = (species, tables)
+            self.channel_biomes = channel_biomes
+            self.signature = signature
 
     # Attempts to build a dictionary containing all pokemon and their essential data
     def build_set(self):
@@ -858,21 +1631,52 @@ class PokemonManager:
             return data
 
         except NotADirectoryError:
-            data["missingno"] = {"name" : "???", "base_atk" : 0, "base_def" : 0, "base_hp" : 1}
+            data["missingno"] = {"name" : "???", "base_atk" : 0, "base_def" : 0, "base_hp" : 1, "base_spc_atk" : 0, "base_spc_def" : 0, "base_spe" : 0}
             return data
 
+    # Builds an AliasTable for the default biome and each biome in spawns.json
+    # Returns (dictionary of biome names to tables, dictionary of chat ids to biome names)
+    def build_tables(self, species):
+        try:
+            with open(os.path.join(self.dir, "spawns.json")) as f:
+                spawns = json.load(f)
+        except FileNotFoundError:
+            spawns = {}
+        except ValueError:
+            print("Catch em' All: Unable to read spawns.json! Every pokemon will be equally likely.")
+            spawns = {}
+
+        tiers = spawns.get("tiers", {})
+        default_weight = tiers.get(spawns.get("default_tier"), 1)
+        species_tiers = spawns.get("species", {})
+        weights = [tiers.get(species_tiers.get(poke[0]), default_weight) for poke in species]
+
+        tables = {None: AliasTable(weights)}
+        for biome, multipliers in spawns.get("biomes", {}).items():
+            biome_weights = [weight * multipliers.get(poke[0], 1) for weight, poke in zip(weights, species)]
+            try:
+                tables[biome] = AliasTable(biome_weights)
+            except ValueError:
+                print("Catch em' All: The {} biome has no pokemon! Using the default spawns.".format(biome))
+        return tables, {str(chat): biome for chat, biome in spawns.get("channels", {}).items()}
+
+    # Returns the name of the biome a chat is set to, or None for the default biome
+    def channel_biome(self, chat):
+        self.refresh()
+        return self.channel_biomes.get(str(chat))
+
     # Returns True if a specifc pokemon exists
     def find_pokemon(self, name):
         if name in self.pokemon.keys():
             return True
         return False
 
-    # Returns a newly randomly generated pokemon
-    def generate_pokemon(self):
-        keys = list(self.pokemon.keys())
-        key = random.choice(keys)
-        poke = self.pokemon[key]
-        return Pokemon(poke["name"], poke["base_atk"], poke["base_def"], poke["base_hp"], poke["base_spc_atk"], poke["base_spc_def"], poke["base_spe"])
+    # Returns a newly randomly generated pokemon, drawn according to the weights of the given biome
+    def generate_pokemon(self, biome=None):
+        self.refresh()
+        species, tables = self.spawns
+        table = tables.get(biome, tables[None])
+        return Pokemon(*species[table.sample()])
 
     # Returns a specified newly generated pokemon
     def generate_exact_pokemon(self, name):
@@ -880,11 +1684,91 @@ class PokemonManager:
         return Pokemon(poke["name"], poke["base_atk"], poke["base_def"], poke["base_hp"], poke["base_spc_atk"], poke["base_spc_def"], poke["base_spe"])
 
 
+# Level ups at or above this count are mostly sampled in one step by grow_stat rather than rolled level by level.
+# Sampling matches rolling from 11 level ups on, but as the first and last levels are always rolled it only saves
+# time from about 20, so wild encounters (0 - 15 levels) and NPC difficulties 0 - 2 roll every level.
+FAST_LEVEL_UPS = 20
+# Near a band edge the first and last few levels are far from normally distributed, so those are still rolled
+ROLLED_FIRST_LEVEL_UPS = 4
+ROLLED_LAST_LEVEL_UPS = 6
+# Once int(stat * cp_multi) has reached this, grow_stat treats its rounding as averaging out to a half
+SMOOTH_GROWTH_BONUS = 20
+
+
+# Returns stat after levels rounds of: stat += int(random.randint(low, high) + stat * cp_multi) + growth_mod
+# Draws the total in one step from a normal distribution with the loop's mean and variance.
+# While int(stat * cp_multi) holds steady the stat gains a fixed amount per level on average, so the mean is walked
+# band by band; a higher bonus starts from the next whole level, on average half a level after the stat reaches it.
+# Rolls made before a band edge move the level it is reached at, so each edge multiplies the variance built up so
+# far by (1 + 1 / gain) squared, scaled down by the chance the edge is reached before the last level.
+# Past SMOOTH_GROWTH_BONUS the edges come every few levels and the rest follows the closed form of
+# stat += mean roll + growth_mod - 0.5 + stat * cp_multi.
+def grow_stat(stat, levels, low, high, growth_mod, cp_multi, rng=random):
+    mean_roll = (low + high) / 2
+    roll_variance = ((high - low + 1) ** 2 - 1) / 12
+    position = float(stat)
+    variance = 0.0
+    elapsed = 0.0
+
+    while elapsed < levels and cp_multi > 0:
+        bonus = int(math.floor(position + .5) * cp_multi)
+        if bonus >= SMOOTH_GROWTH_BONUS:
+            break
+        gain = mean_roll + growth_mod + bonus
+        # Stats are whole numbers, so the bonus goes up once the stat is within half of the first one past the edge
+        edge = math.ceil((bonus + 1) / cp_multi - 1e-9)
+        if int(edge * cp_multi) <= bonus:
+            edge += 1
+        to_edge = (edge - .5 - position) / gain
+        step = min(to_edge, levels - elapsed)
+        position += step * gain
+        variance += step * roll_variance
+        elapsed += step
+
+        # Levels left to gain the higher bonus on, which may be fewer than none if the edge is not reached in time
+        left = levels - (elapsed + to_edge - step) - .5
+        spread = variance ** .5 / gain
+        if spread > 0:
+            reached = .5 * (1 + math.erf(left / spread / 2 ** .5))
+            extra = left * reached + spread * math.exp(-(left / spread) ** 2 / 2) / (2 * math.pi) ** .5
+        else:
+            reached = 1.0 if left > 0 else 0.0
+            extra = max(left, 0.0)
+
+        if step < to_edge:
+            position += extra
+            variance *= (1 + reached / gain) ** 2
+            break
+        delay = min(.5, levels - elapsed)
+        position += delay * gain + extra - max(left, 0.0)
+        variance = variance * (1 + reached / gain) ** 2 + delay * roll_variance
+        elapsed += delay
+
+    remaining = levels - elapsed
+    if remaining > 0 and cp_multi > 0:
+        growth = (1 + cp_multi) ** remaining
+        drift = (mean_roll + growth_mod - .5) / cp_multi
+        position = (position + drift) * growth - drift
+        variance = variance * growth ** 2 + roll_variance * (growth ** 2 - 1) / ((1 + cp_multi) ** 2 - 1)
+    elif remaining > 0:
+        position += remaining * (mean_roll + growth_mod)
+        variance += remaining * roll_variance
+
+    # The loop never gains less than its lowest roll each level
+    return max(int(round(rng.gauss(position, variance ** .5))), stat + levels * (low + growth_mod))
+
+
 # Stores information on a specific pokemon and handles initial generation and increases in stats
 class Pokemon:
+    # Every user's pokemon are held in memory at once, so instances keep their attributes in slots rather than a dict
+    # 'hp' is set by calculate_growth_mods
+    __slots__ = ("name", "attack", "defence", "max_hp", "speed", "current_hp", "is_fainted", "level", "xp",
+                 "cp_multi", "cp", "attack_growth_mod", "defence_growth_mod", "hp_growth_mod", "speed_growth_mod",
+                 "hp")
+
     def __init__(self, poke_name, base_atk, base_def, base_hp, base_spc_atk, base_spc_def, base_spe):
-        # String Name of the pokemon
-        self.name = poke_name
+        # String Name of the pokemon, interned so that pokemon of the same species share it
+        self.name = sys.intern(poke_name)
         # Int Attack of the pokemon
         self.attack = max(base_atk, base_spc_atk)
         # Int Defence of the pokemon
@@ -957,25 +1841,55 @@ class Pokemon:
     # Levels up the pokemon
     # takes int levels - the number of levels to increase the pokemon by
     def force_level(self, levels):
-        for x in range(levels):
-            self.xp += 100
+        self.xp += 100 * levels
         self.update_stats()
 
     # Run every level up to adjust stats
+    # Many level ups at once, as NPCs and admin grants get, are sampled in one step per stat
     def update_stats(self):
-        for x in range(int(self.xp / 100)):
+        levels = int(self.xp / 100)
+        if levels >= FAST_LEVEL_UPS:
+            sampled = levels - ROLLED_FIRST_LEVEL_UPS - ROLLED_LAST_LEVEL_UPS
+            self.roll_levels(ROLLED_FIRST_LEVEL_UPS)
+            self.attack = grow_stat(self.attack, sampled, 1, 4, self.attack_growth_mod, self.cp_multi)
+            self.defence = grow_stat(self.defence, sampled, 1, 4, self.defence_growth_mod, self.cp_multi)
+            self.max_hp = grow_stat(self.max_hp, sampled, 2, 5, self.hp_growth_mod, self.cp_multi)
+            self.speed = grow_stat(self.speed, sampled, 1, 3, self.speed_growth_mod, self.cp_multi)
+            self.roll_levels(ROLLED_LAST_LEVEL_UPS)
+        else:
+            self.roll_levels(levels)
+        if levels > 0:
+            self.level += levels
+            # CP only depends on the final stats
+            self.calculate_cp()
+        self.xp = self.xp % 100
+
+    # Raises each stat once per level, without changing the level itself
+    def roll_levels(self, levels):
+        for x in range(levels):
             self.attack += int(random.randint(1,4) + (self.attack * self.cp_multi)) + self.attack_growth_mod
             self.defence += int(random.randint(1,4) + (self.defence * self.cp_multi)) + self.defence_growth_mod
             self.max_hp += int(random.randint(2,5) + (self.max_hp * self.cp_multi)) + self.hp_growth_mod
             self.speed += int(random.randint(1,3) + (self.speed * self.cp_multi)) + self.speed_growth_mod
-            self.level += 1
-            self.calculate_cp()
-        self.xp = self.xp % 100
 
     # Calculates the combat power of the pokemon
     def calculate_cp(self):
         self.cp = int((self.attack * (self.defence**.5) * (self.max_hp**.5) * (self.cp_multi)) / 10)
 
+    # Pickles hold a dict of attributes, as they did before Pokemon had slots, so old and new banks load either way
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+
+    def __setstate__(self, state):
+        # Slotted objects pickled without __getstate__ hold (dict, slots dict)
+        if isinstance(state, tuple):
+            state = dict(state[0] or {}, **state[1])
+
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
+        self.name = sys.intern(self.name)
+
     def __str__(self):
         message = "Catch em' All: Stats for {}\n".format(self.name)
         message += "CP: {}\n".format(str(self.cp))
@@ -985,4 +1899,44 @@ class Pokemon:
         message += "Atk: {}\n".format(str(self.attack))
         message += "Def: {}\n".format(str(self.defence))
         message += "Spe: {}\n".format(str(self.speed))
-        return message
\ No newline at end of file
+        return message
+
+
+# Layout of a stored pokemon; see libs/records.py before changing it
+POKEMON_SCHEMA = Schema(Pokemon, [
+    ("name", INTERNED, ""),
+    ("attack", INT64, 0),
+    ("defence", INT64, 0),
+    ("max_hp", INT64, 1),
+    ("speed", INT64, 0),
+    ("current_hp", INT64, 1),
+    ("is_fainted", BOOL, False),
+    ("level", INT64, 1),
+    ("xp", INT64, 0),
+    ("cp_multi", FLOAT, 1 / 100),
+    ("cp", INT64, 0),
+    ("attack_growth_mod", INT32, 0),
+    ("defence_growth_mod", INT32, 0),
+    ("hp_growth_mod", INT32, 0),
+    ("speed_growth_mod", INT32, 0),
+    ("hp", INT32, 0),
+])
+# Version 2: stats, levels, xp and cp grow without limit, so they are varints rather than 64 bit integers
+POKEMON_SCHEMA.add_version([
+    ("name", INTERNED, ""),
+    ("attack", INT, 0),
+    ("defence", INT, 0),
+    ("max_hp", INT, 1),
+    ("speed", INT, 0),
+    ("current_hp", INT, 1),
+    ("is_fainted", BOOL, False),
+    ("level", INT, 1),
+    ("xp", INT, 0),
+    ("cp_multi", FLOAT, 1 / 100),
+    ("cp", INT, 0),
+    ("attack_growth_mod", INT32, 0),
+    ("defence_growth_mod", INT32, 0),
+    ("hp_growth_mod", INT32, 0),
+    ("speed_growth_mod", INT32, 0),
+    ("hp", INT32, 0),
+], downgrade=lambda values: values)
@@ -2,6 +2,7 @@ import csv
 import os
 
 from pathlib import Path
+from libs.atomicfile import atomic_write
 from plugin import Plugin
 
 # Called when the bot loads the plugin
@@ -102,9 +103,10 @@ class Budget:
         if not os.path.exists(self.dir):
             os.mkdir(self.dir)
 
-        with open(self.dir + "/budget.csv", "w") as f:
-            for key in self.budget.keys():
-                f.write("%s,%s\n"%(key,self.budget[key]))
+        data = ""
+        for key in self.budget.keys():
+            data += "%s,%s\n"%(key,self.budget[key])
+        atomic_write(self.dir + "/budget.csv", data)
 
     def load(self):  
         if not os.path.exists(self.dir):
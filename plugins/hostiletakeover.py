@@ -1,11 +1,11 @@
 import json
 import os
-import pickle
 import random
-import threading
-from time import sleep
 
-from libs.honorbank import HonorBank
+from libs.honorbank import shared_bank
+from libs.kvstore import shared_store
+from libs.records import BOOL, INT, NUMBER, STR, ListOf, MapOf, Nested, Schema
+from libs.scheduler import shared_scheduler
 from plugin import Plugin
 
 
@@ -26,13 +26,13 @@ class HostileTakeover(Plugin):
         self.bot = bot
         self.companies = []
 
-        self.account_manager = HonorBank()
+        self.account_manager = shared_bank()
+        # Persistent storage holding one record per company
+        self.store = shared_store().namespace("hostiletakeover.companies", COMPANY_SCHEMA)
         self.load_companies()
         self.event_management = EventManagement(data_dir)
 
-        thread = threading.Thread(target = self.generate_conditions)  # runs for 43200 seconds
-        thread.daemon = True
-        thread.start()
+        self.conditions_job = shared_scheduler().every(43200, self.generate_conditions, delay=0)
 
     def create_company(self, command):
         """
@@ -45,10 +45,10 @@ class HostileTakeover(Plugin):
         commands = command.args.split(" ")
         if len(commands) == 1:
             if self.get_company(commands[0].lower()) is None and not commands[0] == "":
-                if self.account_manager.charge(command.user.username, startup_cost):
+                if self.account_manager.charge(command.user.username, startup_cost, reason="company startup", source="HostileTakeover"):
                     new_company = Company(commands[0].lower(), command.user.username)
                     self.companies.append(new_company)
-                    self.save_companies()
+                    self.save_company(new_company)
                     return "CafeHT: Successfully created new company {}".format(commands[0])
                 return "CafeHT: Unable to create new company. You need {} honor to make a company!".format(startup_cost)
             return "CafeHT: Unable to create new company. A company with this name already exists!"
@@ -110,15 +110,19 @@ class HostileTakeover(Plugin):
                             market_mod = 0.0
 
                         response = "CafeHT: The following amounts have been paid out for {}:\n".format(company.name)
+                        payments = {}
                         for share_owner in company.shares.keys():
                             shares = company.shares[share_owner]
                             payment = int(profits * (shares / 100) * market_mod)
                             response += "{} : {}".format(share_owner, str(payment))
-                            self.account_manager.pay(share_owner, payment)
+                            payments[share_owner] = payment
+
+                        if not self.account_manager.pay_many(payments, reason="company profits", source="HostileTakeover"):
+                            return "CafeHT: Unable to pay out profits. Every share owner needs an honor account!"
 
                         company.profits = 0
                         company.paid_today = True
-                        self.save_companies()
+                        self.save_company(company)
                         return response
                     return "CafeHT: This company has already paid out today."
                 return "CafeHT: Only the company owner can issue this command."
@@ -140,9 +144,9 @@ class HostileTakeover(Plugin):
                     company.value += int(commands[1])
                     company.profits += (int(commands[1]) / 5)
 
-                    if self.account_manager.charge(command.user.username, int(commands[1])):
+                    if self.account_manager.charge(command.user.username, int(commands[1]), reason="company investment", source="HostileTakeover"):
                         company.update_tier()
-                        self.save_companies()
+                        self.save_company(company)
                         return "CafeHT: Invested {} into {} company!".format(int(commands[1]), company.name)
                     return "CafeHT: You do not possess {} honor to invest!".format(int(commands[1]))
                 except ValueError:
@@ -163,17 +167,18 @@ class HostileTakeover(Plugin):
             if company is not None:
                 try:
                     if company.tier >= 4:
-                        cost = (company.value / 100) * int(commands[2])
-                        if self.account_manager.get_funds(command.user.username) >= cost:
-                            if company.transfer_shares(command.user.username, commands[1], int(commands[2])):
-                                if self.account_manager.charge(command.user.username, cost):
-                                    self.account_manager.pay(commands[1], int(cost * 0.9))
-                                    self.save_companies()
-                                    return "CafeHT: Transferred shares from {} to {}".format(commands[1],
-                                                                                             command.user.username)
-                                return "CafeHT: Unable to transfer shares. Buyer does not have {} honor.".format(cost)
-                            return "CafeHT: Unable to transfer shares. They do not possess that amount!"
-                        return "CafeHT: Unable to transfer shares. You cannot afford {} honor!".format(cost)
+                        amount = int(commands[2])
+                        cost = (company.value / 100) * amount
+                        # The seller receives 90% of the cost
+                        fee = cost - int(cost * 0.9)
+                        if company.shares.get(commands[1], 0) >= amount:
+                            if self.account_manager.transfer(command.user.username, commands[1], cost, fee, reason="share purchase", source="HostileTakeover"):
+                                company.transfer_share(command.user.username, commands[1], amount)
+                                self.save_company(company)
+                                return "CafeHT: Transferred shares from {} to {}".format(commands[1],
+                                                                                         command.user.username)
+                            return "CafeHT: Unable to transfer shares. You cannot afford {} honor!".format(cost)
+                        return "CafeHT: Unable to transfer shares. They do not possess that amount!"
                     return "CafeHT: Unable to transfer shares. This company is not yet public at tier 4."
                 except ValueError:
                     return "CafeHT: Invalid command format! Please enter /buyshares [company] [person] [amount]"
@@ -220,7 +225,7 @@ class HostileTakeover(Plugin):
                     for policy in self.event_management.policies_list:
                         if policy.name == commands[1].lower():
                             if company.add_policy(policy):
-                                self.save_companies()
+                                self.save_company(company)
                                 return "CafeHT: Successfully added {} policy to this company!".format(commands[1])
                             return "CafeHT: Unable to add policy. It may already be set in this company or policy " \
                                    "limit is full "
@@ -243,7 +248,7 @@ class HostileTakeover(Plugin):
             if company is not None:
                 if command.user.username == company.owner:
                     if company.remove_policy(commands[1]):
-                        self.save_companies()
+                        self.save_company(company)
                         return "CafeHT: Successfully removed {} policy from this company!".format(commands[1])
                     return "CafeHT: Unable to remove policy. It does not exist within this company!"
                 return "CafeHT: Unable to remove policy. You are not the owner of this company."
@@ -322,38 +327,28 @@ class HostileTakeover(Plugin):
                 return company
         return None
 
+    def save_company(self, company):
+        """
+        Saves a single company's record
+        """
+
+        self.store.put(company.name, company)
+
     def save_companies(self):
         """
-        Saves all companies contained within self.companies into a file
+        Saves all companies contained within self.companies in a single batch
         """
 
-        with open(self.data_dir + "/data/" + "companies" + ".file", "wb") as f:
-            pickle.dump(self.companies, f)
-            f.seek(0)
-            f.close()
+        self.store.put_many([(company.name, company) for company in self.companies])
 
     def load_companies(self):
         """
-        Loads a list of all companies contained within a file into self.companies
+        Loads all stored companies into self.companies, importing the old companies.file on first run
         """
 
-        try:
-            if os.path.getsize(self.data_dir + "/data/companies.file") > 0:
-                with open(self.data_dir + "/data/companies.file", "rb") as f:
-                    self.companies = pickle.load(f)
-                    if not isinstance(self.companies, list):  # I'm horrible... I used isinstance...
-                        list(self.companies)
-                    f.seek(0)
-                    f.close()
-        except FileNotFoundError:
-            if not os.path.exists(self.data_dir + "/data"):
-                os.makedirs(self.data_dir + "/data")
-
-            # Ensures that the account file is created.
-            with open(self.data_dir + "/data/companies.file", "w+") as f:
-                f.write("")
-                f.seek(0)
-                f.close()
+        self.store.migrate_pickle(self.data_dir + "/data/companies.file",
+                                  lambda companies: [(company.name, company) for company in companies])
+        self.companies = [company for name, company in self.store.items()]
 
     def generate_conditions(self):
         """
@@ -361,13 +356,11 @@ class HostileTakeover(Plugin):
         Generates new market conditions and resets company payout.
         """
 
-        while threading.main_thread().is_alive():
-            self.event_management.set_conditions()
-            for company in self.companies:
-                company.paid_today = False
-                company.profits += company.value
-            self.save_companies()
-            sleep(43200)
+        self.event_management.set_conditions()
+        for company in self.companies:
+            company.paid_today = False
+            company.profits += company.value
+        self.save_companies()
 
     # TODO: Change this to one command input 'ht' with multiple sub commands as params
     def on_command(self, command):
@@ -464,7 +457,7 @@ class Company:
         if self.shares.keys().__contains__(seller):
             if self.shares[seller] >= amount:
                 self.shares[seller] = self.shares[seller] - amount
-                self.shares[buyer] = self.shares[buyer] + amount
+                self.shares[buyer] = self.shares.get(buyer, 0) + amount
                 self.update_owner()
                 return True
             return False
@@ -614,3 +607,24 @@ class EventManagement:
                       self.current_conditions[2].name + " : " + self.current_conditions[2].description + "\n"
 
         return "The following conditions are in effect:\n" + description
+
+
+# Layouts of a stored company and its policies; see libs/records.py before changing them
+POLICY_SCHEMA = Schema(Policy, [
+    ("name", STR, ""),
+    ("description", STR, ""),
+    ("default_mc", NUMBER, 0),
+    ("mod_mc", NUMBER, 0),
+    ("modifiers", ListOf(STR), list),
+])
+
+COMPANY_SCHEMA = Schema(Company, [
+    ("name", STR, ""),
+    ("owner", STR, ""),
+    ("tier", INT, 0),
+    ("value", NUMBER, 0),
+    ("profits", NUMBER, 1000),
+    ("paid_today", BOOL, False),
+    ("shares", MapOf(STR, NUMBER), dict),
+    ("policies", ListOf(Nested(POLICY_SCHEMA)), list),
+])
@@ -1,8 +1,7 @@
-import threading
-
 from datetime import datetime
+from libs.outbox import shared_outbox
+from libs.scheduler import shared_scheduler
 from plugin import Plugin
-from time import sleep
 
 
 # Called when the bot loads the plugin
@@ -25,6 +24,8 @@ class HydrationAlerts(Plugin):
         self.dir = data_dir
         # A reference to the bot itself for more advanced operations
         self.bot = bot
+        # Rate limited queue that sends alerts without blocking this plugin
+        self.outbox = shared_outbox(bot)
         # A set containing all channels in which to send alerts to
         self.channels = set()
         # Bool that determines if it is daytime, which is the period during which messages may be sent
@@ -34,41 +35,33 @@ class HydrationAlerts(Plugin):
         # Float amount of water to drink per hour in liters
         self.liter_quantity = .14
 
-        # Launches a deamon thread that handles alerts and random encounters
-        thread = threading.Thread(target = self.hydration_alert)
-        thread.daemon = True
-        thread.start()
+        # Sends an alert at the top of every hour from the shared scheduler
+        self.alert_job = shared_scheduler().cron(self.hydration_alert, minute=0)
 
     def hydration_alert(self):
-        while threading.main_thread().is_alive():
-            time = datetime.now().time()
-            hour = time.hour
-            minutes = time.minute
-
-            if hour == 0:
-                self.message_channels("Wow it is late! If anyone is still up at this hour remember to stay hydrated! Drink at least .5C (.11L) of water per hour you stay awake!")
-                self.is_day = False
-            elif hour == 8:
-                self.message_channels("It's the start of a new day and it's time to get hydrated!\nWithin the hour you should drink at least .5C (.11L) of water.")
-                self.is_day = True
-            else:
-                if self.is_day:
-                    elapsed_hours = hour - 8
-                    current_hour = hour
-                    current_cups = self.cup_quantity * elapsed_hours
-                    current_liters = self.liter_quantity * elapsed_hours
-
-                    if hour > 12:
-                        current_hour -= 12
-
-                    self.message_channels("It is now {} o'Clock! By this point in the day you should have drank {}C ({}L) of water to maintain optimal hydration!".format(current_hour, round(current_cups, 2), round(current_liters, 2)))
-
-            sleep(60*(60 - minutes))
-
-    # Helper method that messages all channels within self.channels
+        hour = datetime.now().time().hour
+
+        if hour == 0:
+            self.message_channels("Wow it is late! If anyone is still up at this hour remember to stay hydrated! Drink at least .5C (.11L) of water per hour you stay awake!")
+            self.is_day = False
+        elif hour == 8:
+            self.message_channels("It's the start of a new day and it's time to get hydrated!\nWithin the hour you should drink at least .5C (.11L) of water.")
+            self.is_day = True
+        else:
+            if self.is_day:
+                elapsed_hours = hour - 8
+                current_hour = hour
+                current_cups = self.cup_quantity * elapsed_hours
+                current_liters = self.liter_quantity * elapsed_hours
+
+                if hour > 12:
+                    current_hour -= 12
+
+                self.message_channels("It is now {} o'Clock! By this point in the day you should have drank {}C ({}L) of water to maintain optimal hydration!".format(current_hour, round(current_cups, 2), round(current_liters, 2)))
+
+    # Helper method that queues a message to all channels within self.channels
     def message_channels(self, message):
-        for channel in self.channels:
-            self.bot.send_message(channel, message)
+        self.outbox.broadcast(self.channels, message)
 
     # Run whenever someone on telegram types one of these commands
     def on_command(self, command):
@@ -1,16 +1,19 @@
+import asyncio
+
 from mcstatus import MinecraftServer
 
+from libs.aioplugin import AsyncPluginBridge
 from plugin import Plugin
 
 
 def load(data_dir, bot):
-    return MinecraftStatus(data_dir, bot)
+    return AsyncPluginBridge(MinecraftStatus(data_dir, bot), bot)
 
 
 """
 Created by Matthew Klawitter 1/9/2019
 Last Updated: 3/3/2019
-Version: v1.1.1.0
+Version: v1.2.0.0
 """
 
 
@@ -21,40 +24,41 @@ class MinecraftStatus(Plugin):
         self.is_setup = False
         self.server = None
 
-    def setup(self, command):
+    async def setup(self, command):
         commands = command.args.split(" ")
         host = commands[0]
-        self.server = MinecraftServer.lookup(host)
+        # lookup resolves SRV records with blocking DNS queries
+        self.server = await asyncio.get_running_loop().run_in_executor(None, MinecraftServer.lookup, host)
         self.is_setup = True
         return "MCStatus: Now pinging {} globally. Use /mcstatus /mcping /mcplayers to receive more information on this server.".format(host)
 
-    def get_status(self):
-        status = self.server.status()
+    async def get_status(self):
+        status = await self.server.async_status()
         return "MCStatus: There are currently {} players connected.".format(status.players.online)
 
-    def get_ping(self):
-        return "MCStatus: The server responded in {}ms".format(self.server.ping())
+    async def get_ping(self):
+        return "MCStatus: The server responded in {}ms".format(await self.server.async_ping())
 
-    def get_players(self):
-        status = self.server.status()
+    async def get_players(self):
+        status = await self.server.async_status()
         response = "MCStatus: The following players are connected:\n"
 
         for player in status.players.sample:
             response += player.name + "\n"
         return response
 
-    def on_command(self, command):
+    async def on_command(self, command):
         if command.command == "mcsetup":
-            return {"type": "message", "message": self.setup(command)}
+            return {"type": "message", "message": await self.setup(command)}
 
         if not self.is_setup:
             return {"type": "message", "message": "MCStatus: Please first run /mcsetup [ip] to configure a server."}
         elif command.command == "mcstatus":
-            return {"type": "message", "message": self.get_status()}
+            return {"type": "message", "message": await self.get_status()}
         elif command.command == "mcping":
-            return {"type": "message", "message": self.get_ping()}
+            return {"type": "message", "message": await self.get_ping()}
         elif command.command == "mcplayers":
-            return {"type": "message", "message": self.get_players()}
+            return {"type": "message", "message": await self.get_players()}
 
     def get_commands(self):
         return {"mcsetup", "mcstatus", "mcping", "mcplayers"}
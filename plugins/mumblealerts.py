@@ -1,59 +1,82 @@
+import asyncio
 import datetime
 import socket
-import threading
 from struct import pack, unpack
 
+from libs.aioplugin import submit
+from libs.outbox import shared_outbox
+from libs.scheduler import shared_scheduler
 from plugin import Plugin
-from time import sleep
 
 
 
 """
 Created by Matthew Klawitter 11/13/2018
 Last Updated: 9/18/2019
-Version: v2.1.0.0
+Version: v2.2.0.0
 Credit to https://gist.github.com/azlux for mumble ping algorithm https://gist.github.com/azlux/315c924af4800ffbc2c91db3ab8a59bc
 """
 
 
 
+class MumblePing(asyncio.DatagramProtocol):
+    """
+    Receives the reply to a single mumble ping
+    """
+
+    def __init__(self):
+        self.reply = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if not self.reply.done():
+            self.reply.set_result(data)
+
+    def error_received(self, exc):
+        if not self.reply.done():
+            self.reply.set_exception(exc)
+
+
 class BotPlugin(Plugin):
     def __init__(self, data_dir, bot):
         self.data_dir = data_dir
         self.bot = bot
+        self.outbox = shared_outbox(bot)
         self.channels = []
-        self.current_users = self.connected_users()
+        # Set by the first status check
+        self.current_users = None
 
-        thread = threading.Thread(target = self.return_status)
-        thread.daemon = True
-        thread.start()
+        # The ping itself runs on the shared event loop so the scheduler's workers never wait on the network
+        self.status_job = shared_scheduler().every(15, lambda: submit(self.return_status()), delay=0)
 
-    def connected_users(self, host="localhost", port=64738):
+    async def connected_users(self, host="localhost", port=64738):
         """ 
             <host> [<port>]
             Ping the server and display results.
         """
 
+        loop = asyncio.get_running_loop()
+
         try:
-            addrinfo = socket.getaddrinfo(host, port, 0, 0, socket.SOL_UDP)
+            addrinfo = await loop.getaddrinfo(host, port, proto=socket.SOL_UDP)
         except socket.gaierror as e:
             print(e)
             return
 
         for (family, socktype, proto, canonname, sockaddr) in addrinfo:
-            s = socket.socket(family, socktype, proto=proto)
-            s.settimeout(2)
-
             buf = pack(">iQ", 0, datetime.datetime.now().microsecond)
             try:
-                s.sendto(buf, sockaddr)
-            except (socket.gaierror, socket.timeout) as e:
+                transport, protocol = await loop.create_datagram_endpoint(MumblePing, remote_addr=sockaddr,
+                                                                          family=family)
+            except OSError:
                 continue
 
             try:
-                data, addr = s.recvfrom(1024)
-            except socket.timeout:
+                transport.sendto(buf)
+                data = await asyncio.wait_for(protocol.reply, 2)
+            except (OSError, asyncio.TimeoutError):
                 continue
+            finally:
+                transport.close()
 
             r = unpack(">bbbbQiii", data)
 
@@ -67,26 +90,25 @@ class BotPlugin(Plugin):
 
             return r[5]
 
-    def return_status(self):
-        while threading.main_thread().is_alive():
-            updated_users = self.connected_users()
-
-            if updated_users != self.current_users:
-                if len(self.channels) > 0:
-                    message = ""
+    async def return_status(self):
+        updated_users = await self.connected_users()
 
-                    if self.current_users < updated_users:
-                        message = "A user has joined the mumble server. There are now " + str(updated_users) + " connected."
-                        self.current_users = updated_users
-                    elif self.current_users > updated_users:
-                        message = "A user has left the mumble server. There are now " + str(updated_users) + " connected."
-                        self.current_users = updated_users
+        if self.current_users is None or updated_users is None:
+            self.current_users = updated_users
+        elif updated_users != self.current_users:
+            if len(self.channels) > 0:
+                message = ""
 
-                    for channel in self.channels:
-                        self.bot.send_message(channel, message)
-                else:
+                if self.current_users < updated_users:
+                    message = "A user has joined the mumble server. There are now " + str(updated_users) + " connected."
                     self.current_users = updated_users
-            sleep(15)
+                elif self.current_users > updated_users:
+                    message = "A user has left the mumble server. There are now " + str(updated_users) + " connected."
+                    self.current_users = updated_users
+
+                self.outbox.broadcast(self.channels, message)
+            else:
+                self.current_users = updated_users
 
     def com_enable(self, command):
         for channel in self.channels:
@@ -1,8 +1,4 @@
-import os
-import threading
-from time import sleep
-from threading import Timer
-from libs.honorbank import HonorBank
+from libs.honorbank import shared_bank
 
 from plugin import Plugin
 
@@ -14,22 +10,16 @@ def load(data_dir, bot):
 """
 Created by Matthew Klawitter 2/1/2018
 Last Updated: 2/1/2018
-Version: v1.0.0.1
+Version: v1.1.0.0
 """
 
 
 class Payday(Plugin):
+    # Honor paid to every account per hour, and the most paid out at once after a long absence (None for no cap)
+    PAY = 50
+    PAY_CAP = None
+
     def __init__(self, data_dir, bot):
-        self.account_manager = HonorBank()
-        self.honor_accounts = self.account_manager.honor_accounts
-        thread = threading.Thread(target = self.pay_day)
-        thread.daemon = True
-        thread.start()
-
-    def pay_day(self):
-        while threading.main_thread().is_alive():
-            if self.honor_accounts:
-                for account in self.honor_accounts.keys():
-                    self.account_manager.pay(account, 50)
-                    self.account_manager.save_accounts()
-            sleep(3600)
+        # Pay is settled by the bank whenever an account's balance is read or changed
+        self.account_manager = shared_bank()
+        self.account_manager.set_accrual(self.PAY, 3600, self.PAY_CAP)
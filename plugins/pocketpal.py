@@ -1,16 +1,16 @@
 import datetime
 import json
 import os
-import pickle
 import random
 import socket
-import threading
-from libs.honorbank import HonorBank
+from libs.honorbank import shared_bank
+from libs.kvstore import shared_store
+from libs.records import BOOL, INT, NUMBER, STR, EnumOf, Schema
+from libs.scheduler import shared_scheduler
 from enum import Enum
 from struct import pack, unpack
 
 from plugin import Plugin
-from time import sleep
 
 
 # Called when the bot loads the plugin
@@ -34,14 +34,14 @@ class PocketPal(Plugin):
         self.bot = bot
         # Dict composed of users as keys and a Pal obj as a value
         self.pals = {}
+        # Persistent storage holding one record per pal
+        self.store = shared_store().namespace("pocketpal", PAL_SCHEMA)
         self.load()
         # Handles currency management for users
-        self.account_manager = HonorBank()
+        self.account_manager = shared_bank()
 
-        # Launches a deamon thread that handles alerts and random encounters
-        thread = threading.Thread(target = self.update)
-        thread.daemon = True
-        thread.start()
+        # Simulates every pal every 300 seconds on the shared scheduler
+        self.update_job = shared_scheduler().every(300, self.update, delay=0)
 
     # Checks the status of your pal, viewing stats and health
     def com_check(self, command):
@@ -63,8 +63,10 @@ class PocketPal(Plugin):
                 food = Food.get_food(command.args)
                 pal = self.pals[user]
 
-                if self.account_manager.charge(user, 10):
-                    if pal.feed(food):
+                if self.account_manager.charge(user, 10, reason="pal food", source="PocketPal"):
+                    fed = pal.feed(food)
+                    self.store.put(user, pal)
+                    if fed:
                         return "PocketPal: Successfully fed your pal! This cost you 10 honor."
                     return "PocketPal: Your pet refused to eat since it is full! This cost you 10 honor!"
                 return "PocketPal: Sorry, it costs 10 honor to feed your pet! You lack the neccessary funds..."
@@ -83,8 +85,10 @@ class PocketPal(Plugin):
                 game = Game.get_game(command.args)
                 pal = self.pals[user]
 
-                if self.account_manager.charge(user, 20):
-                    if pal.play(game):
+                if self.account_manager.charge(user, 20, reason="pal game", source="PocketPal"):
+                    played = pal.play(game)
+                    self.store.put(user, pal)
+                    if played:
                         return "PocketPal: Successfully entertained your pal! This cost you 20 honor."
                     return "PocketPal: They don't want to play that! This cost you 20 honor."
                 return "PocketPal: Sorry, it costs 20 honor to afford that entertainment! You lack the neccessary funds..."
@@ -101,8 +105,9 @@ class PocketPal(Plugin):
         if user in self.pals.keys():
             pal = self.pals[user]
 
-            if self.account_manager.charge(user, 5):
+            if self.account_manager.charge(user, 5, reason="pal cleaning", source="PocketPal"):
                 pal.clean_pal()
+                self.store.put(user, pal)
                 return "PocketPal: Successfully cleaned your pal's environment! This cost you 5 honor for supplies."
             return "PocketPal: Sorry, it costs 5 honor to clean your pal's environment! You lack the neccessary funds..."
         return "PocketPal: You currently do not own a pal! Use '/pnew [name]' to get one!"
@@ -125,8 +130,9 @@ class PocketPal(Plugin):
 
         if user in self.pals.keys():
             return "PocketPal: You have already own a pal!"
-        if self.account_manager.charge(user, 300):
+        if self.account_manager.charge(user, 300, reason="pal adoption", source="PocketPal"):
             self.pals[user] = Pal(command.args, self.dir)
+            self.store.put(user, self.pals[user])
             return "PocketPal: Thank you for adopting a new pal for 300 honor! Be sure to take care of it!"
         return "PocketPal: Sorry! You require at least 300 honor to adopt a pal!"
 
@@ -151,7 +157,8 @@ class PocketPal(Plugin):
                 value = 12000
 
             del self.pals[user]
-            self.account_manager.pay(user, value)
+            self.store.delete(user)
+            self.account_manager.pay(user, value, reason="pal payout", source="PocketPal")
             return "PocketPal: Say goodbye! Payed out {} for your {} (Species: {})".format(value, pal.name, pal.species)
         return "PocketPal: You currently do not own a pal! Use '/pnew [name]' to get one!"
 
@@ -171,42 +178,22 @@ class PocketPal(Plugin):
             response += game.name + "\n"
         return response
 
-    # Saves all pals
+    # Saves all pals in a single batch
     def save(self):
-        with open(self.dir + "/pals.file", "wb") as f:
-            pickle.dump(self.pals, f)
-            f.seek(0)
-            f.close()
+        self.store.put_many(list(self.pals.items()))
 
-    # Loads all pals
+    # Loads all pals, importing the old pals.file on first run
     def load(self):
-        try:
-            if os.path.getsize(self.dir + "/pals.file") > 0:
-                with open(self.dir + "/pals.file", "rb") as f:
-                    self.pals = pickle.load(f)
-                    f.seek(0)
-                    f.close()
-            print("PocketPal: Pal file successfully loaded!")
-        except FileNotFoundError:
-            if not os.path.exists(self.dir):
-                os.makedirs(self.dir)
-
-            # Ensures that the pokebank file is created.
-            with open(self.dir + "/pals.file", "w+") as f:
-                f.write("")
-                f.seek(0)
-                f.close()
-            print("PocketPal: No Pal file exists, creating a new one.")
-            self.pals = {}
+        self.store.migrate_pickle(self.dir + "/pals.file", lambda pals: pals.items())
+        self.pals = dict(self.store.items())
+        print("PocketPal: {} pals successfully loaded!".format(len(self.pals)))
 
     # Updates status of your pal
     def update(self):
-        while threading.main_thread().is_alive():
-            for user in self.pals.keys():
-                self.pals[user].simulate()
+        for user in self.pals.keys():
+            self.pals[user].simulate()
 
-            self.save()
-            sleep(300)
+        self.save()
 
     # Run whenever someone on telegram types one of these commands
     def on_command(self, command):
@@ -557,3 +544,22 @@ class Game(Enum):
     @classmethod
     def rand_game(Game):
         return random.choice(list(Game))
+
+
+# Layout of a stored pal; see libs/records.py before changing it
+PAL_SCHEMA = Schema(Pal, [
+    ("name", STR, ""),
+    ("age", INT, 0),
+    ("health", NUMBER, 100),
+    ("mood", INT, Mood.tame.value),
+    ("hunger", NUMBER, 100),
+    ("clean", NUMBER, 100),
+    ("growth", INT, Growth.child.value),
+    ("alive", BOOL, True),
+    ("species", STR, ""),
+    ("craving", EnumOf(Food), Food.nothing),
+    ("desire", EnumOf(Game), Game.nothing),
+    ("received_attention", BOOL, False),
+    ("status_image", STR, ""),
+    ("dir", STR, ""),
+])
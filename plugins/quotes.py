@@ -1,7 +1,6 @@
-import os
-import pickle
 import random
 
+from libs.kvstore import shared_store
 from plugin import Plugin
 
 
@@ -22,20 +21,28 @@ class BotPlugin(Plugin):
         self.bot = bot
         # Contains a list of quotes
         self.quotes = []
+        # Ids under which each quote in self.quotes is stored, in the same order
+        self.quote_ids = []
+        # Persistent storage holding one record per quote
+        self.store = shared_store().namespace("quotes")
         self.load()
 
     def com_add(self, command):
         quote = command.args
+        # Ids only ever grow, so stored quotes keep their order
+        quote_id = "{:010d}".format(int(self.quote_ids[-1]) + 1 if self.quote_ids else 0)
+        self.store.put(quote_id, quote)
         self.quotes.append(quote)
-        self.save()
+        self.quote_ids.append(quote_id)
         return "Quotes: Added quote {} : {}".format(len(self.quotes) - 1, quote)
 
     def com_remove(self, command):
         quote_number = int(command.args)
 
         if (0 <= quote_number < len(self.quotes)):
+            self.store.delete(self.quote_ids[quote_number])
             del self.quotes[quote_number]
-            self.save()
+            del self.quote_ids[quote_number]
             return "Quotes: Successfully removed quote number {}".format(quote_number)
         return "Quotes: Unable to remove quote number {}, it may be out of bounds or not an int.".format(quote_number)
 
@@ -55,33 +62,15 @@ class BotPlugin(Plugin):
             return "Quote #{}: {}".format(random_number, self.quotes[random_number])
         return "Quotes: Not enough quotes exist to pick one randomly!"
 
-    # Saves players data from self.player_db
-    def save(self):
-        with open(self.dir + "/quotes.file", "wb") as f:
-            pickle.dump(self.quotes, f)
-            f.seek(0)
-            f.close()
-
-    # Loads players data into self.player_db
+    # Loads all quotes from storage, importing the old quotes.file on first run
     def load(self):
-        try:
-            if os.path.getsize(self.dir + "/quotes.file") > 0:
-                with open(self.dir + "/quotes.file", "rb") as f:
-                    self.quotes = pickle.load(f)
-                    f.seek(0)
-                    f.close()
-            print("Quotes: Quote file successfully loaded!")
-        except FileNotFoundError:
-            if not os.path.exists(self.dir):
-                os.makedirs(self.dir)
-
-            # Ensures that the pokebank file is created.
-            with open(self.dir + "/quotes.file", "w+") as f:
-                f.write("")
-                f.seek(0)
-                f.close()
-            print("Quotes: No quotes file exists, creating a new one.")
-            self.quotes = []
+        self.store.migrate_pickle(self.dir + "/quotes.file",
+                                  lambda quotes: (("{:010d}".format(x), quote) for x, quote in enumerate(quotes)))
+
+        records = sorted(self.store.items())
+        self.quote_ids = [quote_id for quote_id, quote in records]
+        self.quotes = [quote for quote_id, quote in records]
+        print("Quotes: {} quotes successfully loaded!".format(len(self.quotes)))
         
 
     # Run whenever someone on telegram types one of these commands
@@ -1,7 +1,6 @@
-import os
-import pickle
 import random
 
+from libs.kvstore import shared_store
 from plugin import Plugin
 
 
@@ -19,8 +18,10 @@ class BotPlugin(Plugin):
         self.dir = data_dir
         # A reference to the bot itself for more advanced operations
         self.bot = bot
-        # dict containing lists of suggestions
-        self.lists = {}
+        # dict containing suggestions and how many times each was made
+        self.list = {}
+        # Persistent storage holding one record per suggestion
+        self.store = shared_store().namespace("suggestionlist")
         self.load()
 
     def com_suggest(self, command):
@@ -30,6 +31,7 @@ class BotPlugin(Plugin):
             self.list[suggestion] += 1
         else:
             self.list[suggestion] = 1
+        self.store.put(suggestion, self.list[suggestion])
         return "Suggestion successfully added!"
 
     def com_remove(self, command):
@@ -37,6 +39,7 @@ class BotPlugin(Plugin):
 
         if suggestion in self.list.keys():
             del self.list[suggestion]
+            self.store.delete(suggestion)
             return "Suggestion successfully removed!"
         return "That suggestion already doesn't exist!"
 
@@ -53,35 +56,14 @@ class BotPlugin(Plugin):
 
     def com_clear(self, command):
         self.list = {}
+        self.store.clear()
         return "Successfully cleared suggestions"
 
-    # Saves all lists
-    def save(self):
-        with open(self.dir + "/lists.file", "wb") as f:
-            pickle.dump(self.lists, f)
-            f.seek(0)
-            f.close()
-
-    # Loads all lists
+    # Loads all suggestions from storage, importing the old lists.file on first run
     def load(self):
-        try:
-            if os.path.getsize(self.dir + "/lists.file") > 0:
-                with open(self.dir + "/lists.file", "rb") as f:
-                    self.lists = pickle.load(f)
-                    f.seek(0)
-                    f.close()
-            print("SuggestionList: List file successfully loaded!")
-        except FileNotFoundError:
-            if not os.path.exists(self.dir):
-                os.makedirs(self.dir)
-
-            # Ensures that the pokebank file is created.
-            with open(self.dir + "/lists.file", "w+") as f:
-                f.write("")
-                f.seek(0)
-                f.close()
-            print("SuggestionList: No List file exists, creating a new one.")
-            self.lists = {}
+        self.store.migrate_pickle(self.dir + "/lists.file", lambda lists: lists.items())
+        self.list = dict(self.store.items())
+        print("SuggestionList: {} suggestions successfully loaded!".format(len(self.list)))
 
     # Run whenever someone on telegram types one of these commands
     def on_command(self, command):
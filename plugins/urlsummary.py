@@ -1,33 +1,55 @@
+import aiohttp
+import asyncio
 import bs4 as bs
-import urllib.request
 import re
 import heapq
 import nltk
 
+from libs.aioplugin import AsyncPluginBridge
 from plugin import Plugin
 
 
 def load(data_dir, bot):
-    return Summary(data_dir, bot)
+    return AsyncPluginBridge(Summary(data_dir, bot), bot)
 
 
 """
 Created by Matthew Klawitter 5/16/2019
 Last Updated: 5/16/2019
-Version: v1.0.0.0
+Version: v1.1.0.0
 """
 
 
 class Summary(Plugin):
+    # Seconds to wait for an article to download
+    TIMEOUT = 30
+    # Most articles downloaded at once
+    MAX_CONNECTIONS = 500
+
     def __init__(self, data_dir, bot):
         self.data_dir = data_dir
         self.bot = bot
+        # Created on the event loop by the first download
+        self.session = None
+
+    async def fetch(self, url):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.MAX_CONNECTIONS),
+                                                 timeout=aiohttp.ClientTimeout(total=self.TIMEOUT))
+
+        async with self.session.get(url) as response:
+            return await response.read()
+
+    async def create_summary(self, command):
+        try:
+            article = await self.fetch(command.args)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return "Summarize: Unable to download that article!"
 
-    def create_summary(self, command):
-        url = command.args
+        # Parsing and scoring is CPU bound, so it runs in the executor rather than on the event loop
+        return await asyncio.get_running_loop().run_in_executor(None, self.summarize, article)
 
-        scraped_article = urllib.request.urlopen(url)
-        article = scraped_article.read()
+    def summarize(self, article):
         parsed_article = bs.BeautifulSoup(article,'lxml')
 
         paragraphs = parsed_article.find_all('p')
@@ -75,9 +97,9 @@ class Summary(Plugin):
         summary = ' '.join(summary_sentences)
         return "Article Summary:\n" + summary
 
-    def on_command(self, command):
+    async def on_command(self, command):
         if command.command == "summary" or command.command == "s":
-            return {"type": "message", "message": self.create_summary(command)}
+            return {"type": "message", "message": await self.create_summary(command)}
 
     def get_commands(self):
         return {"summary", "s"}